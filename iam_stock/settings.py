@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -23,9 +24,10 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-n1a$l2214tl&!hm8ve9$+ca$kgyhe3%^l&a7l19kzc%vn2ja-m'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# (DEBUG also keeps every SQL query in memory, which adds up during long imports.)
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
 
 
 # Application definition
@@ -41,11 +43,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'inventory.middleware.AuditMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -74,13 +78,77 @@ WSGI_APPLICATION = 'iam_stock.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE=sqlite (default) or postgresql, see below for the other DB_* variables.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    # DB_POOL=1 uses Django's connection pool (psycopg[pool], installed with
+    # psycopg[binary,pool] from req.txt); otherwise connections are kept
+    # DB_CONN_MAX_AGE seconds. The two can't be combined.
+    DB_POOL = os.environ.get('DB_POOL', '1') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'iam_stock'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': not DB_POOL,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '20')),
+                    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+                },
+            } if DB_POOL else {},
+        }
+    }
+else:
+    # WAL lets readers run while an import writes; IMMEDIATE transactions take
+    # the write lock up front so that concurrent writers wait for it (up to
+    # the busy timeout) instead of failing with "database is locked".
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                'timeout': int(os.environ.get('DB_TIMEOUT', '20')),
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA cache_size=-64000;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA mmap_size=268435456;'
+                ),
+            },
+        }
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# File based so that the web and process_imports workers share the cached analytics.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
     }
 }
 
+# Seconds before the dashboard counters are recomputed from the database
+INVENTORY_STATS_TIMEOUT = 3600
+
+# Minimum seconds between two recomputations of the analytics while equipment is being written
+INVENTORY_ANALYTICS_REFRESH = 60
+
+# Seconds without progress after which a Running import is taken over by another worker
+INVENTORY_IMPORT_STALE_AFTER = 600
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -118,6 +186,17 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Request, SQL and export metrics served at /metrics (Prometheus text format).
+# Off by default: set DJANGO_METRICS=1 to time the requests and serve the endpoint,
+# which is not authenticated, so keep it reachable by the scraper only.
+
+METRICS_ENABLED = os.environ.get('DJANGO_METRICS', '0') == '1'
+
+# Uploaded files (queued Excel imports)
+
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
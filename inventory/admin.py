@@ -1,7 +1,28 @@
 from django.contrib import admin
-from .models import Record,Equipment
+from .models import ArchivedEquipment,ArchivedRecord,ChangeLog,Record,Equipment,ImportJob
 
 # Register your models here.
 
 admin.site.register(Record)
-admin.site.register(Equipment)
\ No newline at end of file
+admin.site.register(Equipment)
+admin.site.register(ImportJob)
+
+admin.site.register(ArchivedRecord)
+admin.site.register(ArchivedEquipment)
+
+
+@admin.register(ChangeLog)
+class ChangeLogAdmin(admin.ModelAdmin):
+    # The change log is append-only, it can be browsed but not edited
+    list_display = ('created_at', 'kind', 'object_id', 'sn', 'action', 'actor')
+    list_filter = ('kind', 'action')
+    search_fields = ('sn',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,126 @@
+"""Equipment received, delivered and penalized per year and quarter.
+
+The figures come from one grouped aggregate query over the stored
+``year``/``quarter`` columns and are cached until the day changes, since
+penalties depend on today's date. Equipment writes (see :func:`invalidate`,
+called from the stats helpers that every write path already goes through)
+only mark them stale: stale figures are recomputed at most once every
+INVENTORY_ANALYTICS_REFRESH seconds, so that a running import doesn't keep
+the cache cold.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Func, IntegerField, Q, Sum
+from django.utils import timezone
+
+from .models import Equipment, PENALTY_DAYS
+
+CACHE_KEY = 'inventory:analytics:figures'
+STALE_KEY = 'inventory:analytics:stale'
+
+
+class DaysBetween(Func):
+    """Whole days from the ``start`` date to the ``end`` date."""
+    # PostgreSQL: date - date is a number of days.
+    template = '(%(expressions)s)'
+    arg_joiner = ' - '
+    output_field = IntegerField()
+
+    def __init__(self, end, start, **extra):
+        super().__init__(end, start, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(julianday(%(expressions)s) AS INTEGER)',
+                           arg_joiner=') - julianday(', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='DATEDIFF(%(expressions)s)', arg_joiner=', ',
+                           **extra_context)
+
+
+def compute(today=None):
+    """Return the per-quarter rows and the per-year totals."""
+    today = today or timezone.now().date()
+    penalty_start = today - datetime.timedelta(days=PENALTY_DAYS)
+
+    # Grouping by status as well keeps conditional aggregates, which are
+    # evaluated for every row, down to the penalty count.
+    groups = (
+        Equipment.objects.order_by()
+        .annotate(turnaround=DaysBetween('delivery_date', 'reception_date'))
+        .values('year', 'quarter', 'delivery_status')
+        .annotate(
+            count=Count('id'),
+            turnaround_total=Sum('turnaround'),
+            turnaround_count=Count('turnaround'),
+            penalties=Count('id', filter=(
+                Q(delivery_status='Delivered', turnaround__gte=PENALTY_DAYS)
+                | Q(delivery_status='InProgress', reception_date__lte=penalty_start)
+            )),
+        )
+    )
+
+    quarters = {}
+    years = {}
+    for group in groups:
+        for key, totals in (((group['year'], group['quarter']), quarters), ((group['year'],), years)):
+            row = totals.setdefault(key, {
+                'year': group['year'], 'quarter': group['quarter'], 'received': 0, 'delivered': 0,
+                'in_progress': 0, 'turnaround_total': 0, 'turnaround_count': 0, 'penalties': 0,
+            })
+            row['received'] += group['count']
+            row['penalties'] += group['penalties']
+            if group['delivery_status'] == 'Delivered':
+                row['delivered'] += group['count']
+                row['turnaround_total'] += group['turnaround_total'] or 0
+                row['turnaround_count'] += group['turnaround_count']
+            else:
+                row['in_progress'] += group['count']
+
+    # Rows without a reception date come last.
+    def order(key):
+        return [(part is None, part or '') for part in key]
+
+    return {
+        'date': today.isoformat(),
+        'quarters': [_with_average(quarters[key]) for key in sorted(quarters, key=order)],
+        'years': [_with_average(years[key], quarter=False) for key in sorted(years, key=order)],
+    }
+
+
+def _with_average(row, quarter=True):
+    if not quarter:
+        del row['quarter']
+    total = row.pop('turnaround_total') or 0
+    count = row.pop('turnaround_count')
+    row['avg_turnaround_days'] = round(total / count, 1) if count else None
+    return row
+
+
+def get_analytics():
+    """Return the cached figures, computing them if missing, from another day or stale for long enough."""
+    today = timezone.now().date()
+    cached = cache.get_many([CACHE_KEY, STALE_KEY])
+    computed_at, data = cached.get(CACHE_KEY, (None, None))
+    refresh = getattr(settings, 'INVENTORY_ANALYTICS_REFRESH', 60)
+    if data is None or data['date'] != today.isoformat() or (
+            cached.get(STALE_KEY) and time.time() - computed_at >= refresh):
+        # Cleared first, so that a write made while computing marks the new figures stale again
+        cache.delete(STALE_KEY)
+        computed_at = time.time()
+        data = compute(today)
+        cache.set(CACHE_KEY, (computed_at, data), getattr(settings, 'INVENTORY_STATS_TIMEOUT', 3600))
+    return data
+
+
+def invalidate():
+    """Mark the cached figures stale, see :func:`get_analytics`."""
+    cache.set(STALE_KEY, True, None)
+
+
+def invalidate_on_commit():
+    transaction.on_commit(invalidate)
@@ -0,0 +1,484 @@
+"""JSON API for records and equipment.
+
+List endpoints use cursor (keyset) pagination on ``id`` with a configurable
+``page_size``, accept ``?fields=`` to return only some fields and answer
+conditional requests (``If-None-Match``/``If-Modified-Since``) with a 304
+computed from the ids and ``updated_at`` of the requested page only. POST
+and PATCH on the list endpoints accept either one object or an array of
+objects, sent as ``application/json``.
+"""
+import hashlib
+import json
+from collections import Counter, defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+
+from . import analytics, audit, bulk, stats
+from .importer import archived_sns
+from .models import Record, Equipment, sla_deadlines
+from .pagination import InvalidCursor, keyset_paginate
+from .search import search_equipment
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+ORDERING = [('id', False)]
+
+RECORD_FIELDS = [
+    'id', 'name', 'reception_date', 'quarter', 'warning_date', 'penalty_date', 'updated_at',
+    'items_total', 'items_in_progress', 'items_delivered', 'last_delivery_date',
+]
+RECORD_WRITABLE = ['name', 'reception_date']
+
+EQUIPMENT_FIELDS = [
+    'id', 'record', 'name', 'ref', 'sn', 'sn_rempl', 'reception_date', 'delivery_status', 'delivery_date',
+    'bl', 'year', 'quarter', 'order_index', 'updated_at',
+]
+EQUIPMENT_WRITABLE = [
+    'record', 'name', 'ref', 'sn', 'sn_rempl', 'reception_date', 'delivery_status', 'delivery_date', 'bl',
+    'order_index',
+]
+
+
+class APIError(Exception):
+    def __init__(self, payload, status=400):
+        super().__init__(payload)
+        self.payload = payload
+        self.status = status
+
+
+def api_view(methods):
+    """Restrict to ``methods``, skip CSRF (no session auth) and turn APIError into JSON.
+
+    Bodies must be sent as ``application/json``: browsers preflight such
+    cross-site requests, which no CORS header allows, whereas a
+    ``text/plain`` form or fetch would go through without a CSRF token.
+    """
+    def decorator(view):
+        @csrf_exempt
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                response = JsonResponse({'error': f'Method {request.method} not allowed.'}, status=405)
+                response['Allow'] = ', '.join(methods)
+                return response
+            if request.method in ('POST', 'PATCH') and request.content_type != 'application/json':
+                return JsonResponse({'error': 'Content-Type must be application/json.'}, status=415)
+            try:
+                return view(request, *args, **kwargs)
+            except APIError as e:
+                return JsonResponse(e.payload, status=e.status)
+        wrapper.__name__ = view.__name__
+        wrapper.__doc__ = view.__doc__
+        return wrapper
+    return decorator
+
+
+def _body(request):
+    try:
+        return json.loads(request.body)
+    except ValueError:
+        raise APIError({'error': 'Request body must be valid JSON.'})
+
+
+def _items(request):
+    """The JSON body as a list of objects, and whether it was sent as an array."""
+    data = _body(request)
+    many = isinstance(data, list)
+    items = data if many else [data]
+    if not items or not all(isinstance(item, dict) for item in items):
+        raise APIError({'error': 'Expected an object or a non-empty array of objects.'})
+    return items, many
+
+
+# Fields holding the id of an object, looked up with in_bulk() or an IN query
+ID_FIELDS = ('id', 'record')
+
+
+def _integer(value):
+    """``value`` as an id: an int or a string of digits, anything else gives None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+
+def _check_fields(items, writable, required=()):
+    """Check the fields of ``items`` and convert their ids to ints, raising APIError with per-item errors."""
+    errors = {}
+    for i, item in enumerate(items):
+        item_errors = {field: ['Unknown or read-only field.'] for field in item if field not in writable}
+        item_errors.update({field: ['This field is required.'] for field in required if field not in item})
+        for field in ID_FIELDS:
+            if field in item and field not in item_errors:
+                value = _integer(item[field])
+                if value is None:
+                    item_errors[field] = ['A valid integer is required.']
+                else:
+                    item[field] = value
+        if item_errors:
+            errors[i] = item_errors
+    if errors:
+        raise APIError({'errors': errors})
+
+
+def _selected_fields(request, available):
+    fields = request.GET.get('fields')
+    if not fields:
+        return list(available)
+    selected = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in selected if field not in available]
+    if unknown:
+        raise APIError({'error': f'Unknown fields: {", ".join(unknown)}.'})
+    return selected
+
+
+def _page_size(request):
+    try:
+        return max(1, min(int(request.GET.get('page_size', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        raise APIError({'error': 'page_size must be an integer.'})
+
+
+def _not_modified_or(request, etag, last_modified, build):
+    """Return a 304 if the client's copy is current, else ``build()`` with validators."""
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build()
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _list(request, queryset, available):
+    fields = _selected_fields(request, available)
+    page_size = _page_size(request)
+    cursor = request.GET.get('cursor')
+
+    # The validators only cover the requested page: its keyset window is read
+    # from the index and a poll doesn't count the whole filtered set. The
+    # total count is only computed for a full response.
+    try:
+        window = keyset_paginate(queryset.values('id', 'updated_at'), ORDERING, cursor, page_size)
+    except InvalidCursor:
+        raise APIError({'error': 'Invalid cursor.'})
+    ids = [row['id'] for row in window]
+    last_modified = max((row['updated_at'] for row in window), default=None)
+    fingerprint = '|'.join(map(str, [
+        request.get_full_path(), ids[:1], ids[-1:], len(ids), window.has_next, window.has_previous, last_modified,
+    ]))
+    etag = '"%s"' % hashlib.md5(fingerprint.encode()).hexdigest()
+
+    def build():
+        # id is needed to keep the page order, it's dropped again if not asked for.
+        rows = queryset.filter(id__in=ids).order_by('id').values(*dict.fromkeys(['id'] + fields))
+        return JsonResponse({
+            'count': queryset.count(),
+            'next': _page_url(request, window.next_cursor),
+            'previous': _page_url(request, window.previous_cursor),
+            'results': [{field: row[field] for field in fields} for row in rows],
+        })
+
+    return _not_modified_or(request, etag, last_modified, build)
+
+
+def _page_url(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+def _detail(request, instance, available):
+    fields = _selected_fields(request, available)
+    etag = f'"{instance._meta.model_name}-{instance.pk}-{instance.updated_at.timestamp()}"'
+    return _not_modified_or(request, etag, instance.updated_at,
+                            lambda: JsonResponse(_serialize(instance, fields)))
+
+
+def _serialize(instance, fields):
+    return {field: getattr(instance, 'record_id' if field == 'record' else field) for field in fields}
+
+
+def _validation_errors(e):
+    return e.message_dict if hasattr(e, 'error_dict') else {'__all__': e.messages}
+
+
+# Records
+
+def _filter_records(request):
+    records = Record.objects.all()
+    if request.GET.get('quarter'):
+        records = records.filter(quarter=request.GET['quarter'])
+    if request.GET.get('year', '').isdigit():
+        records = records.filter(reception_date__year=request.GET['year'])
+    return records
+
+
+RECORD_SAVED = ['name', 'reception_date', 'quarter', 'warning_date', 'penalty_date', 'updated_at']
+
+
+def _save_records(records):
+    """Validate ``records`` and write them with bulk_create()/bulk_update().
+
+    Raises APIError with {index: errors} for the invalid ones. The fields
+    Record.save() derives, the counters and the change log that its signals
+    keep are handled here, and a new reception date is passed on to the
+    equipment as edit_record does.
+    """
+    errors = {}
+    for i, record in enumerate(records):
+        try:
+            record.full_clean()
+        except ValidationError as e:
+            errors[i] = _validation_errors(e)
+    if errors:
+        raise APIError({'errors': errors})
+
+    now = timezone.now()
+    for record in records:
+        record.quarter = bulk.reception_fields(record.reception_date)['quarter']
+        record.warning_date, record.penalty_date = sla_deadlines(record.reception_date)
+        record.updated_at = now
+    new = [record for record in records if record.pk is None]
+    changed = [record for record in records if record.pk is not None]
+
+    if new:
+        Record.objects.bulk_create(new, batch_size=bulk.BATCH_SIZE)
+        for quarter, count in Counter(record.quarter for record in new).items():
+            stats.add_record(quarter, count)
+        audit.write(audit.created(new))
+    if changed:
+        previous = {
+            row['id']: row for row in
+            Record.objects.filter(pk__in=[record.pk for record in changed]).values('id', 'quarter', *audit.RECORD_FIELDS)
+        }
+        Record.objects.bulk_update(changed, RECORD_SAVED, batch_size=bulk.BATCH_SIZE)
+        moved = defaultdict(list)
+        for record in changed:
+            stats.move_record(previous[record.pk]['quarter'], record.quarter)
+            if record.reception_date != previous[record.pk]['reception_date']:
+                moved[record.reception_date].append(record.pk)
+        audit.write([audit.updated(record, previous[record.pk]) for record in changed])
+        for reception_date, ids in moved.items():
+            bulk.update_queryset(Equipment.objects.filter(record_id__in=ids), {'reception_date': reception_date})
+
+
+def _apply_record(record, item):
+    for field, value in item.items():
+        setattr(record, field, value)
+
+
+@api_view(['GET', 'POST', 'PATCH'])
+def record_collection(request):
+    if request.method == 'GET':
+        return _list(request, _filter_records(request), RECORD_FIELDS)
+
+    items, many = _items(request)
+    if request.method == 'POST':
+        _check_fields(items, RECORD_WRITABLE, required=['name'])
+        records = []
+        for item in items:
+            record = Record()
+            _apply_record(record, item)
+            records.append(record)
+        status = 201
+    else:
+        _check_fields(items, RECORD_WRITABLE + ['id'], required=['id'])
+        existing = Record.objects.in_bulk([item['id'] for item in items])
+        missing = [item['id'] for item in items if item['id'] not in existing]
+        if missing:
+            raise APIError({'error': f'Unknown record ids: {missing}.'}, status=404)
+        records = []
+        for item in items:
+            record = existing[item['id']]
+            _apply_record(record, {field: value for field, value in item.items() if field != 'id'})
+            records.append(record)
+        status = 200
+
+    with transaction.atomic():
+        _save_records(records)
+    data = [_serialize(record, RECORD_FIELDS) for record in records]
+    return JsonResponse(data if many else data[0], status=status, safe=False)
+
+
+@api_view(['GET', 'PATCH', 'DELETE'])
+def record_detail(request, pk):
+    record = get_object_or_404(Record, pk=pk)
+    if request.method == 'GET':
+        return _detail(request, record, RECORD_FIELDS)
+    if request.method == 'DELETE':
+        record.delete()
+        return HttpResponse(status=204)
+
+    item = _body(request)
+    if not isinstance(item, dict):
+        raise APIError({'error': 'Expected an object.'})
+    _check_fields([item], RECORD_WRITABLE)
+    _apply_record(record, item)
+    with transaction.atomic():
+        _save_records([record])
+    return JsonResponse(_serialize(record, RECORD_FIELDS))
+
+
+# Equipment
+
+def _filter_equipment(request):
+    equipment = Equipment.objects.all()
+    if request.GET.get('record', '').isdigit():
+        equipment = equipment.filter(record_id=request.GET['record'])
+    if request.GET.get('sn'):
+        equipment = search_equipment(request.GET['sn'], fields=('sn',), queryset=equipment)
+    if request.GET.get('status'):
+        equipment = equipment.filter(delivery_status=request.GET['status'])
+    if request.GET.get('quarter'):
+        equipment = equipment.filter(quarter=request.GET['quarter'])
+    if request.GET.get('year', '').isdigit():
+        equipment = equipment.filter(year=request.GET['year'])
+    return equipment
+
+
+def _prepare_equipment(equipment_list):
+    """Validate ``equipment_list`` with set-based record and SN checks.
+
+    ``full_clean()`` is run without the per-object foreign key and
+    uniqueness queries, which are replaced by one ``IN`` query each.
+    """
+    errors = {}
+    for i, equipment in enumerate(equipment_list):
+        equipment.sn = equipment.sn or None
+        try:
+            equipment.full_clean(exclude=['record'], validate_unique=False)
+        except ValidationError as e:
+            errors[i] = _validation_errors(e)
+
+    record_ids = {equipment.record_id for equipment in equipment_list}
+    known_records = set(Record.objects.filter(pk__in=record_ids).values_list('pk', flat=True))
+    sns = [equipment.sn for equipment in equipment_list if equipment.sn]
+    ids = [equipment.pk for equipment in equipment_list if equipment.pk]
+    taken = set(Equipment.objects.filter(sn__in=sns).exclude(pk__in=ids).values_list('sn', flat=True))
+    archived = archived_sns(sns)
+    seen = set()
+    for i, equipment in enumerate(equipment_list):
+        if equipment.record_id not in known_records:
+            errors.setdefault(i, {})['record'] = ['Unknown record.']
+        if equipment.sn and (equipment.sn in taken or equipment.sn in seen):
+            errors.setdefault(i, {})['sn'] = ['Equipment with this SN already exists.']
+        elif equipment.sn in archived:
+            errors.setdefault(i, {})['sn'] = ['Equipment with this SN is archived.']
+        seen.add(equipment.sn)
+        # Derived fields, as Equipment.save() would compute them
+        for field, value in bulk.reception_fields(equipment.reception_date).items():
+            setattr(equipment, field, value)
+    if errors:
+        raise APIError({'errors': errors})
+
+
+def _apply_equipment(equipment, item):
+    for field, value in item.items():
+        setattr(equipment, 'record_id' if field == 'record' else field, value)
+
+
+def _create_equipment(items):
+    _check_fields(items, EQUIPMENT_WRITABLE, required=['record', 'name', 'order_index'])
+    equipment_list = []
+    for item in items:
+        equipment = Equipment()
+        _apply_equipment(equipment, item)
+        equipment_list.append(equipment)
+    _prepare_equipment(equipment_list)
+    Equipment.objects.bulk_create(equipment_list, batch_size=bulk.BATCH_SIZE)
+    # bulk_create() sends no signals, keep the rollups, dashboard counters and change log in step.
+    bulk.refresh_rollups({equipment.record_id for equipment in equipment_list})
+    created = Counter((equipment.quarter, equipment.delivery_status) for equipment in equipment_list)
+    for (quarter, status), count in created.items():
+        stats.add_equipment(quarter, status, count)
+    audit.write(audit.created(equipment_list))
+    return equipment_list
+
+
+def _update_equipment(items):
+    existing = Equipment.objects.in_bulk([item['id'] for item in items])
+    missing = [item['id'] for item in items if item['id'] not in existing]
+    if missing:
+        raise APIError({'error': f'Unknown equipment ids: {missing}.'}, status=404)
+    equipment_list = []
+    fields = set()
+    record_ids = set()
+    previous = {}
+    moves = []
+    for item in items:
+        equipment = existing[item['id']]
+        record_ids.add(equipment.record_id)
+        previous[equipment.pk] = audit.values(equipment, audit.EQUIPMENT_FIELDS)
+        moves.append((equipment.quarter, equipment.delivery_status))
+        changes = {field: value for field, value in item.items() if field != 'id'}
+        _apply_equipment(equipment, changes)
+        fields.update(changes)
+        equipment_list.append(equipment)
+    _prepare_equipment(equipment_list)
+    fields.update(['year', 'quarter', 'updated_at'])
+    now = timezone.now()
+    for equipment in equipment_list:
+        equipment.updated_at = now
+    Equipment.objects.bulk_update(equipment_list, sorted(fields), batch_size=bulk.BATCH_SIZE)
+    if fields & {'record', 'delivery_status', 'delivery_date'}:
+        bulk.refresh_rollups(record_ids | {equipment.record_id for equipment in equipment_list})
+    audit.write([audit.updated(equipment, previous[equipment.pk]) for equipment in equipment_list])
+    stats.move_equipment_many(
+        (*old, equipment.quarter, equipment.delivery_status) for old, equipment in zip(moves, equipment_list)
+    )
+    # Turnaround also depends on the dates, which the counters don't track
+    analytics.invalidate_on_commit()
+    return equipment_list
+
+
+@api_view(['GET', 'POST', 'PATCH'])
+def equipment_collection(request):
+    if request.method == 'GET':
+        return _list(request, _filter_equipment(request), EQUIPMENT_FIELDS)
+
+    items, many = _items(request)
+    try:
+        with transaction.atomic():
+            if request.method == 'POST':
+                equipment_list = _create_equipment(items)
+            else:
+                _check_fields(items, EQUIPMENT_WRITABLE + ['id'], required=['id'])
+                equipment_list = _update_equipment(items)
+    except IntegrityError as e:
+        raise APIError({'error': str(e)}, status=409)
+    data = [_serialize(equipment, EQUIPMENT_FIELDS) for equipment in equipment_list]
+    return JsonResponse(data if many else data[0], status=201 if request.method == 'POST' else 200, safe=False)
+
+
+@api_view(['GET', 'PATCH', 'DELETE'])
+def equipment_detail(request, pk):
+    equipment = get_object_or_404(Equipment, pk=pk)
+    if request.method == 'GET':
+        return _detail(request, equipment, EQUIPMENT_FIELDS)
+    if request.method == 'DELETE':
+        equipment.delete()
+        return HttpResponse(status=204)
+
+    item = _body(request)
+    if not isinstance(item, dict):
+        raise APIError({'error': 'Expected an object.'})
+    _check_fields([item], EQUIPMENT_WRITABLE)
+    try:
+        with transaction.atomic():
+            equipment, = _update_equipment([dict(item, id=equipment.pk)])
+    except IntegrityError as e:
+        raise APIError({'error': str(e)}, status=409)
+    return JsonResponse(_serialize(equipment, EQUIPMENT_FIELDS))
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def install_search(sender, using, **kwargs):
+    from .search import install
+
+    install(using)
 
 
 class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventory'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        post_migrate.connect(install_search, sender=self)
+
+        from . import metrics
+
+        if metrics.enabled():
+            connection_created.connect(metrics.install_query_counter)
@@ -0,0 +1,148 @@
+"""Archival of closed records and their equipment.
+
+A record is closed once none of its equipment is InProgress, as read by
+``Record.status`` from the stored rollups. Closed records whose last
+delivery (or reception, if nothing was delivered) is older than a given date
+are moved with their equipment to the ArchivedRecord/ArchivedEquipment
+tables, one batch of records per transaction, so that the lists, counts and
+SN searches of the live tables only go through current work.
+
+The archive keeps the ids, so :func:`restore` puts a record back as it was.
+Archived SNs still count as taken for the importer, through the unique index
+on ``ArchivedEquipment.sn``.
+"""
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import audit, stats
+from .bulk import refresh_rollups
+from .models import ArchivedEquipment, ArchivedRecord, ChangeLog, Equipment, Record, sla_deadlines
+
+BATCH_SIZE = 500
+
+RECORD_FIELDS = ('id', 'name', 'reception_date', 'quarter')
+EQUIPMENT_FIELDS = (
+    'id', 'record_id', 'name', 'ref', 'sn', 'sn_rempl', 'reception_date', 'delivery_status', 'delivery_date', 'bl',
+    'year', 'quarter', 'order_index', 'updated_at',
+)
+
+
+def archivable(before):
+    """Closed records with no delivery or reception since ``before``."""
+    return Record.objects.filter(items_in_progress=0).annotate(
+        last_activity=Coalesce('last_delivery_date', 'reception_date'),
+    ).filter(last_activity__lt=before)
+
+
+def _in(column, ids):
+    return '{} IN ({})'.format(connection.ops.quote_name(column), ', '.join(['%s'] * len(ids)))
+
+
+def _copy(source, target, fields, column, ids, **values):
+    """``INSERT INTO target SELECT ... FROM source`` of the rows whose ``column`` is in ``ids``.
+
+    The rows never go through Python: bulk_create() spent most of the time
+    preparing their values. ``values`` are constants for the target columns
+    that the source doesn't have.
+    """
+    quote = connection.ops.quote_name
+    columns = [target._meta.get_field(field).column for field in fields]
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT INTO {} ({}) SELECT {} FROM {} WHERE {}'.format(
+            quote(target._meta.db_table),
+            ', '.join(quote(name) for name in [*columns, *values]),
+            ', '.join([*(quote(source._meta.get_field(field).column) for field in fields), *['%s'] * len(values)]),
+            quote(source._meta.db_table),
+            _in(column, ids),
+        ), [*values.values(), *ids])
+
+
+def _delete(model, column, ids):
+    # A plain DELETE: QuerySet.delete() would load every object to send its
+    # signals, whose counters and change log entries are handled per batch here.
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)} WHERE {_in(column, ids)}', ids)
+
+
+def archive_batch(record_ids):
+    """Move the records ``record_ids`` that are still closed and their equipment to the archive.
+
+    Returns the number of records and equipment moved.
+    """
+    with transaction.atomic():
+        ids = list(Record.objects.filter(pk__in=record_ids, items_in_progress=0).values_list('id', flat=True))
+        if not ids:
+            return 0, 0
+        equipment = list(Equipment.objects.filter(record_id__in=ids).values_list('id', 'sn'))
+        archived_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        _copy(Record, ArchivedRecord, (*RECORD_FIELDS, 'items_total', 'last_delivery_date'), 'id', ids,
+              archived_at=archived_at)
+        _copy(Equipment, ArchivedEquipment, EQUIPMENT_FIELDS, 'record_id', ids)
+        _delete(Equipment, 'record_id', ids)
+        _delete(Record, 'id', ids)
+        audit.write(
+            [audit.entry(ChangeLog.RECORD, pk, ChangeLog.ARCHIVED, {}) for pk in ids]
+            + [audit.entry(ChangeLog.EQUIPMENT, pk, ChangeLog.ARCHIVED, {}, sn=sn) for pk, sn in equipment]
+        )
+        stats.invalidate_on_commit()
+    return len(ids), len(equipment)
+
+
+def archive_records(before, batch_size=BATCH_SIZE, progress=None):
+    """Archive every record :func:`archivable` before ``before``, ``batch_size`` records per transaction.
+
+    ``progress`` is called with the running totals after each batch.
+    """
+    records = equipment = 0
+    last_id = 0
+    while True:
+        ids = list(archivable(before).filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return records, equipment
+        moved = archive_batch(ids)
+        records += moved[0]
+        equipment += moved[1]
+        last_id = ids[-1]
+        if progress:
+            progress(records, equipment)
+
+
+def restore(record_id):
+    """Move an archived record and its equipment back to the live tables.
+
+    Raises ValueError if one of its SNs has been taken by live equipment since.
+    """
+    with transaction.atomic():
+        archived = ArchivedRecord.objects.get(pk=record_id)
+        equipment = list(archived.equipment.order_by('order_index').values(*EQUIPMENT_FIELDS))
+        sns = [item['sn'] for item in equipment if item['sn']]
+        taken = sorted(Equipment.objects.filter(sn__in=sns).values_list('sn', flat=True)) if sns else []
+        if taken:
+            raise ValueError(f'SNs already used by current equipment: {", ".join(taken[:20])}')
+        warning_date, penalty_date = sla_deadlines(archived.reception_date)
+        Record.objects.bulk_create([Record(
+            **{field: getattr(archived, field) for field in RECORD_FIELDS},
+            warning_date=warning_date, penalty_date=penalty_date,
+        )])
+        Equipment.objects.bulk_create([Equipment(**item) for item in equipment], batch_size=BATCH_SIZE)
+        refresh_rollups([record_id])
+        archived.delete()
+        audit.write(
+            [audit.entry(ChangeLog.RECORD, record_id, ChangeLog.RESTORED, {})]
+            + [audit.entry(ChangeLog.EQUIPMENT, item['id'], ChangeLog.RESTORED, {}, sn=item['sn']) for item in equipment]
+        )
+        stats.invalidate_on_commit()
+    return archived
+
+
+def search(query):
+    """Archived records whose name or one of whose SNs starts with ``query`` (case-sensitive)."""
+    # Ranges rather than LIKE, so that both lookups are served by their index
+    def prefix(field):
+        return Q(**{f'{field}__gte': query, f'{field}__lt': query + '\U0010ffff'})
+
+    return ArchivedRecord.objects.filter(
+        prefix('name') | Q(pk__in=ArchivedEquipment.objects.filter(prefix('sn')).values('record_id'))
+    )
@@ -0,0 +1,171 @@
+"""Append-only change log of records and equipment.
+
+Every write path adds one ChangeLog row per object it touches, holding the
+fields that changed as ``{field: [old, new]}`` JSON. Single saves are logged
+by the signals; the bulk paths (import, bulk updates, API arrays, delivery
+sheets) build their entries from the rows they already read and write them
+with one ``executemany`` per batch, inside the same transaction as the change.
+
+The entries carry the equipment SN, so that the history of an SN is one
+lookup on ``(sn, id)`` followed by one on ``(kind, object_id, id)``, however
+large the table grows. Old entries are moved to gzipped JSON lines files by
+the archive_changelog command.
+"""
+import datetime
+import json
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils import timezone
+
+from .models import ArchivedEquipment, ChangeLog, Equipment
+
+BATCH_SIZE = 1000
+
+EQUIPMENT_FIELDS = (
+    'record_id', 'name', 'ref', 'sn', 'sn_rempl', 'reception_date', 'delivery_status', 'delivery_date', 'bl',
+)
+RECORD_FIELDS = ('name', 'reception_date')
+
+# A ChangeLog row to be written by write()
+Entry = namedtuple('Entry', 'kind object_id action changes sn actor')
+
+_request = ContextVar('inventory_audit_request', default=None)
+_actor = ContextVar('inventory_audit_actor', default=None)
+
+
+def start_request(request):
+    """Attribute the changes made while handling ``request`` to its user; pass the token to end_request()."""
+    return _request.set(request)
+
+
+def end_request(token):
+    _request.reset(token)
+
+
+@contextmanager
+def acting_as(actor):
+    """Attribute the changes made in the block to ``actor``, e.g. an import job."""
+    token = _actor.set(actor)
+    try:
+        yield
+    finally:
+        _actor.reset(token)
+
+
+def current_actor():
+    actor = _actor.get()
+    if actor is not None:
+        return actor
+    # The user is only looked up when something is written.
+    user = getattr(_request.get(), 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.get_username()
+    return ''
+
+
+def _value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _key(value):
+    # Views assign raw form strings, '' and None, '3' and 3 are the same value.
+    value = _value(value)
+    return None if value in (None, '') else str(value)
+
+
+def diff(before, after, fields):
+    """{field: [old, new]} of the ``fields`` that differ between the two dicts."""
+    changes = {}
+    for field in fields:
+        old, new = before.get(field), after.get(field)
+        if _key(old) != _key(new):
+            changes[field.removesuffix('_id')] = [_value(old), _value(new)]
+    return changes
+
+
+def values(instance, fields):
+    return {field: getattr(instance, field) for field in fields}
+
+
+def entry(kind, object_id, action, changes, sn=None, actor=None):
+    return Entry(kind, object_id, action, changes, sn or None, current_actor() if actor is None else actor)
+
+
+def write(entries):
+    """Insert ``entries``, leaving out the updates that changed nothing.
+
+    An import logs every row it creates, so the entries are inserted with a
+    plain ``executemany``: bulk_create() would prepare every value through
+    its field and, on SQLite, split the INSERT every 999 parameters.
+    """
+    entries = [item for item in entries if item.action != ChangeLog.UPDATED or item.changes]
+    if not entries:
+        return 0
+    created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    columns = ('kind', 'object_id', 'action', 'changes', 'sn', 'actor', 'created_at')
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(ChangeLog._meta.db_table),
+        ', '.join(connection.ops.quote_name(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(entries), BATCH_SIZE):
+            cursor.executemany(sql, [
+                (*item[:3], json.dumps(item.changes, cls=DjangoJSONEncoder), *item[4:], created_at)
+                for item in entries[start:start + BATCH_SIZE]
+            ])
+    return len(entries)
+
+
+def _describe(instance):
+    if isinstance(instance, Equipment):
+        return ChangeLog.EQUIPMENT, EQUIPMENT_FIELDS, instance.sn
+    return ChangeLog.RECORD, RECORD_FIELDS, None
+
+
+def created(instances):
+    """Entries of newly inserted records or equipment."""
+    entries = []
+    actor = current_actor()
+    for instance in instances:
+        kind, fields, sn = _describe(instance)
+        entries.append(entry(kind, instance.pk, ChangeLog.CREATED, diff({}, values(instance, fields), fields),
+                             sn=sn, actor=actor))
+    return entries
+
+
+def updated(instance, previous):
+    """Entry of a saved record or equipment whose stored values were ``previous``."""
+    kind, fields, sn = _describe(instance)
+    return entry(kind, instance.pk, ChangeLog.UPDATED, diff(previous, values(instance, fields), fields), sn=sn)
+
+
+def deleted(instance):
+    kind, fields, sn = _describe(instance)
+    return entry(kind, instance.pk, ChangeLog.DELETED, diff(values(instance, fields), {}, fields), sn=sn)
+
+
+def equipment_updated(rows, new_values):
+    """Entries of the equipment ``rows`` (dicts of id, sn and the old values) set to ``new_values``."""
+    fields = [field for field in EQUIPMENT_FIELDS if field in new_values]
+    actor = current_actor()
+    return [
+        entry(ChangeLog.EQUIPMENT, row['id'], ChangeLog.UPDATED, diff(row, new_values, fields),
+              sn=new_values.get('sn', row['sn']), actor=actor)
+        for row in rows
+    ]
+
+
+def history(sn, limit=None):
+    """Entries of the equipment that has or had ``sn``, newest first."""
+    ids = set(ChangeLog.objects.filter(kind=ChangeLog.EQUIPMENT, sn=sn).values_list('object_id', flat=True))
+    ids.update(Equipment.objects.filter(sn=sn).values_list('id', flat=True))
+    ids.update(ArchivedEquipment.objects.filter(sn=sn).values_list('id', flat=True))
+    entries = ChangeLog.objects.filter(kind=ChangeLog.EQUIPMENT, object_id__in=ids).order_by('-id')
+    return entries[:limit] if limit else entries
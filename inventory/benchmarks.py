@@ -0,0 +1,286 @@
+"""Helpers shared by the ``bench_*`` management commands."""
+import resource
+import sys
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB everywhere else.
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# Equipment designations and how common they are.
+DESIGNATIONS = {'Router': 40, 'Switch': 25, 'Access Point': 15, 'Firewall': 8, 'Modem': 7, 'ONT': 5}
+
+# Share of equipment delivered, by age of the record at the time of seeding.
+DELIVERED_SHARE = ((30, 0.15), (91, 0.5), (None, 0.9))
+
+REPLACED_SHARE = 0.03
+
+
+def serial_number(i, rng):
+    """A unique SN for index ``i`` in one of the vendor formats seen in the uploads."""
+    kind = i % 4
+    if kind == 0:
+        return f"{rng.choice(['FOC', 'FCZ', 'JAE', 'FDO'])}{i:08X}"  # Cisco style
+    if kind == 1:
+        return f'2102{i:017d}'  # Huawei style, 21 digits
+    if kind == 2:
+        return f"{rng.choice(['00E0FC', '5C5015', 'A4C3F0'])}{i:06X}"  # MAC address
+    return f'S{i:09d}'
+
+
+def sample_rows(rows, records=50, seed=0, offset=0):
+    """Yield ``rows`` upload rows (Dossier, Design., Ref, SN, SN Rempl).
+
+    Records get skewed sizes, a few rows have a replacement SN and SNs start
+    at index ``offset`` so that they don't collide with a seeded dataset.
+    """
+    import random
+
+    rng = random.Random(seed)
+    names, weights = zip(*DESIGNATIONS.items())
+    for i in range(offset, offset + rows):
+        sn = serial_number(i, rng)
+        yield [
+            f'DOSSIER-{int(records * rng.random() ** 2):05d}',
+            rng.choices(names, weights)[0],
+            f'REF-{rng.randrange(200):03d}',
+            sn,
+            f'R{sn}' if rng.random() < REPLACED_SHARE else None,
+        ]
+
+
+def write_sample_sheet(path, rows, records=50, seed=0, offset=0):
+    """Write an ``.xlsx`` in the upload layout with ``rows`` equipment lines."""
+    from .spreadsheets import write_sheet
+
+    write_sheet(path, ['Dossier', 'Design.', 'Ref', 'SN', 'SN Rempl'], sample_rows(rows, records, seed, offset))
+
+
+def generate_dataset(records, equipment, seed=0, days=730, batch_size=5000, sn_offset=0):
+    """Insert ``records`` Records and ``equipment`` Equipment with realistic distributions.
+
+    Reception dates are spread over the last ``days`` days (so over several
+    quarters), record sizes are skewed, and older records are mostly
+    delivered. Derived fields and rollups are filled in as ``save()`` and the
+    signals would. SNs start at index ``sn_offset``. Returns the ids of the
+    created records.
+    """
+    import datetime
+    import random
+
+    from django.utils import timezone
+
+    from .bulk import reception_fields, refresh_rollups
+    from .models import Equipment, Record, sla_deadlines
+
+    rng = random.Random(seed)
+    today = timezone.now().date()
+    record_ids = []
+    reception_dates = []
+    for offset in range(0, records, batch_size):
+        batch = []
+        for i in range(offset, min(offset + batch_size, records)):
+            reception_date = today - datetime.timedelta(days=rng.randrange(days))
+            warning_date, penalty_date = sla_deadlines(reception_date)
+            batch.append(Record(
+                name=f'DOSSIER-{i:05d}', reception_date=reception_date,
+                quarter=reception_fields(reception_date)['quarter'],
+                warning_date=warning_date, penalty_date=penalty_date,
+            ))
+            reception_dates.append(reception_date)
+        record_ids.extend(record.pk for record in Record.objects.bulk_create(batch))
+
+    names, weights = zip(*DESIGNATIONS.items())
+    order = [0] * records
+    for offset in range(0, equipment, batch_size):
+        batch = []
+        for i in range(offset, min(offset + batch_size, equipment)):
+            index = int(records * rng.random() ** 2)  # A few large records, many small ones
+            order[index] += 1
+            reception_date = reception_dates[index]
+            age = (today - reception_date).days
+            share = next(share for limit, share in DELIVERED_SHARE if limit is None or age < limit)
+            delivered = rng.random() < share
+            sn = serial_number(sn_offset + i, rng)
+            batch.append(Equipment(
+                record_id=record_ids[index],
+                name=rng.choices(names, weights)[0],
+                ref=f'REF-{rng.randrange(200):03d}',
+                sn=sn,
+                sn_rempl=f'R{sn}' if rng.random() < REPLACED_SHARE else None,
+                delivery_status='Delivered' if delivered else 'InProgress',
+                delivery_date=reception_date + datetime.timedelta(days=rng.randint(0, age)) if delivered else None,
+                bl='yes' if delivered and rng.random() < 0.7 else 'no',
+                order_index=order[index],
+                **reception_fields(reception_date),
+            ))
+        Equipment.objects.bulk_create(batch)
+    refresh_rollups(record_ids)
+    return record_ids
+
+
+def seed(records, equipment, batch_size=5000):
+    """Bulk insert ``records`` Records sharing ``equipment`` Equipment rows."""
+    import datetime
+
+    from .bulk import refresh_rollups
+    from .models import Equipment, Record
+
+    start = datetime.date(2022, 1, 1)
+    record_ids = []
+    for offset in range(0, records, batch_size):
+        batch = [
+            Record(name=f'SEED-{i:07d}', reception_date=start + datetime.timedelta(days=i % 1000))
+            for i in range(offset, min(offset + batch_size, records))
+        ]
+        record_ids.extend(record.pk for record in Record.objects.bulk_create(batch))
+
+    for offset in range(0, equipment, batch_size):
+        Equipment.objects.bulk_create([
+            Equipment(
+                record_id=record_ids[i % records],
+                name='Router',
+                sn=f'SEED{i:010d}',
+                delivery_status='Delivered' if i % 4 else 'InProgress',
+                order_index=i // records,
+            )
+            for i in range(offset, min(offset + batch_size, equipment))
+        ])
+    refresh_rollups(record_ids)
+    return record_ids
+
+
+def percentile(values, percent):
+    """``percent`` percentile of the sorted list ``values`` (nearest rank)."""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def load_test(url, concurrency=16, duration=10.0, timeout=30.0):
+    """Hit ``url`` from ``concurrency`` threads for ``duration`` seconds.
+
+    Each thread keeps its own HTTP/1.1 connection open and reads every
+    response to the end, so streamed exports are timed until the last byte.
+    Returns requests/sec and latency percentiles in milliseconds.
+    """
+    import http.client
+    import threading
+    import time
+    from urllib.parse import urlsplit
+
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        connection = connection_class(parts.netloc, timeout=timeout)
+        own_latencies = []
+        own_errors = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    own_errors += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                own_errors += 1
+                connection.close()
+                connection = connection_class(parts.netloc, timeout=timeout)
+                continue
+            own_latencies.append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            errors.append(own_errors)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+    }
+
+
+# Modules that only the spreadsheet paths should load, see inventory.spreadsheets.
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl', 'xlsxwriter')
+
+# Run by measure_boot() in a fresh interpreter, prints one JSON object.
+BOOT_SCRIPT = '''
+import io, json, sys, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+application = get_wsgi_application()
+get_resolver().url_patterns  # Imports the views, as the first request would
+boot = time.perf_counter() - start
+
+from django.conf import settings
+from inventory.benchmarks import HEAVY_MODULES, peak_rss_mb
+rss = peak_rss_mb()
+loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+host = next((host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')), 'localhost')
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': sys.argv[2], 'SERVER_NAME': host,
+    'SERVER_PORT': '80', 'HTTP_HOST': host, 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+    'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0), 'wsgi.multithread': False,
+    'wsgi.multiprocess': True, 'wsgi.run_once': False,
+}
+statuses = []
+start = time.perf_counter()
+body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+b''.join(body)
+first_request = time.perf_counter() - start
+print(json.dumps({
+    'boot_ms': round(boot * 1000, 1), 'first_request_ms': round(first_request * 1000, 1),
+    'status': statuses[0].split()[0], 'rss_after_boot_mb': round(rss, 1),
+    'rss_after_request_mb': round(peak_rss_mb(), 1), 'heavy_modules_after_boot': loaded,
+}))
+'''
+
+
+def measure_boot(path='/', cwd=None):
+    """Boot the project in a new interpreter and serve ``path`` once; return the timings and RSS."""
+    import json
+    import subprocess
+    from urllib.parse import urlsplit
+
+    url = urlsplit(path)
+    output = subprocess.run(
+        [sys.executable, '-c', BOOT_SCRIPT, url.path or '/', url.query],
+        cwd=cwd, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def time_command(args, cwd=None):
+    """Wall time of a command in milliseconds, e.g. ``manage.py check``."""
+    import subprocess
+    import time
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=cwd, capture_output=True, check=True)
+    return round((time.perf_counter() - start) * 1000, 1)
@@ -0,0 +1,132 @@
+"""Set-based updates of many equipment rows at once.
+
+``QuerySet.update()`` bypasses ``Equipment.save()``, so the helpers here
+recompute the derived ``year``/``quarter`` themselves whenever the
+reception date changes, bump ``updated_at``, refresh the rollups of the
+records involved, log the changes and move the dashboard counters by the
+status and quarter changes of the rows they update.
+"""
+from django.utils import timezone
+
+from . import analytics, audit, stats
+from .models import Equipment, Record
+
+BATCH_SIZE = 500
+
+# Fields the bulk actions may set.
+BULK_FIELDS = ('delivery_status', 'delivery_date', 'bl', 'record', 'reception_date')
+
+# Columns the Record rollups are computed from.
+ROLLUP_SOURCES = ('delivery_status', 'delivery_date', 'record_id')
+
+
+def reception_fields(reception_date):
+    """Values of reception_date and of the fields Equipment.save() derives from it."""
+    if reception_date:
+        quarter_mapping = {1: 'Q1', 2: 'Q2', 3: 'Q3', 4: 'Q4'}
+        return {
+            'reception_date': reception_date,
+            'year': reception_date.year,
+            'quarter': quarter_mapping[(reception_date.month - 1) // 3 + 1],
+        }
+    return {'reception_date': None, 'year': None, 'quarter': None}
+
+
+def prepare_changes(changes):
+    """Turn user-facing ``changes`` into the column values to UPDATE.
+
+    Reassigning to another record also moves the equipment to the record's
+    reception date, as edit_record does for the equipment of a record.
+    """
+    unknown = set(changes) - set(BULK_FIELDS)
+    if unknown:
+        raise ValueError(f'Cannot bulk update {", ".join(sorted(unknown))}.')
+    values = dict(changes)
+    record = values.pop('record', None)
+    if record is not None:
+        values['record_id'] = record.pk
+        # A record without a date leaves the equipment's own date (and year/quarter) alone
+        if record.reception_date:
+            values['reception_date'] = record.reception_date
+    if 'reception_date' in values:
+        values.update(reception_fields(values['reception_date']))
+    # auto_now isn't applied by update()
+    values['updated_at'] = timezone.now()
+    return values
+
+
+def _chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def refresh_rollups(record_ids):
+    """Recompute the rollups of ``record_ids`` with one UPDATE per batch."""
+    for chunk in _chunks(set(record_ids) - {None}):
+        Record.objects.filter(pk__in=chunk).refresh_rollups()
+
+
+def _update(queryset, values):
+    """UPDATE ``queryset``, refresh the rollups of the records it moves between or changes and log the changes."""
+    audited = [field for field in audit.EQUIPMENT_FIELDS if field in values]
+    # The old values are read with the same query that finds the records involved.
+    rows = list(queryset.order_by().values(
+        *dict.fromkeys(['id', 'sn', 'record_id', 'quarter', 'delivery_status', *audited])
+    ))
+    updated = queryset.update(**values)
+    if updated:
+        if any(field in values for field in ROLLUP_SOURCES):
+            refresh_rollups({row['record_id'] for row in rows} | {values.get('record_id')})
+        audit.write(audit.equipment_updated(rows, values))
+        stats.move_equipment_many(
+            (row['quarter'], row['delivery_status'],
+             values.get('quarter', row['quarter']), values.get('delivery_status', row['delivery_status']))
+            for row in rows
+        )
+        # Turnaround also depends on the dates, which the counters don't track
+        analytics.invalidate_on_commit()
+    return updated
+
+
+def update_queryset(queryset, changes):
+    """Apply ``changes`` to every equipment of ``queryset``, ``BATCH_SIZE`` rows at a time in id order.
+
+    The old values read for the change log are only held for one batch, so a
+    filter matching most of the table doesn't load it all at once.
+    """
+    values = prepare_changes(changes)
+    updated = 0
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            break
+        updated += _update(Equipment.objects.filter(id__in=ids), values)
+        last_id = ids[-1]
+    return updated
+
+
+def update_ids(ids, changes):
+    """Apply ``changes`` with one ``UPDATE ... WHERE id IN`` per batch."""
+    values = prepare_changes(changes)
+    updated = 0
+    for chunk in _chunks(set(ids)):
+        updated += _update(Equipment.objects.filter(id__in=chunk), values)
+    return updated
+
+
+def update_sns(sns, changes):
+    """Apply ``changes`` with one ``UPDATE ... WHERE sn IN`` per batch.
+
+    Returns the number of updated rows and the SNs that matched nothing.
+    """
+    values = prepare_changes(changes)
+    updated = 0
+    missing = []
+    for chunk in _chunks(dict.fromkeys(sn for sn in sns if sn)):
+        found = set(Equipment.objects.filter(sn__in=chunk).values_list('sn', flat=True))
+        missing.extend(sn for sn in chunk if sn not in found)
+        if found:
+            updated += _update(Equipment.objects.filter(sn__in=found), values)
+    return updated, missing
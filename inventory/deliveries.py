@@ -0,0 +1,155 @@
+"""Reconciliation of the carriers' delivery sheets with the equipment.
+
+Every SN of the sheet is resolved through a single SN/SN Rempl -> equipment
+map fetched up front with batched ``IN`` queries, then the matched
+equipment are marked Delivered with one UPDATE per delivery date and BL.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import bulk
+from .importer import clean_value, read_rows
+from .models import Equipment
+
+BATCH_SIZE = 1000
+
+COLUMNS = {
+    'SN': 'sn',
+    'Delivery Date': 'delivery_date',
+    'BL': 'bl',
+}
+
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d %H:%M:%S']
+BL_VALUES = {'yes': 'yes', 'y': 'yes', 'oui': 'yes', '1': 'yes', 'no': 'no', 'n': 'no', 'non': 'no', '0': 'no'}
+
+# Only the first rows of each kind are kept for display, all are counted.
+MAX_REPORTED = 100
+
+
+def clean_cell(value):
+    """Keep dates as they are, normalize everything else like the importer does."""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value
+    return clean_value(value)
+
+
+def parse_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def read_delivery_rows(excel_file):
+    return read_rows(excel_file, columns=COLUMNS, clean=clean_cell)
+
+
+def _keep(items, item):
+    if len(items) < MAX_REPORTED:
+        items.append(item)
+
+
+class ReconciliationResult:
+    def __init__(self):
+        self.rows = 0
+        self.matched = 0
+        self.updated = 0
+        self.unmatched_count = 0
+        self.conflict_count = 0
+        self.invalid_count = 0
+        self.unmatched = []
+        self.conflicts = []
+        self.invalid = []
+
+    def reject(self, row, message):
+        self.invalid_count += 1
+        _keep(self.invalid, f'Row {row}: {message}')
+
+    def unmatch(self, sn):
+        self.unmatched_count += 1
+        _keep(self.unmatched, sn)
+
+    def conflict(self, row, sn, message):
+        self.conflict_count += 1
+        _keep(self.conflicts, f'Row {row}: SN {sn} {message}')
+
+
+def _equipment_map(sns):
+    """Map every SN and SN Rempl of ``sns`` to the matching equipment rows."""
+    by_sn = {}
+    by_sn_rempl = defaultdict(list)
+    sns = list(sns)
+    for start in range(0, len(sns), BATCH_SIZE):
+        chunk = sns[start:start + BATCH_SIZE]
+        rows = Equipment.objects.filter(Q(sn__in=chunk) | Q(sn_rempl__in=chunk)).values_list(
+            'id', 'sn', 'sn_rempl', 'delivery_status', 'delivery_date'
+        )
+        for equipment in rows:
+            by_sn[equipment[1]] = equipment
+            if equipment[2]:
+                by_sn_rempl[equipment[2]].append(equipment)
+    return by_sn, by_sn_rempl
+
+
+def reconcile_deliveries(rows):
+    """Mark the equipment listed in the delivery ``rows`` as Delivered."""
+    result = ReconciliationResult()
+
+    # One entry per SN: (row number, delivery date, bl)
+    deliveries = {}
+    for index, row in rows:
+        result.rows += 1
+        sn = row['sn']
+        delivery_date = parse_date(row['delivery_date']) if row['delivery_date'] else None
+        bl = BL_VALUES.get((row['bl'] or 'yes').strip().lower())
+        if not sn or delivery_date is None or bl is None:
+            result.reject(index + 1, 'missing SN, invalid delivery date or BL.')
+            continue
+        if sn in deliveries:
+            if deliveries[sn] is not None and deliveries[sn][1:] != (delivery_date, bl):
+                result.conflict(deliveries[sn][0], sn, 'is listed several times with different deliveries.')
+                deliveries[sn] = None
+            continue
+        deliveries[sn] = (index + 1, delivery_date, bl)
+
+    by_sn, by_sn_rempl = _equipment_map(deliveries)
+
+    groups = defaultdict(list)
+    for sn, delivery in deliveries.items():
+        if delivery is None:
+            continue
+        row, delivery_date, bl = delivery
+        if sn in by_sn:
+            equipment = by_sn[sn]
+        elif len(by_sn_rempl.get(sn, ())) == 1:
+            equipment = by_sn_rempl[sn][0]
+        elif sn in by_sn_rempl:
+            result.conflict(row, sn, 'matches the SN Rempl of several equipment.')
+            continue
+        else:
+            result.unmatch(sn)
+            continue
+        equipment_id, _, _, status, current_date = equipment
+        if status == 'Delivered' and current_date and current_date != delivery_date:
+            result.conflict(row, sn, f'was already delivered on {current_date}.')
+            continue
+        result.matched += 1
+        groups[(delivery_date, bl)].append(equipment_id)
+
+    with transaction.atomic():
+        for (delivery_date, bl), ids in groups.items():
+            result.updated += bulk.update_ids(ids, {
+                'delivery_status': 'Delivered',
+                'delivery_date': delivery_date,
+                'bl': bl,
+            })
+    return result
@@ -0,0 +1,152 @@
+"""Streaming XLSX/CSV exports of equipment.
+
+Rows are read with ``QuerySet.iterator()`` and written one at a time, the
+XLSX through xlsxwriter's ``constant_memory`` mode into a temporary file,
+so memory stays bounded whatever the number of rows. Under ASGI the CSV is
+fed from an async iterator (``aiterator()``) so that a long export doesn't
+hold a worker thread. xlsxwriter is only loaded by the first XLSX export,
+see :mod:`inventory.spreadsheets`.
+"""
+import csv
+import tempfile
+import time
+
+from django.http import FileResponse, StreamingHttpResponse
+
+from . import metrics
+
+CHUNK_SIZE = 2000
+
+HEADERS = ['Name', 'Ref', 'SN', 'SN Rempl', 'Reception Date', 'Delivery Status', 'Delivery Date', 'BL', 'Year', 'Quarter']
+FIELDS = ['name', 'ref', 'sn', 'sn_rempl', 'reception_date', 'delivery_status', 'delivery_date', 'bl', 'year', 'quarter']
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _export_fields(with_record):
+    return (['record__name'] if with_record else []) + FIELDS
+
+
+def _cells(row):
+    return [
+        value.strftime('%Y-%m-%d') if hasattr(value, 'strftime') else ('' if value is None else value)
+        for value in row
+    ]
+
+
+def export_rows(equipments, with_record=False):
+    """Yield the export rows of ``equipments`` as lists of cell values."""
+    rows = equipments.order_by('record_id', 'order_index', 'id').values_list(*_export_fields(with_record))
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield _cells(row)
+
+
+async def aexport_rows(equipments, with_record=False):
+    """Async version of :func:`export_rows`."""
+    # values() rather than values_list(): the latter runs its query as soon as
+    # aiterator() creates it, outside of the thread that sync_to_async provides.
+    rows = equipments.order_by('record_id', 'order_index', 'id').values(*_export_fields(with_record))
+    async for row in rows.aiterator(chunk_size=CHUNK_SIZE):
+        yield _cells(row.values())
+
+
+def export_headers(with_record=False):
+    return (['Record'] if with_record else []) + HEADERS
+
+
+def write_xlsx(equipments, output, with_record=False):
+    from . import spreadsheets
+
+    workbook = spreadsheets.workbook(output)
+    worksheet = workbook.add_worksheet()
+
+    # Define formats
+    header_format = workbook.add_format({
+        'bold': True,
+        'bg_color': '#0000FF',
+        'font_color': '#FFFFFF',
+        'border': 1,
+        'align': 'center',
+        'valign': 'vcenter'
+    })
+    yellow_header_format = workbook.add_format({
+        'bold': True,
+        'bg_color': '#FFFF00',  # Yellow color for YEAR and QUARTER headers
+        'font_color': '#000000',
+        'border': 1,
+        'align': 'center',
+        'valign': 'vcenter'
+    })
+    cell_format = workbook.add_format({
+        'border': 1,
+        'align': 'center',
+        'valign': 'vcenter',
+        'text_wrap': True
+    })
+
+    headers = export_headers(with_record)
+    # Set column width for better readability
+    worksheet.set_column(0, len(headers) - 1, 20)
+
+    # Add column headers with formatting
+    for col, header in enumerate(headers):
+        worksheet.write(0, col, header, yellow_header_format if header in ['Year', 'Quarter'] else header_format)
+
+    # constant_memory mode flushes each row once the next one is started
+    for row_num, row in enumerate(export_rows(equipments, with_record), start=1):
+        worksheet.write_row(row_num, 0, row, cell_format)
+
+    workbook.close()
+
+
+def xlsx_response(equipments, filename, with_record=False):
+    output = tempfile.TemporaryFile()
+    start = time.perf_counter()
+    write_xlsx(equipments, output, with_record)
+    metrics.observe_export('xlsx', output.tell(), time.perf_counter() - start)
+    output.seek(0)
+    # FileResponse streams the file in blocks and closes (deletes) it afterwards.
+    return FileResponse(output, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_response(equipments, filename, with_record=False, asynchronous=False):
+    """Stream ``equipments`` as CSV.
+
+    ``asynchronous`` streams from an async iterator, which only pays off
+    under ASGI: the WSGI handler would buffer the whole file to consume it.
+    """
+    writer = csv.writer(_Echo())
+
+    start = time.perf_counter()
+    size = 0
+
+    def lines():
+        nonlocal size
+        yield '\ufeff'  # BOM so that Excel detects UTF-8
+        yield writer.writerow(export_headers(with_record))
+        for row in export_rows(equipments, with_record):
+            line = writer.writerow(row)
+            size += len(line)
+            yield line
+        metrics.observe_export('csv', size, time.perf_counter() - start)
+
+    async def alines():
+        nonlocal size
+        yield '\ufeff'
+        yield writer.writerow(export_headers(with_record))
+        async for row in aexport_rows(equipments, with_record):
+            line = writer.writerow(row)
+            size += len(line)
+            yield line
+        metrics.observe_export('csv', size, time.perf_counter() - start)
+
+    response = StreamingHttpResponse(alines() if asynchronous else lines(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
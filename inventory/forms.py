@@ -1,4 +1,5 @@
 from django import forms
+from .importer import archived_sns
 from .models import Equipment, Record
 
 class UploadFileForm(forms.Form):
@@ -14,10 +15,60 @@ class EquipmentForm(forms.ModelForm):
             'sn': forms.TextInput(attrs={'readonly': 'readonly'}),
         }
 
+    def clean_sn(self):
+        # Live SNs are checked by validate_unique(), archived ones stay taken as well
+        sn = self.cleaned_data['sn']
+        if sn and archived_sns([sn]):
+            raise forms.ValidationError(f'Equipment with SN {sn} is archived.')
+        return sn
+
 class RecordForm(forms.ModelForm):
     class Meta:
         model = Record
         fields = ['name', 'reception_date']
         widgets = {
             'reception_date': forms.DateInput(attrs={'type': 'date'}),
-        }
\ No newline at end of file
+        }
+
+class BulkEquipmentForm(forms.Form):
+    """Changes applied by the bulk actions of the equipment list, blank fields are left as is."""
+    delivery_status = forms.ChoiceField(
+        choices=[('', 'Keep status')] + Equipment._meta.get_field('delivery_status').choices,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    delivery_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    bl = forms.ChoiceField(
+        choices=[('', 'Keep BL')] + Equipment._meta.get_field('bl').choices,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    new_record = forms.ModelChoiceField(queryset=Record.objects.all(), required=False, empty_label='Keep record')
+    sns = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={'rows': 3, 'class': 'form-control', 'placeholder': 'One SN per line'}),
+    )
+    sn_file = forms.FileField(required=False)
+
+    def changes(self):
+        changes = {
+            field: self.cleaned_data[field]
+            for field in ('delivery_status', 'delivery_date', 'bl')
+            if self.cleaned_data.get(field) not in (None, '')
+        }
+        if self.cleaned_data.get('new_record'):
+            changes['record'] = self.cleaned_data['new_record']
+        return changes
+
+    def serial_numbers(self):
+        """SNs pasted in the text area or uploaded as a text/CSV file, one per line."""
+        lines = self.cleaned_data['sns'].splitlines()
+        if self.cleaned_data.get('sn_file'):
+            lines += self.cleaned_data['sn_file'].read().decode('utf-8-sig', errors='replace').splitlines()
+        return [line.split(',')[0].strip() for line in lines if line.strip()]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.changes():
+            raise forms.ValidationError('Choose at least one change to apply.')
+        return cleaned_data
@@ -0,0 +1,317 @@
+"""Set-based import of equipment rows coming from the uploaded Excel sheets.
+
+Rows are processed in fixed-size batches: every batch resolves its Dossier
+names and serial numbers with a couple of ``IN`` queries and inserts the
+missing Records and Equipment with ``bulk_create``.
+
+:func:`validate_rows` runs the same checks without writing anything, for the
+upload preview. The rows it accepts are kept with :func:`dump_rows` and fed
+back to :func:`import_rows` by :func:`load_rows` once the upload is confirmed,
+so that the sheet is only parsed once.
+"""
+import gzip
+import json
+import math
+from contextlib import nullcontext
+
+from django.db import transaction
+
+from . import audit, bulk, stats
+from .models import ArchivedEquipment, Record, Equipment
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Columns of the supplier sheet, as expected by the importer.
+COLUMNS = {
+    'Dossier': 'record_name',
+    'Design.': 'name',
+    'Ref': 'ref',
+    'SN': 'sn',
+    'SN Rempl': 'sn_rempl',
+}
+
+
+class RowError:
+    """A rejected row of the sheet, ``row`` being its 1-based data row number."""
+
+    def __init__(self, row, message):
+        self.row = row
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+    def __repr__(self):
+        return f'RowError(row={self.row!r}, message={self.message!r})'
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created_records = 0
+        self.created_equipment = 0
+        self.errors = []
+
+    @property
+    def rejected(self):
+        return len(self.errors)
+
+    def reject(self, row, message):
+        self.errors.append(RowError(row, message))
+
+
+def clean_value(value):
+    """Normalize a spreadsheet cell to the string stored in the database."""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            value = int(value)
+    value = str(value)
+    return value if value.strip() else None
+
+
+def read_rows(excel_file, columns=COLUMNS, clean=clean_value):
+    """Yield ``(index, row)`` pairs from an uploaded ``.xlsx`` file.
+
+    ``columns`` maps the sheet headers to the keys of the row dicts and
+    ``clean`` normalizes every cell.
+
+    The sheet is streamed (see :func:`spreadsheets.iter_rows`), so memory
+    stays flat whatever its size. Like ``pd.read_excel``, the first
+    worksheet is read, the first row holds the column names and trailing
+    blank rows are ignored.
+    """
+    from . import spreadsheets
+
+    sheet_rows = spreadsheets.iter_rows(excel_file)
+    header = [None if cell is None else str(cell) for cell in next(sheet_rows, ())]
+    positions = {field: header.index(column) for column, field in columns.items() if column in header}
+    index = 0
+    blank_rows = 0
+    for values in sheet_rows:
+        if all(value is None for value in values):
+            # Only blank rows followed by data are reported, trailing ones are dropped.
+            blank_rows += 1
+            continue
+        for _ in range(blank_rows):
+            yield index, dict.fromkeys(columns.values())
+            index += 1
+        blank_rows = 0
+        row = dict.fromkeys(columns.values())
+        for field, position in positions.items():
+            if position < len(values):
+                row[field] = clean(values[position])
+        yield index, row
+        index += 1
+
+
+def read_rows_dataframe(excel_file):
+    """Same as :func:`read_rows`, loading the whole sheet with pandas first."""
+    from . import spreadsheets
+
+    df = spreadsheets.read_dataframe(excel_file)
+    for index, row in df.iterrows():
+        yield index, {field: clean_value(row.get(column)) for column, field in COLUMNS.items()}
+
+
+class Preview:
+    """What importing a sheet would do, as found by :func:`validate_rows`."""
+
+    def __init__(self):
+        self.rows = 0
+        self.valid = []  # (index, row) pairs that would be imported
+        self.new_records = []
+        self.existing_records = 0
+        self.incomplete = 0
+        self.existing = 0
+        self.archived = 0
+        self.repeated = 0
+        self.errors = []
+
+    @property
+    def rejected(self):
+        return len(self.errors)
+
+    def reject(self, row, message):
+        self.errors.append(RowError(row, message))
+
+    def summary(self):
+        return {
+            'rows': self.rows,
+            'new_records': len(self.new_records),
+            'existing_records': self.existing_records,
+            'new_equipment': len(self.valid),
+            'incomplete': self.incomplete,
+            'existing': self.existing,
+            'archived': self.archived,
+            'repeated': self.repeated,
+            # A sample is enough to check the names
+            'new_record_names': self.new_records[:20],
+        }
+
+
+def _batches(rows, size):
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _is_complete(row):
+    return bool(row['record_name'] and row['name'] and row['sn'])
+
+
+def _import_batch(batch, result, batch_size):
+    valid = [row for _, row in batch if _is_complete(row)]
+
+    # Resolve every Dossier of the batch at once, creating the missing ones.
+    names = {row['record_name'] for row in valid}
+    records = {}
+    if names:
+        for record_id, name in Record.objects.filter(name__in=names).order_by('-id').values_list('id', 'name'):
+            records[name] = record_id
+    missing = [Record(name=name) for name in sorted(names) if name not in records]
+    if missing:
+        for record in Record.objects.bulk_create(missing, batch_size=batch_size):
+            records[record.name] = record.pk
+        result.created_records += len(missing)
+        stats.add_record(None, len(missing))
+
+    # Previous batches are already inserted, so this also catches duplicates
+    # spread across the sheet. Archived SNs are taken as well.
+    sns = {row['sn'] for row in valid}
+    existing = set(Equipment.objects.filter(sn__in=sns).values_list('sn', flat=True)) if sns else set()
+    archived = archived_sns(sns, batch_size)
+
+    equipment = []
+    for index, row in batch:
+        sn = row['sn']
+        if not _is_complete(row):
+            result.reject(index + 1, f'Missing required data in row {index + 1}.')
+        elif sn in existing:
+            result.reject(index + 1, f'Equipment with SN {sn} already exists and was not added.')
+        elif sn in archived:
+            result.reject(index + 1, f'Equipment with SN {sn} is archived and was not added.')
+        else:
+            existing.add(sn)
+            equipment.append(Equipment(
+                name=row['name'],
+                record_id=records[row['record_name']],
+                ref=row['ref'],
+                sn=sn,
+                sn_rempl=row['sn_rempl'],
+                order_index=index + 1,  # Assign order_index based on the row number
+            ))
+    Equipment.objects.bulk_create(equipment, batch_size=batch_size)
+    result.created_equipment += len(equipment)
+    # bulk_create() sends no signals, keep the rollups, dashboard counters and change log in step.
+    bulk.refresh_rollups({item.record_id for item in equipment})
+    stats.add_equipment(None, 'InProgress', len(equipment))
+    audit.write(audit.created(missing) + audit.created(equipment))
+
+
+def _lookup(queryset, field, values, batch_size):
+    """The ``values`` found in ``field``, with one ``IN`` query per ``batch_size`` values."""
+    values = sorted(values)
+    found = set()
+    for start in range(0, len(values), batch_size):
+        found.update(queryset.filter(**{f'{field}__in': values[start:start + batch_size]}).values_list(field, flat=True))
+    return found
+
+
+def archived_sns(sns, batch_size=DEFAULT_BATCH_SIZE):
+    """The ``sns`` held by archived equipment, which stay taken (see archive.py)."""
+    return _lookup(ArchivedEquipment.objects, 'sn', {sn for sn in sns if sn}, batch_size)
+
+
+def validate_rows(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """Check ``(index, row)`` pairs as :func:`import_rows` would, without writing anything.
+
+    The rows are read once; their SNs and Dossiers are then looked up with a
+    few batched ``IN`` queries rather than row by row. Besides the rows the
+    import rejects, an SN repeated within the sheet is reported on its
+    later rows, the first one being kept.
+    """
+    preview = Preview()
+    complete = []
+    first_rows = {}
+    for index, row in rows:
+        preview.rows += 1
+        if not _is_complete(row):
+            preview.incomplete += 1
+            preview.reject(index + 1, f'Missing required data in row {index + 1}.')
+        elif row['sn'] in first_rows:
+            preview.repeated += 1
+            preview.reject(index + 1, f'SN {row["sn"]} is repeated in the file (first in row {first_rows[row["sn"]]}) '
+                                      f'and was not added.')
+        else:
+            first_rows[row['sn']] = index + 1
+            complete.append((index, row))
+
+    existing = _lookup(Equipment.objects, 'sn', first_rows, batch_size)
+    archived = archived_sns(first_rows.keys() - existing, batch_size)
+    for index, row in complete:
+        sn = row['sn']
+        if sn in existing:
+            preview.existing += 1
+            preview.reject(index + 1, f'Equipment with SN {sn} already exists and was not added.')
+        elif sn in archived:
+            preview.archived += 1
+            preview.reject(index + 1, f'Equipment with SN {sn} is archived and was not added.')
+        else:
+            preview.valid.append((index, row))
+    # Errors in sheet order, like the import reports them
+    preview.errors.sort(key=lambda error: error.row)
+
+    names = {row['record_name'] for _, row in preview.valid}
+    known = _lookup(Record.objects, 'name', names, batch_size)
+    preview.existing_records = len(known)
+    preview.new_records = sorted(names - known)
+    return preview
+
+
+def dump_rows(rows, output):
+    """Write ``(index, row)`` pairs to the binary file ``output`` as gzipped JSON lines."""
+    fields = list(COLUMNS.values())
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+    # The file is read back once, fast compression is plenty
+    with gzip.open(output, 'wt', encoding='utf-8', compresslevel=1) as file:
+        file.writelines(encode([index, *(row[field] for field in fields)]) + '\n' for index, row in rows)
+
+
+def load_rows(source):
+    """Yield the ``(index, row)`` pairs written by :func:`dump_rows`."""
+    fields = list(COLUMNS.values())
+    with gzip.open(source, 'rt', encoding='utf-8') as file:
+        for line in file:
+            index, *values = json.loads(line)
+            yield index, dict(zip(fields, values))
+
+
+def import_rows(rows, batch_size=DEFAULT_BATCH_SIZE, atomic=True, progress=None):
+    """Import ``(index, row)`` pairs as produced by :func:`read_rows`.
+
+    By default the whole import runs in a single transaction; with
+    ``atomic=False`` every batch is committed on its own, so that progress is
+    visible to other connections while a long import runs. ``progress`` is
+    called with the running :class:`ImportResult` after each batch.
+
+    Rejected rows are reported in ``ImportResult.errors`` with the same
+    messages the upload form shows.
+    """
+    result = ImportResult()
+    with transaction.atomic() if atomic else nullcontext():
+        for batch in _batches(rows, batch_size):
+            with transaction.atomic():
+                result.rows += len(batch)
+                _import_batch(batch, result, batch_size)
+            if progress:
+                progress(result)
+    return result
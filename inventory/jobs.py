@@ -0,0 +1,163 @@
+"""Background processing of the Excel uploads queued from the home page."""
+import datetime
+import io
+import os
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from . import audit
+from .importer import dump_rows, import_rows, load_rows, read_rows, validate_rows
+from .models import ImportJob
+
+# Only the first errors are kept on the job, the total is in rows_rejected.
+MAX_STORED_ERRORS = 1000
+
+
+def preview_upload(excel_file):
+    """Queue an uploaded sheet for validation by the worker (see validate_job)."""
+    return ImportJob.objects.create(file=excel_file, status='Validating')
+
+
+def validate_job(job):
+    """Validate the sheet of a Validating job and leave it in Preview until confirm() queues it.
+
+    Nothing is imported: the job holds the counts and errors of the preview,
+    and the rows it accepted, so that the import doesn't parse the sheet again.
+    """
+    try:
+        with job.file.open('rb') as excel_file:
+            preview = validate_rows(read_rows(excel_file))
+        output = io.BytesIO()
+        dump_rows(preview.valid, output)
+        name = os.path.splitext(os.path.basename(job.file.name))[0]
+        job.validated_rows.save(f'{name}.rows.jsonl.gz', ContentFile(output.getvalue()), save=False)
+    except Exception as e:
+        job.status = 'Failed'
+        job.errors = [f'An error occurred: {str(e)}']
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'errors', 'finished_at'])
+        return job
+    job.status = 'Preview'
+    # The rejected rows count as processed, the import only goes through the others
+    job.rows_done = job.rows_rejected = preview.rejected
+    job.errors = [str(error) for error in preview.errors[:MAX_STORED_ERRORS]]
+    job.summary = preview.summary()
+    job.save(update_fields=['status', 'rows_done', 'rows_rejected', 'errors', 'summary', 'validated_rows'])
+    return job
+
+
+def confirm(job):
+    """Queue a previewed job for import; False if it was already confirmed or discarded."""
+    return bool(ImportJob.objects.filter(pk=job.pk, status='Preview').update(status='Pending'))
+
+
+def discard(job):
+    """Delete a previewed job and its files."""
+    job.file.delete(save=False)
+    job.validated_rows.delete(save=False)
+    job.delete()
+
+
+def requeue_stale_jobs():
+    """Put back in the queue the jobs whose worker stopped reporting progress.
+
+    An import is resumed after its last committed batch (see ``resume_at``),
+    a validation starts over.
+    """
+    stale_after = datetime.timedelta(seconds=getattr(settings, 'INVENTORY_IMPORT_STALE_AFTER', 600))
+    stale = ImportJob.objects.filter(heartbeat_at__lt=timezone.now() - stale_after)
+    return (
+        stale.filter(status='Running').update(status='Pending')
+        + stale.filter(status='Validating').update(heartbeat_at=None)
+    )
+
+
+def _claim_validation(job):
+    # A Validating job keeps its status while it runs, taking it sets heartbeat_at.
+    now = timezone.now()
+    if ImportJob.objects.filter(pk=job.pk, status='Validating', heartbeat_at__isnull=True).update(heartbeat_at=now):
+        job.heartbeat_at = now
+        return job
+    return None
+
+
+def claim_next_job():
+    """Atomically take the oldest queued job and return it.
+
+    A pending import moves to Running, a sheet to validate stays in Validating.
+    """
+    requeue_stale_jobs()
+    while True:
+        job = ImportJob.objects.filter(
+            Q(status='Pending') | Q(status='Validating', heartbeat_at__isnull=True)
+        ).order_by('id').first()
+        if job is None:
+            return None
+        if job.status == 'Validating':
+            if _claim_validation(job):
+                return job
+            continue
+        now = timezone.now()
+        # A resumed job keeps its start time, so that its throughput stays right
+        started_at = job.started_at or now
+        claimed = ImportJob.objects.filter(pk=job.pk, status='Pending').update(
+            status='Running', started_at=started_at, heartbeat_at=now
+        )
+        if claimed:
+            job.status = 'Running'
+            job.started_at = started_at
+            job.heartbeat_at = now
+            return job
+        # Another worker took it first, try the next one.
+
+
+def run_job(job):
+    if job.status == 'Validating':
+        return validate_job(job)
+    # The counts and errors already on the job are carried over: those of the
+    # preview, whose accepted rows are imported, or those of the batches a
+    # stopped worker committed before this one resumed it.
+    previewed = bool(job.validated_rows)
+    done, rejected, errors, resume_at = job.rows_done, job.rows_rejected, list(job.errors), job.resume_at
+
+    def report(result):
+        # Called once a batch is committed, so this is what a failure or a
+        # stopped worker leaves in the database.
+        job.rows_done = done + result.rows
+        job.rows_rejected = rejected + result.rejected
+        job.errors = (errors + [str(error) for error in result.errors])[:MAX_STORED_ERRORS]
+        job.resume_at = resume_at + result.rows
+        job.heartbeat_at = timezone.now()
+        job.save(update_fields=['rows_done', 'rows_rejected', 'errors', 'resume_at', 'heartbeat_at'])
+
+    try:
+        source = job.validated_rows if previewed else job.file
+        with source.open('rb') as file, audit.acting_as(f'import #{job.pk}'):
+            rows = load_rows(file) if previewed else read_rows(file)
+            import_rows(islice(rows, resume_at, None), atomic=False, progress=report)
+    except Exception as e:
+        job.status = 'Failed'
+        job.errors = job.errors[:MAX_STORED_ERRORS - 1] + [f'An error occurred: {str(e)}']
+    else:
+        job.status = 'Done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'errors', 'finished_at'])
+    return job
+
+
+def process_pending_jobs():
+    """Run pending jobs until the queue is empty, returning how many ran."""
+    processed = 0
+    try:
+        while (job := claim_next_job()) is not None:
+            run_job(job)
+            processed += 1
+    finally:
+        # Worker threads own their connection, don't leak it.
+        connection.close()
+    return processed
@@ -0,0 +1,67 @@
+import datetime
+import gzip
+import json
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from inventory.models import ChangeLog
+
+COLUMNS = ('id', 'kind', 'object_id', 'sn', 'action', 'changes', 'actor', 'created_at')
+
+
+class Command(BaseCommand):
+    help = (
+        'Move the change log entries older than --days (or --before) to a gzipped JSON lines file '
+        'and delete them from the database, oldest first and one batch at a time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='Keep the entries of the last DAYS days.')
+        parser.add_argument('--before', type=datetime.date.fromisoformat,
+                            help='Archive the entries made before this date (YYYY-MM-DD) instead.')
+        parser.add_argument('--output', help='File to append the entries to, changelog-<date>.jsonl.gz by default.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--vacuum', action='store_true', help='Give the freed space back to the OS (SQLite).')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            cutoff = timezone.make_aware(datetime.datetime.combine(options['before'], datetime.time()))
+        else:
+            cutoff = timezone.now() - datetime.timedelta(days=options['days'])
+        output = options['output'] or f'changelog-{cutoff.date().isoformat()}.jsonl.gz'
+
+        # Ids grow with time, so the archived entries are an id range. Finding
+        # its end walks the primary key and reads no more rows than get archived.
+        end = ChangeLog.objects.filter(created_at__gte=cutoff).order_by('id').values_list('id', flat=True).first()
+        entries = ChangeLog.objects.order_by('id')
+        if end is not None:
+            entries = entries.filter(id__lt=end)
+        if not entries.exists():
+            self.stdout.write(f'No change log entries made before {cutoff:%Y-%m-%d}.')
+            return
+
+        archived = 0
+        last_id = 0
+        # Appending keeps a file readable by gzip if a previous run was interrupted.
+        with gzip.open(output, 'at', encoding='utf-8') as archive:
+            while True:
+                batch = list(entries.filter(id__gt=last_id).values(*COLUMNS)[:options['batch_size']])
+                if not batch:
+                    break
+                for entry in batch:
+                    archive.write(json.dumps(entry, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n')
+                archive.flush()
+                with transaction.atomic():
+                    ChangeLog.objects.filter(id__gt=last_id, id__lte=batch[-1]['id']).delete()
+                last_id = batch[-1]['id']
+                archived += len(batch)
+
+        if options['vacuum'] and archived and connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} change log entries made before {cutoff:%Y-%m-%d} to {output}.'
+        ))
@@ -0,0 +1,43 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from inventory.archive import BATCH_SIZE, archivable, archive_records
+
+
+class Command(BaseCommand):
+    help = (
+        'Move closed records (no equipment in progress) whose last delivery is older than --days, '
+        'with their equipment, to the archive tables, one batch of records per transaction. '
+        'Archived records can be browsed and restored from /archive/.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365,
+                            help='Archive records with no delivery or reception in the last DAYS days.')
+        parser.add_argument('--before', type=datetime.date.fromisoformat,
+                            help='Archive records with no activity since this date (YYYY-MM-DD) instead.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Records per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived.')
+
+    def handle(self, *args, **options):
+        before = options['before'] or timezone.now().date() - datetime.timedelta(days=options['days'])
+
+        if options['dry_run']:
+            totals = archivable(before).aggregate(records=Count('id'), equipment=Sum('items_total'))
+            self.stdout.write(
+                f"{totals['records']} record(s) and {totals['equipment'] or 0} equipment "
+                f'would be archived (no activity since {before}).'
+            )
+            return
+
+        def progress(records, equipment):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{records} record(s), {equipment} equipment archived...')
+
+        records, equipment = archive_records(before, options['batch_size'], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {records} record(s) and {equipment} equipment with no activity since {before}.'
+        ))
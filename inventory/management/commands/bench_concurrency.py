@@ -0,0 +1,129 @@
+import json
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+from inventory import stats
+from inventory.benchmarks import percentile
+from inventory.importer import import_rows
+from inventory.models import Equipment, Record
+from inventory.pagination import keyset_paginate
+from inventory.views import RECORD_SORTS
+
+
+class Command(BaseCommand):
+    help = (
+        'Run concurrent imports while other threads read the record and equipment lists, on the '
+        'configured database (see the DB_* variables in settings), and report rows/sec, list '
+        'requests/sec, p99 latency and lock errors. For PostgreSQL, a local stand-in such as '
+        '"docker run -e POSTGRES_PASSWORD=bench -p 5432:5432 postgres:16" followed by '
+        '"DB_ENGINE=postgresql DB_PASSWORD=bench manage.py migrate" will do. '
+        'The imported rows are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help='Concurrent imports.')
+        parser.add_argument('--readers', type=int, default=8, help='Threads reading list pages meanwhile.')
+        parser.add_argument('--rows', type=int, default=5000, help='Rows per import.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--json', action='store_true', help='Print the result as JSON.')
+
+    def handle(self, *args, **options):
+        prefix = f'BENCHC-{uuid.uuid4().hex[:8]}-'
+        lock = threading.Lock()
+        imported = []
+        write_errors = []
+        read_latencies = []
+        read_errors = []
+        writing = threading.Event()
+        writing.set()
+
+        def writer(index):
+            rows = [
+                (i, {'record_name': f'{prefix}{index}-{i // 100}', 'name': 'Router', 'ref': None,
+                     'sn': f'{prefix}{index}-{i}', 'sn_rempl': None})
+                for i in range(options['rows'])
+            ]
+            try:
+                # Batches commit one by one, as in the process_imports worker
+                result = import_rows(rows, batch_size=options['batch_size'], atomic=False)
+                with lock:
+                    imported.append(result.created_equipment)
+            except DatabaseError as e:
+                with lock:
+                    write_errors.append(str(e))
+            finally:
+                connection.close()
+
+        def reader(index):
+            latencies = []
+            errors = []
+            try:
+                while writing.is_set():
+                    start = time.perf_counter()
+                    try:
+                        if index % 2:
+                            list(keyset_paginate(Record.objects.with_stats(), RECORD_SORTS['recent']))
+                        else:
+                            list(Equipment.objects.select_related('record').order_by('-id')[:10])
+                    except DatabaseError as e:
+                        errors.append(str(e))
+                        continue
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+                with lock:
+                    read_latencies.extend(latencies)
+                    read_errors.extend(errors)
+
+        readers = [threading.Thread(target=reader, args=(i,)) for i in range(options['readers'])]
+        writers = [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        start = time.perf_counter()
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        writing.clear()
+        for thread in readers:
+            thread.join()
+
+        self.cleanup(prefix)
+        read_latencies.sort()
+        result = {
+            'database': self.describe(),
+            'writers': options['writers'],
+            'readers': options['readers'],
+            'seconds': round(elapsed, 2),
+            'rows_per_sec': round(sum(imported) / elapsed, 1),
+            'failed_imports': len(write_errors),
+            'list_requests_per_sec': round(len(read_latencies) / elapsed, 1),
+            'list_p50_ms': round(percentile(read_latencies, 50) * 1000, 1) if read_latencies else None,
+            'list_p99_ms': round(percentile(read_latencies, 99) * 1000, 1) if read_latencies else None,
+            'read_errors': len(read_errors),
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+            return
+        for key, value in result.items():
+            self.stdout.write(f'{key:<24}{value}')
+        for error in sorted(set(write_errors + read_errors))[:5]:
+            self.stderr.write(error)
+
+    def describe(self):
+        settings_dict = connection.settings_dict
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                journal_mode = cursor.fetchone()[0]
+            return f"sqlite journal_mode={journal_mode} transaction_mode={settings_dict['OPTIONS'].get('transaction_mode')}"
+        pool = settings_dict['OPTIONS'].get('pool')
+        return f"{connection.vendor} pool={bool(pool)} CONN_MAX_AGE={settings_dict['CONN_MAX_AGE']}"
+
+    def cleanup(self, prefix):
+        Equipment.objects.filter(sn__startswith=prefix).delete()
+        Record.objects.filter(name__startswith=prefix).delete()
+        stats.invalidate()
@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.benchmarks import load_test
+
+# Read-heavy endpoints, served by async views under ASGI.
+DEFAULT_PATHS = [
+    '/records/',
+    '/equipments/',
+    '/equipments/?sn=0001',
+    '/equipments/search/?q=0001',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/sec and p99 latency of the same endpoints on running servers, e.g. '
+        '"gunicorn iam_stock.wsgi -w 4 --threads 8 -b :8000" and '
+        '"uvicorn iam_stock.asgi:application --workers 4 --port 8001" over the same database: '
+        'bench_http --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, metavar='LABEL=URL',
+                            help='Server to measure, repeat for each server to compare.')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help=f'Path to request, repeatable (default: {", ".join(DEFAULT_PATHS)}). '
+                                 'Add e.g. /download_record/1/?format=csv to measure exports.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per measurement.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON lines.')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            label, sep, url = target.partition('=')
+            if not sep or not url:
+                raise CommandError(f'Expected LABEL=URL, got {target!r}.')
+            targets.append((label, url.rstrip('/')))
+
+        for path in options['paths'] or DEFAULT_PATHS:
+            for concurrency in options['concurrency']:
+                for label, base_url in targets:
+                    result = load_test(base_url + path, concurrency, options['duration'])
+                    result['server'] = label
+                    if options['json']:
+                        self.stdout.write(json.dumps(result))
+                    else:
+                        self.stdout.write(
+                            f"{label:>6} {path:<32} c={concurrency:<4} {result['requests_per_sec']:>8.1f} req/s  "
+                            f"p50 {result['p50_ms']} ms  p99 {result['p99_ms']} ms  errors {result['errors']}"
+                        )
@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory.benchmarks import peak_rss_mb, write_sample_sheet
+from inventory.importer import import_rows, read_rows, read_rows_dataframe
+
+READERS = {
+    'streaming': read_rows,
+    'pandas': read_rows_dataframe,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare peak RSS and rows/sec of the streaming and pandas Excel readers. '
+        'Every measurement runs in a fresh process; imports are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000])
+        parser.add_argument('--readers', nargs='+', choices=sorted(READERS), default=sorted(READERS))
+        parser.add_argument('--import', dest='run_import', action='store_true',
+                            help='Also run the importer (inside a rolled back transaction).')
+        parser.add_argument('--file', help=('Measure this sheet in the current process and print JSON '
+                                            '(used internally for each measurement).'))
+        parser.add_argument('--reader', choices=sorted(READERS), default='streaming')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            self.stdout.write(json.dumps(self.measure(options['file'], options['reader'], options['run_import'])))
+            return
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for rows in options['rows']:
+                path = os.path.join(tmpdir, f'bench_{rows}.xlsx')
+                write_sample_sheet(path, rows)
+                for reader in options['readers']:
+                    command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_import', '--file', path, '--reader', reader]
+                    if options['run_import']:
+                        command.append('--import')
+                    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+                    result = json.loads(output.strip().splitlines()[-1])
+                    self.stdout.write(
+                        f"{reader:>10} {rows:>9} rows: {result['rows_per_sec']:>10.0f} rows/s, "
+                        f"peak RSS {result['peak_rss_mb']:.1f} MiB (+{result['rss_growth_mb']:.1f})"
+                    )
+
+    def measure(self, path, reader, run_import):
+        baseline = peak_rss_mb()
+        start = time.perf_counter()
+        rows = READERS[reader](path)
+        if run_import:
+            with transaction.atomic():
+                count = import_rows(rows).rows
+                transaction.set_rollback(True)
+        else:
+            count = sum(1 for _ in rows)
+        elapsed = time.perf_counter() - start
+        peak = peak_rss_mb()
+        return {
+            'reader': reader,
+            'rows': count,
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': count / elapsed if elapsed else 0,
+            'peak_rss_mb': round(peak, 1),
+            'rss_growth_mb': round(peak - baseline, 1),
+        }
@@ -0,0 +1,108 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from inventory.benchmarks import seed
+from inventory.importer import import_rows
+from inventory.models import Equipment, Record
+from inventory.views import RECORD_SORTS
+from inventory.pagination import keyset_paginate
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the import and list queries with and without the lookup indexes, '
+        'on a seeded dataset. Everything runs in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=5000)
+        parser.add_argument('--equipment', type=int, default=500000)
+        parser.add_argument('--import-rows', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        # SQLite can only alter tables in a transaction with foreign key checks off.
+        connection.disable_constraint_checking()
+        try:
+            before, after = self.run(options)
+        finally:
+            connection.enable_constraint_checking()
+
+        self.stdout.write(f"{'':<28}{'before':>12}{'after':>12}")
+        for name in after:
+            self.stdout.write(f'{name:<28}{before[name]:>10.1f}ms{after[name]:>10.1f}ms')
+
+    def run(self, options):
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {options['records']} records / {options['equipment']} equipment...")
+            record_ids = seed(options['records'], options['equipment'])
+            if connection.vendor == 'sqlite':
+                connection.cursor().execute('ANALYZE')
+
+            after = self.measure(record_ids, options)
+            self.drop_indexes()
+            before = self.measure(record_ids, options)
+            transaction.set_rollback(True)
+        return before, after
+
+    def measure(self, record_ids, options):
+        rows = [
+            (i, {'record_name': f'SEED-{i % 50:07d}', 'name': 'Router', 'ref': None,
+                 'sn': f'SEED{i:010d}' if i % 2 else f'NEW{i:010d}', 'sn_rempl': None})
+            for i in range(options['import_rows'])
+        ]
+
+        def run_import():
+            savepoint = transaction.savepoint()
+            import_rows(rows)
+            transaction.savepoint_rollback(savepoint)
+
+        record_id = record_ids[len(record_ids) // 2]
+        return {
+            f"import {options['import_rows']} rows": timed(run_import, options['repeat']),
+            'record list page': timed(
+                lambda: list(keyset_paginate(Record.objects.with_stats(), RECORD_SORTS['recent'])),
+                options['repeat'],
+            ),
+            'equipment of a record': timed(
+                lambda: list(Equipment.objects.filter(record_id=record_id).order_by('order_index')),
+                options['repeat'],
+            ),
+            'record status': timed(
+                lambda: Record.objects.get(pk=record_id).status,
+                options['repeat'],
+            ),
+            'in progress count': timed(
+                lambda: Equipment.objects.filter(delivery_status='InProgress').count(),
+                options['repeat'],
+            ),
+        }
+
+    def drop_indexes(self):
+        """Drop the indexes added by 0003_indexes, as they were before it."""
+        with connection.schema_editor() as schema_editor:
+            for model in (Record, Equipment):
+                for index in model._meta.indexes:
+                    schema_editor.remove_index(model, index)
+            old_sn = Equipment._meta.get_field('sn').clone()
+            old_sn.set_attributes_from_name('sn')
+            old_sn.model = Equipment
+            old_sn._unique = False
+            schema_editor.alter_field(Equipment, Equipment._meta.get_field('sn'), old_sn)
+            old_name = Record._meta.get_field('name').clone()
+            old_name.set_attributes_from_name('name')
+            old_name.model = Record
+            old_name.db_index = False
+            schema_editor.alter_field(Record, Record._meta.get_field('name'), old_name)
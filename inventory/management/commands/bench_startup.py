@@ -0,0 +1,42 @@
+import json
+import statistics
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inventory.benchmarks import measure_boot, time_command
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure process startup in fresh interpreters: "manage.py check" time, time to boot the WSGI '
+        'application and serve a first request, RSS after boot and which heavy spreadsheet modules '
+        'got imported along the way (none should be).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/', help='Path of the first request, with its query string.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each measurement, medians are reported.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        manage_py = str(settings.BASE_DIR / 'manage.py')
+        check = [time_command([manage_py, 'check'], cwd=settings.BASE_DIR) for _ in range(options['repeat'])]
+        boots = [measure_boot(options['path'], cwd=settings.BASE_DIR) for _ in range(options['repeat'])]
+
+        result = {'path': options['path'], 'check_ms': statistics.median(check)}
+        for key in ('boot_ms', 'first_request_ms', 'rss_after_boot_mb', 'rss_after_request_mb'):
+            result[key] = statistics.median(boot[key] for boot in boots)
+        result['status'] = boots[-1]['status']
+        result['heavy_modules_after_boot'] = boots[-1]['heavy_modules_after_boot']
+
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+            return
+        self.stdout.write(f"manage.py check      {result['check_ms']} ms")
+        self.stdout.write(f"boot                 {result['boot_ms']} ms")
+        self.stdout.write(f"first request        {result['first_request_ms']} ms ({options['path']} -> {result['status']})")
+        self.stdout.write(f"RSS after boot       {result['rss_after_boot_mb']} MiB")
+        self.stdout.write(f"RSS after request    {result['rss_after_request_mb']} MiB")
+        heavy = ', '.join(result['heavy_modules_after_boot']) or 'none'
+        self.stdout.write(f'heavy modules loaded {heavy}')
@@ -0,0 +1,133 @@
+import datetime
+import json
+import os
+import platform
+import tempfile
+import time
+
+import django
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from inventory import analytics, views
+from inventory.benchmarks import generate_dataset, write_sample_sheet
+from inventory.exports import csv_response, write_xlsx
+from inventory.importer import import_rows, read_rows
+from inventory.models import Equipment, Record
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the import, list, export and record status paths on synthetic datasets of each size '
+        'and count their queries. Every size runs in a transaction that is rolled back. Results are '
+        'written as JSON, --compare prints the change against an earlier run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000],
+                            help='Equipment rows per dataset (records get 1 per 100).')
+        parser.add_argument('--import-rows', type=int,
+                            help='Rows of the imported sheet (default: the dataset size).')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark, the best is kept.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='Earlier results file to compare with.')
+
+    def handle(self, *args, **options):
+        results = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for size in options['sizes']:
+                self.stdout.write(f'Dataset of {size} equipment...')
+                results.extend(self.run_size(size, tmpdir, options))
+
+        report = {
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+        self.print_results(results, self.load(options['compare']) if options['compare'] else {})
+
+    def run_size(self, size, tmpdir, options):
+        records = max(size // 100, 10)
+        import_size = options['import_rows'] or size
+        # SNs past the ones already in the database, if any
+        offset = Equipment.objects.aggregate(last=Max('id'))['last'] or 0
+        sheet = os.path.join(tmpdir, f'import_{import_size}.xlsx')
+        write_sample_sheet(sheet, import_size, records=records, seed=options['seed'], offset=offset + size)
+
+        with transaction.atomic():
+            record_ids = generate_dataset(records, size, seed=options['seed'], sn_offset=offset)
+            if connection.vendor == 'sqlite':
+                connection.cursor().execute('ANALYZE')
+            record_id = record_ids[0]  # The largest record
+
+            def run_import():
+                savepoint = transaction.savepoint()
+                import_rows(read_rows(sheet))
+                transaction.savepoint_rollback(savepoint)
+
+            def export_csv(equipments):
+                return lambda: sum(len(line) for line in csv_response(equipments, 'bench.csv').streaming_content)
+
+            def export_xlsx(equipments):
+                def run():
+                    with tempfile.TemporaryFile() as output:
+                        write_xlsx(equipments, output, with_record=True)
+                return run
+
+            factory = RequestFactory()
+            benchmarks = {
+                f'import {import_size} rows': run_import,
+                'record list page': lambda: async_to_sync(views.record_list)(factory.get('/records/')),
+                'record list penalty filter': lambda: async_to_sync(views.record_list)(
+                    factory.get('/records/', {'penalty': 'penalty'})),
+                'equipment list page': lambda: async_to_sync(views.equipment_list)(factory.get('/equipments/')),
+                'equipment list sn filter': lambda: async_to_sync(views.equipment_list)(
+                    factory.get('/equipments/', {'sn': 'FOC'})),
+                'record export csv': export_csv(Equipment.objects.filter(record_id=record_id)),
+                'full export csv': export_csv(Equipment.objects.all()),
+                'full export xlsx': export_xlsx(Equipment.objects.all()),
+                'record status page': lambda: [record.status for record in Record.objects.with_stats()[:25]],
+                'sla report': lambda: (Record.objects.in_warning().count(), Record.objects.penalized().count()),
+                'analytics uncached': analytics.compute,
+            }
+            results = [self.measure(name, function, size, options['repeat']) for name, function in benchmarks.items()]
+            transaction.set_rollback(True)
+        return results
+
+    def measure(self, name, function, size, repeat):
+        # Queries are counted on a separate first run, capturing them slows the timed runs down.
+        with CaptureQueriesContext(connection) as queries:
+            function()
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return {'size': size, 'benchmark': name, 'ms': round(best * 1000, 2), 'queries': len(queries)}
+
+    def load(self, path):
+        try:
+            with open(path) as previous:
+                return {(row['size'], row['benchmark']): row for row in json.load(previous)['results']}
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+    def print_results(self, results, previous):
+        for row in results:
+            line = f"{row['size']:>9} {row['benchmark']:<28}{row['ms']:>11.1f}ms {row['queries']:>6} queries"
+            before = previous.get((row['size'], row['benchmark']))
+            if before:
+                change = (row['ms'] - before['ms']) / before['ms'] * 100 if before['ms'] else 0
+                line += f"  ({change:+.0f}% time, {row['queries'] - before['queries']:+d} queries)"
+            self.stdout.write(line)
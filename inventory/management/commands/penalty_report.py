@@ -0,0 +1,53 @@
+import csv
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from inventory.models import Record
+
+
+class Command(BaseCommand):
+    help = (
+        'Classify records against the repair SLA (penalty, warning, entering the warning '
+        'window soon) and write a CSV penalty report. Meant to run nightly.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=datetime.date.fromisoformat,
+                            help='Classify as of this date (YYYY-MM-DD), today by default.')
+        parser.add_argument('--upcoming-days', type=int, default=7,
+                            help='Report records entering the warning window within this many days.')
+        parser.add_argument('--include-closed', action='store_true',
+                            help='Also report records whose equipment is all delivered.')
+        parser.add_argument('--output', help='Write the CSV report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        today = options['date'] or timezone.now().date()
+        records = Record.objects.with_stats().with_sla(today, options['upcoming_days'])
+        if not options['include_closed']:
+            records = records.filter(items_in_progress__gt=0)
+
+        summary = {row['sla']: row['count'] for row in records.order_by().values('sla').annotate(count=Count('id'))}
+        reported = records.exclude(sla='ok').order_by('penalty_date', 'id')
+
+        output = open(options['output'], 'w', newline='') if options['output'] else self.stdout
+        try:
+            writer = csv.writer(output)
+            writer.writerow(['Record', 'Reception Date', 'Quarter', 'SLA', 'Warning Date', 'Penalty Date',
+                             'Repair Duration (Days)', 'Items Count', 'Items Left'])
+            for record in reported.iterator(chunk_size=2000):
+                writer.writerow([
+                    record.name, record.reception_date, record.quarter, record.sla, record.warning_date,
+                    record.penalty_date, record.repair_duration, record.items_count, record.items_in_progress,
+                ])
+        finally:
+            if options['output']:
+                output.close()
+
+        self.stderr.write(
+            f'SLA as of {today}: ' + ', '.join(
+                f'{summary.get(state, 0)} {state}' for state in ('penalty', 'warning', 'upcoming', 'ok')
+            )
+        )
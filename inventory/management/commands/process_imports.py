@@ -0,0 +1,27 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from inventory.jobs import process_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Process the queued Excel imports with a local pool of worker threads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Number of jobs processed concurrently.')
+        parser.add_argument('--poll', type=float, default=2.0, help='Seconds to wait between queue checks.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                futures = [executor.submit(process_pending_jobs) for _ in range(workers)]
+                processed = sum(future.result() for future in futures)
+                if processed:
+                    self.stdout.write(f'Processed {processed} import job(s).')
+                if options['once']:
+                    break
+                time.sleep(options['poll'])
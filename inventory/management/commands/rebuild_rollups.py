@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory.bulk import refresh_rollups
+from inventory.models import ROLLUP_FIELDS, Record, rollup_expressions
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the equipment rollups stored on each record (items total, in progress, delivered, '
+        'last delivery date) with the equipment table and repair the records that drifted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report drift, change nothing.')
+        parser.add_argument('--verbose-records', type=int, default=20, help='Number of drifted records to list.')
+
+    def handle(self, *args, **options):
+        computed = {f'computed_{field}': expression for field, expression in rollup_expressions().items()}
+        rows = Record.objects.annotate(**computed).values_list(
+            'id', 'name', *ROLLUP_FIELDS, *computed
+        ).order_by('id')
+
+        drifted = []
+        for row in rows.iterator(chunk_size=2000):
+            stored, expected = row[2:2 + len(ROLLUP_FIELDS)], row[2 + len(ROLLUP_FIELDS):]
+            if stored != expected:
+                drifted.append(row[0])
+                if len(drifted) <= options['verbose_records']:
+                    self.stdout.write(f'{row[1]} (#{row[0]}): stored {stored}, expected {expected}')
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All record rollups are up to date.'))
+            return
+        if options['check']:
+            self.stdout.write(self.style.WARNING(f'{len(drifted)} record(s) drifted.'))
+            return
+        with transaction.atomic():
+            refresh_rollups(drifted)
+        self.stdout.write(self.style.SUCCESS(f'Repaired {len(drifted)} record(s).'))
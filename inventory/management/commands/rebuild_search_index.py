@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from inventory import search
+
+
+class Command(BaseCommand):
+    help = 'Recreate the equipment SN/Ref search index from the equipment table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        search.install(options['database'])
+        search.rebuild(options['database'])
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
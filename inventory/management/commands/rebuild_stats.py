@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from inventory import stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard counters from the database.'
+
+    def handle(self, *args, **options):
+        stats.rebuild()
+        current = stats.get_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Counters rebuilt: {current['records']} records, {current['equipment']} equipment."
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from inventory import stats
+from inventory.benchmarks import generate_dataset, write_sample_sheet
+from inventory.models import Equipment
+
+
+class Command(BaseCommand):
+    help = (
+        'Insert synthetic records and equipment with realistic quarters, statuses and SN formats, '
+        'and/or write an .xlsx in the upload layout (Dossier, Design., Ref, SN, SN Rempl).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=1000)
+        parser.add_argument('--equipment', type=int, default=100000)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same data.')
+        parser.add_argument('--xlsx', help='Also write an upload sheet to this path.')
+        parser.add_argument('--xlsx-rows', type=int, default=10000)
+        parser.add_argument('--sheet-only', action='store_true', help="Only write the sheet, don't touch the database.")
+
+    def handle(self, *args, **options):
+        # Past the SNs of earlier runs
+        offset = Equipment.objects.aggregate(last=Max('id'))['last'] or 0
+        if not options['sheet_only']:
+            with transaction.atomic():
+                generate_dataset(options['records'], options['equipment'], seed=options['seed'], sn_offset=offset)
+            stats.rebuild()
+            self.stdout.write(f"Created {options['records']} records and {options['equipment']} equipment.")
+
+        if options['xlsx']:
+            # SNs of the sheet follow the seeded ones so that the import doesn't reject them.
+            write_sample_sheet(options['xlsx'], options['xlsx_rows'], records=options['records'],
+                               seed=options['seed'], offset=offset + options['equipment'])
+            self.stdout.write(f"Wrote {options['xlsx_rows']} rows to {options['xlsx']}.")
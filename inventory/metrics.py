@@ -0,0 +1,171 @@
+"""In-process request, SQL and export metrics, rendered in the Prometheus text format.
+
+Enabled by the ``METRICS_ENABLED`` setting. MetricsMiddleware times every
+request and labels it with its URL name. The SQL queries a request runs are
+counted by an execute wrapper that is installed on each new database
+connection; it reports into the request held by a context variable, which
+also follows the queries that async views run in ``sync_to_async`` threads.
+
+Each process keeps its own registry. Under several workers, every worker is
+scraped on its own or the values are summed by the collector.
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_current = contextvars.ContextVar('inventory_metrics_request', default=None)
+
+
+def enabled():
+    return getattr(settings, 'METRICS_ENABLED', False)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Counters and histograms keyed by their label values."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}        # (view, method, status) -> count
+        self.latency = {}         # view -> Histogram of seconds
+        self.queries = {}         # view -> Histogram of queries per request
+        self.sql_seconds = {}     # view -> seconds spent in SQL
+        self.exports = {}         # format -> [exports, bytes, seconds]
+
+    def observe_request(self, view, method, status, seconds, queries, sql_seconds):
+        with self.lock:
+            key = (view, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if view not in self.latency:
+                self.latency[view] = Histogram(LATENCY_BUCKETS)
+                self.queries[view] = Histogram(QUERY_BUCKETS)
+                self.sql_seconds[view] = 0.0
+            self.latency[view].observe(seconds)
+            self.queries[view].observe(queries)
+            self.sql_seconds[view] += sql_seconds
+
+    def observe_export(self, format, size, seconds):
+        with self.lock:
+            totals = self.exports.setdefault(format, [0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += size
+            totals[2] += seconds
+
+    def render(self):
+        lines = []
+        with self.lock:
+            _family(lines, 'inventory_http_requests_total', 'counter', 'Requests by URL name, method and status.')
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'inventory_http_requests_total{_labels(view=view, method=method, status=status)} {count}')
+
+            _family(lines, 'inventory_http_request_duration_seconds', 'histogram', 'Request latency by URL name.')
+            for view, histogram in sorted(self.latency.items()):
+                _histogram(lines, 'inventory_http_request_duration_seconds', histogram, view=view)
+
+            _family(lines, 'inventory_db_queries_per_request', 'histogram', 'SQL queries run per request.')
+            for view, histogram in sorted(self.queries.items()):
+                _histogram(lines, 'inventory_db_queries_per_request', histogram, view=view)
+
+            _family(lines, 'inventory_db_query_duration_seconds_total', 'counter', 'Time spent running SQL.')
+            for view, seconds in sorted(self.sql_seconds.items()):
+                lines.append(f'inventory_db_query_duration_seconds_total{_labels(view=view)} {seconds:.6f}')
+
+            _family(lines, 'inventory_exports_total', 'counter', 'Exports served by format.')
+            for format, (count, _, _) in sorted(self.exports.items()):
+                lines.append(f'inventory_exports_total{_labels(format=format)} {count}')
+            _family(lines, 'inventory_export_bytes_total', 'counter', 'Bytes of export files written.')
+            for format, (_, size, _) in sorted(self.exports.items()):
+                lines.append(f'inventory_export_bytes_total{_labels(format=format)} {size}')
+            _family(lines, 'inventory_export_duration_seconds_total', 'counter', 'Time spent producing exports.')
+            for format, (_, _, seconds) in sorted(self.exports.items()):
+                lines.append(f'inventory_export_duration_seconds_total{_labels(format=format)} {seconds:.6f}')
+        return lines
+
+
+def _labels(**labels):
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _family(lines, name, kind, help):
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def _histogram(lines, name, histogram, **labels):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {cumulative}')
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {histogram.count}')
+    lines.append(f'{name}_sum{_labels(**labels)} {histogram.sum:.6f}')
+    lines.append(f'{name}_count{_labels(**labels)} {histogram.count}')
+
+
+registry = Registry()
+
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+def start_request():
+    """Start counting the SQL queries of the current request; pass the token to end_request()."""
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def count_queries(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the current request, if any."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.sql_seconds += time.perf_counter() - start
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """connection_created receiver."""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def observe_export(format, size, seconds):
+    if enabled():
+        registry.observe_export(format, size, seconds)
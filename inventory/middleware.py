@@ -0,0 +1,80 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import audit, metrics
+
+
+class MetricsMiddleware:
+    """Record latency and SQL queries of each request under its URL name.
+
+    Works with both sync and async views, so that it doesn't force a
+    thread switch in front of the async ones. Removed from the stack
+    unless ``METRICS_ENABLED`` is set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics.enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self.observe(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self.observe(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def observe(self, request, response, stats, seconds):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.registry.observe_request(
+            view, request.method, response.status_code, seconds, stats.queries, stats.sql_seconds
+        )
+
+
+class AuditMiddleware:
+    """Attribute the changes logged by inventory.audit to the user of the request."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = audit.start_request(request)
+        try:
+            return self.get_response(request)
+        finally:
+            audit.end_request(token)
+
+    async def __acall__(self, request):
+        token = audit.start_request(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            audit.end_request(token)
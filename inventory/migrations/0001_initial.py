@@ -0,0 +1,42 @@
+# Generated by Django 5.1 on 2026-10-18 12:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Record',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('reception_date', models.DateField(blank=True, null=True)),
+                ('quarter', models.CharField(blank=True, max_length=2, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Equipment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('ref', models.CharField(blank=True, max_length=255, null=True)),
+                ('sn', models.CharField(blank=True, max_length=255, null=True)),
+                ('sn_rempl', models.CharField(blank=True, max_length=255, null=True)),
+                ('reception_date', models.DateField(blank=True, null=True)),
+                ('delivery_status', models.CharField(choices=[('Delivered', 'Delivered'), ('InProgress', 'InProgress')], default='InProgress', max_length=50)),
+                ('delivery_date', models.DateField(blank=True, null=True)),
+                ('bl', models.CharField(choices=[('yes', 'Yes'), ('no', 'No')], default='no', max_length=3)),
+                ('year', models.PositiveIntegerField(blank=True, null=True)),
+                ('quarter', models.CharField(blank=True, max_length=2, null=True)),
+                ('order_index', models.PositiveIntegerField()),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='equipment', to='inventory.record')),
+            ],
+        ),
+    ]
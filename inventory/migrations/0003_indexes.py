@@ -0,0 +1,45 @@
+# Generated by Django 5.1 on 2026-10-18 12:07
+
+from django.db import migrations, models
+
+
+def blank_sn_to_null(apps, schema_editor):
+    Equipment = apps.get_model('inventory', 'Equipment')
+    Equipment.objects.filter(sn='').update(sn=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_importjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(blank_sn_to_null, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='equipment',
+            name='sn',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='record',
+            name='name',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['record', 'order_index'], name='equipment_record_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['record', 'delivery_status'], name='equipment_record_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['delivery_status'], name='equipment_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(fields=['reception_date', 'id'], name='record_reception_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1 on 2026-10-18 12:13
+
+import datetime
+
+from django.db import migrations, models
+
+
+def fill_deadlines(apps, schema_editor):
+    Record = apps.get_model('inventory', 'Record')
+    records = Record.objects.filter(reception_date__isnull=False).only('id', 'reception_date')
+    batch = []
+    for record in records.iterator(chunk_size=2000):
+        record.warning_date = record.reception_date + datetime.timedelta(days=75)
+        record.penalty_date = record.reception_date + datetime.timedelta(days=91)
+        batch.append(record)
+        if len(batch) >= 2000:
+            Record.objects.bulk_update(batch, ['warning_date', 'penalty_date'])
+            batch = []
+    Record.objects.bulk_update(batch, ['warning_date', 'penalty_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='penalty_date',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='warning_date',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_deadlines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_record_sla_deadlines'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['sn_rempl'], name='equipment_sn_rempl_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['year', 'quarter', 'delivery_status', 'reception_date', 'delivery_date'], name='equipment_analytics_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1 on 2026-10-18 12:33
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_rollups(apps, schema_editor):
+    Record = apps.get_model('inventory', 'Record')
+    Equipment = apps.get_model('inventory', 'Equipment')
+
+    def equipment(**filters):
+        return Equipment.objects.filter(record=OuterRef('pk'), **filters).order_by().values('record')
+
+    def count(**filters):
+        return Coalesce(Subquery(equipment(**filters).annotate(count=Count('*')).values('count')), 0)
+
+    Record.objects.update(
+        items_total=count(),
+        items_in_progress=count(delivery_status='InProgress'),
+        items_delivered=count(delivery_status='Delivered'),
+        last_delivery_date=Subquery(equipment().annotate(last=Max('delivery_date')).values('last')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_equipment_analytics_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='items_delivered',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='items_in_progress',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='items_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='last_delivery_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(fields=['items_in_progress', 'id'], name='record_in_progress_idx'),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-18 12:37
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_record_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('r', 'Record'), ('e', 'Equipment')], max_length=1)),
+                ('object_id', models.BigIntegerField()),
+                ('sn', models.CharField(blank=True, max_length=255, null=True)),
+                ('action', models.CharField(choices=[('c', 'Created'), ('u', 'Updated'), ('d', 'Deleted')], max_length=1)),
+                ('changes', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('actor', models.CharField(blank=True, default='', max_length=150)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['sn', 'id'], name='changelog_sn_idx'), models.Index(fields=['kind', 'object_id', 'id'], name='changelog_object_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1 on 2026-10-18 12:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRecord',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(db_index=True, max_length=255)),
+                ('reception_date', models.DateField(blank=True, null=True)),
+                ('quarter', models.CharField(blank=True, max_length=2, null=True)),
+                ('items_total', models.PositiveIntegerField(default=0)),
+                ('last_delivery_date', models.DateField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='changelog',
+            name='action',
+            field=models.CharField(choices=[('c', 'Created'), ('u', 'Updated'), ('d', 'Deleted'), ('a', 'Archived'), ('r', 'Restored')], max_length=1),
+        ),
+        migrations.CreateModel(
+            name='ArchivedEquipment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('ref', models.CharField(blank=True, max_length=255, null=True)),
+                ('sn', models.CharField(blank=True, max_length=255, null=True, unique=True)),
+                ('sn_rempl', models.CharField(blank=True, max_length=255, null=True)),
+                ('reception_date', models.DateField(blank=True, null=True)),
+                ('delivery_status', models.CharField(max_length=50)),
+                ('delivery_date', models.DateField(blank=True, null=True)),
+                ('bl', models.CharField(max_length=3)),
+                ('year', models.PositiveIntegerField(blank=True, null=True)),
+                ('quarter', models.CharField(blank=True, max_length=2, null=True)),
+                ('order_index', models.PositiveIntegerField()),
+                ('updated_at', models.DateTimeField()),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='equipment', to='inventory.archivedrecord')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['record', 'order_index'], name='archived_record_order_idx')],
+            },
+        ),
+    ]
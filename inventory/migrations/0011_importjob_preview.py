@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='summary',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='validated_rows',
+            field=models.FileField(blank=True, upload_to='imports/'),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='status',
+            field=models.CharField(choices=[('Preview', 'Preview'), ('Pending', 'Pending'), ('Running', 'Running'), ('Done', 'Done'), ('Failed', 'Failed')], default='Pending', max_length=20),
+        ),
+    ]
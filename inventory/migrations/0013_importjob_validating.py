@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_importjob_resume'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='status',
+            field=models.CharField(choices=[('Validating', 'Validating'), ('Preview', 'Preview'), ('Pending', 'Pending'), ('Running', 'Running'), ('Done', 'Done'), ('Failed', 'Failed')], default='Pending', max_length=20),
+        ),
+    ]
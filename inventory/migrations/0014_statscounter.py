@@ -0,0 +1,22 @@
+# Generated by Django 5.1 on 2026-10-18 13:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_importjob_validating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsCounter',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -1,34 +1,140 @@
+import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import Case, Count, DurationField, ExpressionWrapper, F, Max, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+# Repair SLA: a warning is shown from day 75 and a penalty is issued from day 91.
+WARNING_DAYS = 75
+PENALTY_DAYS = 91
+
+
+def sla_deadlines(reception_date):
+    """Return the (warning_date, penalty_date) of a record received on ``reception_date``."""
+    if not reception_date:
+        return None, None
+    return (
+        reception_date + datetime.timedelta(days=WARNING_DAYS),
+        reception_date + datetime.timedelta(days=PENALTY_DAYS),
+    )
+
+
+def _equipment_count(**filters):
+    """Correlated subquery counting the equipment of the outer record."""
+    equipment = Equipment.objects.filter(record=OuterRef('pk'), **filters).order_by()
+    return Coalesce(Subquery(equipment.values('record').annotate(count=Count('*')).values('count')), 0)
+
+
+def _last_delivery_date():
+    equipment = Equipment.objects.filter(record=OuterRef('pk')).order_by()
+    return Subquery(equipment.values('record').annotate(last=Max('delivery_date')).values('last'))
+
+
+ROLLUP_FIELDS = ('items_total', 'items_in_progress', 'items_delivered', 'last_delivery_date')
+
+
+def rollup_expressions():
+    """Expressions computing the equipment rollups stored on Record."""
+    return {
+        'items_total': _equipment_count(),
+        'items_in_progress': _equipment_count(delivery_status='InProgress'),
+        'items_delivered': _equipment_count(delivery_status='Delivered'),
+        'last_delivery_date': _last_delivery_date(),
+    }
+
+
+class RecordQuerySet(models.QuerySet):
+    def with_stats(self):
+        """Annotate the value behind repair_duration.
+
+        items_count and status read the stored rollups, so list pages stay
+        a single query on the record table.
+        """
+        today = timezone.now().date()
+        return self.annotate(
+            repair_delta=ExpressionWrapper(Value(today) - F('reception_date'), output_field=DurationField()),
+        )
+
+    def refresh_rollups(self):
+        """Recompute the equipment rollups of these records in one UPDATE.
+
+        updated_at is bumped as well: the rollups are served by the API,
+        whose ETags are built from it.
+        """
+        return self.update(**rollup_expressions(), updated_at=timezone.now())
+
+    def in_warning(self, today=None):
+        """Records at WARNING_DAYS or more, penalized ones included."""
+        return self.filter(warning_date__lte=today or timezone.now().date())
+
+    def penalized(self, today=None):
+        return self.filter(penalty_date__lte=today or timezone.now().date())
+
+    def entering_warning(self, start, end):
+        """Records reaching WARNING_DAYS between ``start`` and ``end`` included."""
+        return self.filter(warning_date__range=(start, end))
+
+    def with_sla(self, today=None, upcoming_days=7):
+        """Annotate ``sla`` with 'penalty', 'warning', 'upcoming' or 'ok'."""
+        today = today or timezone.now().date()
+        return self.annotate(sla=Case(
+            When(penalty_date__lte=today, then=Value('penalty')),
+            When(warning_date__lte=today, then=Value('warning')),
+            When(warning_date__lte=today + datetime.timedelta(days=upcoming_days), then=Value('upcoming')),
+            default=Value('ok'),
+        ))
+
+
 class Record(models.Model):
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, db_index=True)
     reception_date = models.DateField(blank=True, null=True)
     quarter = models.CharField(max_length=2, blank=True, null=True)  # Adding the quarter field
+    # SLA deadlines derived from reception_date, so that they can be range queried
+    warning_date = models.DateField(blank=True, null=True, db_index=True)
+    penalty_date = models.DateField(blank=True, null=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Equipment rollups, kept up to date by the signals and the bulk paths
+    # (see bulk.refresh_rollups) and checked by the rebuild_rollups command
+    items_total = models.PositiveIntegerField(default=0, editable=False)
+    items_in_progress = models.PositiveIntegerField(default=0, editable=False)
+    items_delivered = models.PositiveIntegerField(default=0, editable=False)
+    last_delivery_date = models.DateField(blank=True, null=True, editable=False)
+
+    objects = RecordQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the record list
+            models.Index(fields=['reception_date', 'id'], name='record_reception_idx'),
+            models.Index(fields=['items_in_progress', 'id'], name='record_in_progress_idx'),
+        ]
 
     @property
     def items_count(self):
-        return self.equipment.count()
+        return self.items_total
 
     @property
     def status(self):
-        in_progress_count = self.equipment.filter(delivery_status='InProgress').count()
-        if in_progress_count == 0:
+        if self.items_in_progress == 0:
             return 'closed'
-        return f'{in_progress_count} items left'
+        return f'{self.items_in_progress} items left'
 
     @property
     def repair_duration(self):
+        if hasattr(self, 'repair_delta'):
+            return self.repair_delta.days if self.repair_delta is not None else 0
         if self.reception_date:
             return (timezone.now().date() - self.reception_date).days
         return 0
 
     @property
     def message(self):
-        if 75 <= self.repair_duration <= 90:
-            days_left = 91 - self.repair_duration
+        if WARNING_DAYS <= self.repair_duration < PENALTY_DAYS:
+            days_left = PENALTY_DAYS - self.repair_duration
             return f'You have {days_left} days before penalty.'
-        elif self.repair_duration > 90:
+        elif self.repair_duration >= PENALTY_DAYS:
             return 'Penalty issued!'
         return None
 
@@ -39,6 +145,13 @@ class Record(models.Model):
             self.quarter = quarter_mapping[(self.reception_date.month - 1) // 3 + 1]
         else:
             self.quarter = None  # Set quarter to None if reception_date is not set
+        self.warning_date, self.penalty_date = sla_deadlines(self.reception_date)
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # The rollups on this instance may be stale, only their own UPDATEs write them.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ROLLUP_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -48,7 +161,7 @@ class Equipment(models.Model):
     record = models.ForeignKey(Record, related_name='equipment', on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
     ref = models.CharField(max_length=255, blank=True, null=True)
-    sn = models.CharField(max_length=255, blank=True, null=True)
+    sn = models.CharField(max_length=255, blank=True, null=True, unique=True)
     sn_rempl = models.CharField(max_length=255, blank=True, null=True)
     reception_date = models.DateField(blank=True, null=True)
     delivery_status = models.CharField(
@@ -65,8 +178,23 @@ class Equipment(models.Model):
     year = models.PositiveIntegerField(blank=True, null=True)
     quarter = models.CharField(max_length=2, blank=True, null=True)
     order_index = models.PositiveIntegerField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['record', 'order_index'], name='equipment_record_order_idx'),
+            models.Index(fields=['record', 'delivery_status'], name='equipment_record_status_idx'),
+            models.Index(fields=['delivery_status'], name='equipment_status_idx'),
+            # Delivery sheets may list the replacement SN
+            models.Index(fields=['sn_rempl'], name='equipment_sn_rempl_idx'),
+            # Covers the per-quarter analytics aggregate, which then doesn't read the table
+            models.Index(fields=['year', 'quarter', 'delivery_status', 'reception_date', 'delivery_date'],
+                         name='equipment_analytics_idx'),
+        ]
 
     def save(self, *args, **kwargs):
+        # A blank SN is stored as NULL so that it doesn't collide with the unique constraint
+        self.sn = self.sn or None
         # Automatically update year and quarter based on reception_date
         if self.reception_date:
             self.year = self.reception_date.year
@@ -79,3 +207,132 @@ class Equipment(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class ImportJob(models.Model):
+    file = models.FileField(upload_to='imports/')
+    # A previewed upload is checked by the worker in Validating, then waits in
+    # Preview until it is confirmed (see jobs.validate_job)
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('Validating', 'Validating'), ('Preview', 'Preview'), ('Pending', 'Pending'), ('Running', 'Running'), ('Done', 'Done'),
+            ('Failed', 'Failed'),
+        ],
+        default='Pending'
+    )
+    rows_done = models.PositiveIntegerField(default=0)
+    rows_rejected = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    # Preview counts (importer.Preview.summary) and the rows it accepted, imported on confirmation
+    summary = models.JSONField(default=dict, blank=True)
+    validated_rows = models.FileField(upload_to='imports/', blank=True)
+    # Rows of the source already committed, a job taken over from a stopped worker skips them
+    resume_at = models.PositiveIntegerField(default=0)
+    # Set by the worker after each batch, see jobs.requeue_stale_jobs()
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    @property
+    def is_finished(self):
+        return self.status in ('Done', 'Failed')
+
+    @property
+    def throughput(self):
+        """Rows processed per second since the job was picked up."""
+        if not self.started_at:
+            return 0
+        elapsed = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        if elapsed <= 0:
+            return 0
+        return round(self.rows_done / elapsed, 1)
+
+    def __str__(self):
+        return f'Import #{self.pk} ({self.status})'
+
+
+class ArchivedRecord(models.Model):
+    """A closed Record moved out of the hot tables by the archive_records command (see archive.py)."""
+    # The ids of the live tables are kept, so that a restored record gets its id back
+    id = models.BigIntegerField(primary_key=True)
+    name = models.CharField(max_length=255, db_index=True)
+    reception_date = models.DateField(blank=True, null=True)
+    quarter = models.CharField(max_length=2, blank=True, null=True)
+    items_total = models.PositiveIntegerField(default=0)
+    last_delivery_date = models.DateField(blank=True, null=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.name
+
+
+class ArchivedEquipment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    record = models.ForeignKey(ArchivedRecord, related_name='equipment', on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+    ref = models.CharField(max_length=255, blank=True, null=True)
+    # Unique, so that the importer's duplicate check is an index lookup here too
+    sn = models.CharField(max_length=255, blank=True, null=True, unique=True)
+    sn_rempl = models.CharField(max_length=255, blank=True, null=True)
+    reception_date = models.DateField(blank=True, null=True)
+    delivery_status = models.CharField(max_length=50)
+    delivery_date = models.DateField(blank=True, null=True)
+    bl = models.CharField(max_length=3)
+    year = models.PositiveIntegerField(blank=True, null=True)
+    quarter = models.CharField(max_length=2, blank=True, null=True)
+    order_index = models.PositiveIntegerField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['record', 'order_index'], name='archived_record_order_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class ChangeLog(models.Model):
+    """Append-only field-level diff of a Record or an Equipment, written by inventory.audit."""
+    RECORD = 'r'
+    EQUIPMENT = 'e'
+    CREATED = 'c'
+    UPDATED = 'u'
+    DELETED = 'd'
+    ARCHIVED = 'a'
+    RESTORED = 'r'
+
+    kind = models.CharField(max_length=1, choices=[(RECORD, 'Record'), (EQUIPMENT, 'Equipment')])
+    # Not a foreign key, the entries outlive the objects they describe
+    object_id = models.BigIntegerField()
+    # SN of the equipment when the change was made
+    sn = models.CharField(max_length=255, blank=True, null=True)
+    action = models.CharField(max_length=1, choices=[
+        (CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted'), (ARCHIVED, 'Archived'), (RESTORED, 'Restored'),
+    ])
+    # {field: [old, new]}
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    actor = models.CharField(max_length=150, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sn', 'id'], name='changelog_sn_idx'),
+            models.Index(fields=['kind', 'object_id', 'id'], name='changelog_object_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} #{self.object_id} {self.get_action_display().lower()}'
+
+
+class StatsCounter(models.Model):
+    """A dashboard counter maintained by inventory.stats."""
+    key = models.CharField(max_length=100, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    # When the counters were last recomputed from the database
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.key} = {self.value}'
@@ -0,0 +1,132 @@
+"""Keyset (cursor) pagination.
+
+Pages are fetched with ``WHERE (key) > (last key seen)`` instead of an
+``OFFSET``, so deep pages cost the same as the first one. Orderings are
+lists of ``(field, descending)`` pairs which must end with a unique field
+(usually ``id``); NULLs always sort last.
+"""
+import base64
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'v': values, 'd': direction}, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        values, direction = payload['v'], payload['d']
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values, direction
+
+
+def _after(field, value, descending):
+    if value is None:
+        return None  # Nothing sorts after NULL.
+    return Q(**{f'{field}__{"lt" if descending else "gt"}': value}) | Q(**{f'{field}__isnull': True})
+
+
+def _before(field, value, descending):
+    if value is None:
+        return Q(**{f'{field}__isnull': False})
+    return Q(**{f'{field}__{"gt" if descending else "lt"}': value})
+
+
+def _seek(ordering, values, compare):
+    """Rows strictly after (or before) ``values`` in ``ordering``."""
+    condition = Q(pk__in=[])
+    equal = Q()
+    for (field, descending), value in zip(ordering, values):
+        strict = compare(field, value, descending)
+        if strict is not None:
+            condition |= equal & strict
+        equal &= Q(**{f'{field}__isnull': True}) if value is None else Q(**{field: value})
+    return condition
+
+
+class KeysetPage:
+    def __init__(self, object_list, ordering, has_next, has_previous):
+        self.object_list = object_list
+        self.ordering = ordering
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _cursor(self, obj, direction):
+        if isinstance(obj, dict):  # Rows of a values() queryset
+            values = [obj[field] for field, _ in self.ordering]
+        else:
+            values = [getattr(obj, field) for field, _ in self.ordering]
+        return encode_cursor(values, direction)
+
+    @property
+    def next_cursor(self):
+        return self._cursor(self.object_list[-1], 'next') if self.has_next else None
+
+    @property
+    def previous_cursor(self):
+        return self._cursor(self.object_list[0], 'prev') if self.has_previous else None
+
+
+def _page_query(queryset, ordering, cursor, per_page):
+    direction = 'next'
+    if cursor:
+        values, direction = decode_cursor(cursor)
+        if len(values) != len(ordering):
+            raise InvalidCursor(cursor)
+        compare = _after if direction == 'next' else _before
+        queryset = queryset.filter(_seek(ordering, values, compare))
+
+    if direction == 'next':
+        order_by = [
+            F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+            for field, descending in ordering
+        ]
+    else:
+        order_by = [
+            F(field).asc(nulls_first=True) if descending else F(field).desc(nulls_first=True)
+            for field, descending in ordering
+        ]
+    return queryset.order_by(*order_by)[:per_page + 1], direction
+
+
+def _make_page(rows, ordering, cursor, direction, per_page):
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if direction == 'next':
+        return KeysetPage(rows, ordering, has_next=has_more, has_previous=bool(cursor))
+    rows.reverse()
+    return KeysetPage(rows, ordering, has_next=True, has_previous=has_more)
+
+
+def keyset_paginate(queryset, ordering, cursor=None, per_page=25):
+    """Return the page of ``queryset`` following (or preceding) ``cursor``.
+
+    Raises :class:`InvalidCursor` for malformed cursors.
+    """
+    query, direction = _page_query(queryset, ordering, cursor, per_page)
+    return _make_page(list(query), ordering, cursor, direction, per_page)
+
+
+async def akeyset_paginate(queryset, ordering, cursor=None, per_page=25):
+    """Async version of :func:`keyset_paginate`."""
+    query, direction = _page_query(queryset, ordering, cursor, per_page)
+    return _make_page([row async for row in query], ordering, cursor, direction, per_page)
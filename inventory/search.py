@@ -0,0 +1,134 @@
+"""Substring search over the equipment serial numbers and references.
+
+On SQLite the SN, SN Rempl and Ref columns are mirrored into an FTS5 table
+using the trigram tokenizer, kept in sync by triggers so that bulk inserts
+and ``update()`` calls are covered as well as ``save()``/``delete()``. On
+PostgreSQL the same columns get pg_trgm GIN indexes, which ``icontains``
+lookups use directly. Other backends fall back to plain ``icontains``.
+
+The triggers and indexes are (re)created after every ``migrate`` since
+SQLite drops triggers when a migration rebuilds the equipment table.
+"""
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Equipment
+
+SEARCH_FIELDS = ('sn', 'sn_rempl', 'ref')
+SEARCH_TABLE = 'inventory_equipment_search'
+
+# Trigram matching needs at least three characters.
+MIN_TRIGRAM_LENGTH = 3
+
+_SQLITE_TRIGGERS = {
+    f'{SEARCH_TABLE}_ai': f"""
+        CREATE TRIGGER {SEARCH_TABLE}_ai AFTER INSERT ON inventory_equipment BEGIN
+            INSERT INTO {SEARCH_TABLE}(rowid, sn, sn_rempl, ref) VALUES (new.id, new.sn, new.sn_rempl, new.ref);
+        END
+    """,
+    f'{SEARCH_TABLE}_ad': f"""
+        CREATE TRIGGER {SEARCH_TABLE}_ad AFTER DELETE ON inventory_equipment BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, sn, sn_rempl, ref)
+            VALUES ('delete', old.id, old.sn, old.sn_rempl, old.ref);
+        END
+    """,
+    f'{SEARCH_TABLE}_au': f"""
+        CREATE TRIGGER {SEARCH_TABLE}_au AFTER UPDATE OF sn, sn_rempl, ref ON inventory_equipment BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, sn, sn_rempl, ref)
+            VALUES ('delete', old.id, old.sn, old.sn_rempl, old.ref);
+            INSERT INTO {SEARCH_TABLE}(rowid, sn, sn_rempl, ref) VALUES (new.id, new.sn, new.sn_rempl, new.ref);
+        END
+    """,
+}
+
+# Whether the FTS5 table is usable, per database alias.
+_fts_available = {}
+
+
+def install(using='default'):
+    """Create the search table/indexes if missing, rebuilding stale ones."""
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        _fts_available[using] = _install_sqlite(connection)
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for field in SEARCH_FIELDS:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS inventory_equipment_{field}_trgm '
+                    f'ON inventory_equipment USING gin ((UPPER({field}::text)) gin_trgm_ops)'
+                )
+
+
+def _install_sqlite(connection):
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                f"sn, sn_rempl, ref, content='inventory_equipment', content_rowid='id', tokenize='trigram')"
+            )
+        except DatabaseError:
+            # SQLite built without FTS5 or older than 3.34 (no trigram tokenizer).
+            return False
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'inventory_equipment'")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in _SQLITE_TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(_SQLITE_TRIGGERS[name])
+        if missing:
+            # Writes made while the triggers were missing aren't indexed.
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def rebuild(using='default'):
+    """Rebuild the SQLite search table from the equipment table."""
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and _uses_fts(using):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for field in SEARCH_FIELDS:
+                cursor.execute(f'REINDEX INDEX inventory_equipment_{field}_trgm')
+
+
+def _uses_fts(using):
+    if using not in _fts_available:
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE])
+            _fts_available[using] = cursor.fetchone() is not None
+    return _fts_available[using]
+
+
+def _fts_query(query, fields):
+    phrase = '"' + query.replace('"', '""') + '"'
+    return '{' + ' '.join(fields) + '} : ' + phrase
+
+
+def search_equipment(query, fields=SEARCH_FIELDS, queryset=None, limit=None):
+    """Filter ``queryset`` to equipment whose ``fields`` contain ``query``.
+
+    Matching is a case-insensitive substring match, like ``icontains``.
+    ``limit`` caps the number of matches looked up in the search table,
+    which keeps type-ahead lookups cheap on very common substrings.
+    """
+    if queryset is None:
+        queryset = Equipment.objects.all()
+    query = query.strip()
+    if not query:
+        return queryset
+    using = queryset.db
+    if (connections[using].vendor == 'sqlite' and len(query) >= MIN_TRIGRAM_LENGTH
+            and _uses_fts(using)):
+        sql = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+        params = [_fts_query(query, fields)]
+        if limit:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        return queryset.filter(id__in=RawSQL(sql, params))
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': query})
+    return queryset.filter(condition)
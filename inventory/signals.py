@@ -0,0 +1,66 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import analytics, audit, stats
+from .models import Record, Equipment
+from .bulk import refresh_rollups
+
+
+@receiver(pre_save, sender=Record)
+def remember_record(sender, instance, **kwargs):
+    instance._previous = None
+    if instance.pk:
+        instance._previous = Record.objects.filter(pk=instance.pk).values('quarter', *audit.RECORD_FIELDS).first()
+
+
+@receiver(post_save, sender=Record)
+def record_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    if created or previous is None:
+        stats.add_record(instance.quarter)
+        audit.write(audit.created([instance]))
+    else:
+        stats.move_record(previous['quarter'], instance.quarter)
+        audit.write([audit.updated(instance, previous)])
+
+
+@receiver(post_delete, sender=Record)
+def record_deleted(sender, instance, **kwargs):
+    stats.add_record(instance.quarter, -1)
+    audit.write([audit.deleted(instance)])
+
+
+@receiver(pre_save, sender=Equipment)
+def remember_equipment(sender, instance, **kwargs):
+    instance._previous = None
+    if instance.pk:
+        instance._previous = Equipment.objects.filter(pk=instance.pk).values(
+            'quarter', *audit.EQUIPMENT_FIELDS
+        ).first()
+
+
+@receiver(post_save, sender=Equipment)
+def equipment_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    if created or previous is None:
+        stats.add_equipment(instance.quarter, instance.delivery_status)
+        refresh_rollups([instance.record_id])
+        audit.write(audit.created([instance]))
+    else:
+        stats.move_equipment(previous['quarter'], previous['delivery_status'],
+                             instance.quarter, instance.delivery_status)
+        # Turnaround also depends on the dates, which the counters don't track
+        analytics.invalidate_on_commit()
+        if (previous['record_id'], previous['delivery_status'], previous['delivery_date']) != (
+                instance.record_id, instance.delivery_status, instance.delivery_date):
+            refresh_rollups([previous['record_id'], instance.record_id])
+        audit.write([audit.updated(instance, previous)])
+
+
+@receiver(post_delete, sender=Equipment)
+def equipment_deleted(sender, instance, origin=None, **kwargs):
+    stats.add_equipment(instance.quarter, instance.delivery_status, -1)
+    # No point in refreshing a record that is being deleted with its equipment
+    if not (isinstance(origin, Record) or getattr(origin, 'model', None) is Record):
+        refresh_rollups([instance.record_id])
+    audit.write([audit.deleted(instance)])
@@ -0,0 +1,46 @@
+"""Reading and writing of ``.xlsx`` files.
+
+openpyxl and xlsxwriter take tens of milliseconds and several MiB to
+import, pandas far more, and only the upload, delivery sheet and download
+paths need them. This module is therefore only imported from inside the
+functions that read or write a sheet, so that web workers, management
+commands and the test runner don't load any of them until a spreadsheet is
+actually handled. ``tests.StartupTests`` keeps it that way.
+"""
+import xlsxwriter
+from openpyxl import load_workbook
+
+
+def iter_rows(excel_file):
+    """Yield the rows of the first worksheet as tuples of cell values.
+
+    The workbook is streamed with openpyxl's read-only mode, so memory stays
+    flat whatever the size of the sheet.
+    """
+    workbook = load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_dataframe(excel_file):
+    """Load the first worksheet into a pandas DataFrame."""
+    import pandas as pd
+
+    return pd.read_excel(excel_file)
+
+
+def workbook(output):
+    """An xlsxwriter workbook in ``constant_memory`` mode, which flushes each row once the next one is started."""
+    return xlsxwriter.Workbook(output, {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd'})
+
+
+def write_sheet(output, header, rows):
+    """Write ``header`` and ``rows`` as the only worksheet of a new workbook."""
+    book = workbook(output)
+    worksheet = book.add_worksheet()
+    worksheet.write_row(0, 0, header)
+    for i, row in enumerate(rows, start=1):
+        worksheet.write_row(i, 0, row)
+    book.close()
@@ -0,0 +1,162 @@
+"""Dashboard counters kept in the StatsCounter table.
+
+Totals and per-quarter/per-status breakdowns are computed once with a few
+aggregate queries, then maintained incrementally by the model signals and
+the bulk import. Anything that can't be tracked cheaply (bulk updates)
+simply drops the counters, which are rebuilt on the next read. Either way
+the cached analytics are dropped too.
+
+The deltas are added by the database with ``F()`` expressions, so the web
+processes and the import workers can't overwrite each other's increments
+as a read-then-write cache counter would. The counters are also recomputed
+once they are INVENTORY_STATS_TIMEOUT seconds old.
+"""
+import datetime
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+from django.utils import timezone
+
+from . import analytics
+from .models import Record, Equipment, StatsCounter
+
+QUARTERS = ['Q1', 'Q2', 'Q3', 'Q4', None]
+STATUSES = [value for value, _ in Equipment._meta.get_field('delivery_status').choices]
+
+
+def _timeout():
+    return getattr(settings, 'INVENTORY_STATS_TIMEOUT', 3600)
+
+
+def _key(*parts):
+    return ':'.join('none' if part is None else str(part) for part in parts)
+
+
+def _all_keys():
+    keys = [_key('records'), _key('equipment')]
+    keys += [_key('records', 'quarter', quarter) for quarter in QUARTERS]
+    keys += [_key('equipment', 'quarter', quarter) for quarter in QUARTERS]
+    keys += [_key('equipment', 'status', status) for status in STATUSES]
+    return keys
+
+
+def compute():
+    """Count everything from the database."""
+    values = dict.fromkeys(_all_keys(), 0)
+    values[_key('records')] = Record.objects.count()
+    values[_key('equipment')] = Equipment.objects.count()
+    for row in Record.objects.order_by().values('quarter').annotate(count=Count('id')):
+        values[_key('records', 'quarter', row['quarter'])] = row['count']
+    for row in Equipment.objects.order_by().values('quarter', 'delivery_status').annotate(count=Count('id')):
+        values[_key('equipment', 'quarter', row['quarter'])] += row['count']
+        values[_key('equipment', 'status', row['delivery_status'])] += row['count']
+    return values
+
+
+def rebuild():
+    values = compute()
+    computed_at = timezone.now()
+    # An upsert, so that two rebuilds running at once (a dashboard read after
+    # invalidate() and rebuild_stats, say) don't collide on the keys.
+    StatsCounter.objects.bulk_create(
+        [StatsCounter(key=key, value=value, computed_at=computed_at) for key, value in values.items()],
+        update_conflicts=True, unique_fields=['key'], update_fields=['value', 'computed_at'],
+    )
+    return values
+
+
+def invalidate():
+    StatsCounter.objects.all().delete()
+    analytics.invalidate()
+
+
+def get_stats():
+    """Return the dashboard counters, rebuilding them if any is missing or they are too old."""
+    rows = list(StatsCounter.objects.values_list('key', 'value', 'computed_at'))
+    values = {key: value for key, value, _ in rows}
+    expired = timezone.now() - datetime.timedelta(seconds=_timeout())
+    if set(_all_keys()) - values.keys() or any(computed_at < expired for _, _, computed_at in rows):
+        values = rebuild()
+    return {
+        'records': values[_key('records')],
+        'equipment': values[_key('equipment')],
+        'records_by_quarter': {q or 'None': values[_key('records', 'quarter', q)] for q in QUARTERS},
+        'equipment_by_quarter': {q or 'None': values[_key('equipment', 'quarter', q)] for q in QUARTERS},
+        'equipment_by_status': {s: values[_key('equipment', 'status', s)] for s in STATUSES},
+        'by_quarter': [
+            {
+                'quarter': q or 'None',
+                'records': values[_key('records', 'quarter', q)],
+                'equipment': values[_key('equipment', 'quarter', q)],
+            }
+            for q in QUARTERS
+        ],
+    }
+
+
+def equipment_count():
+    """Number of equipment, from the dashboard counters."""
+    count = StatsCounter.objects.filter(key=_key('equipment')).values_list('value', flat=True).first()
+    return get_stats()['equipment'] if count is None else count
+
+
+def _apply(deltas):
+    analytics.invalidate()
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updated = StatsCounter.objects.filter(key__in=deltas).update(
+        value=F('value') + Case(*(When(key=key, then=Value(delta)) for key, delta in deltas.items()), default=Value(0))
+    )
+    if updated != len(deltas):
+        # Counter missing: everything is recomputed on the next read.
+        invalidate()
+
+
+def _on_commit(deltas):
+    """Apply ``deltas`` once the current transaction commits."""
+    transaction.on_commit(lambda: _apply(deltas))
+
+
+def add_record(quarter, delta=1):
+    _on_commit({_key('records'): delta, _key('records', 'quarter', quarter): delta})
+
+
+def add_equipment(quarter, status, delta=1):
+    _on_commit({
+        _key('equipment'): delta,
+        _key('equipment', 'quarter', quarter): delta,
+        _key('equipment', 'status', status): delta,
+    })
+
+
+def move_record(old_quarter, new_quarter):
+    if old_quarter != new_quarter:
+        _on_commit({_key('records', 'quarter', old_quarter): -1, _key('records', 'quarter', new_quarter): 1})
+
+
+def move_equipment(old_quarter, old_status, new_quarter, new_status):
+    move_equipment_many([(old_quarter, old_status, new_quarter, new_status)])
+
+
+def move_equipment_many(moves):
+    """:func:`move_equipment` for many equipment at once, applied as one set of deltas.
+
+    ``moves`` are ``(old_quarter, old_status, new_quarter, new_status)`` tuples.
+    """
+    deltas = Counter()
+    for old_quarter, old_status, new_quarter, new_status in moves:
+        if old_quarter != new_quarter:
+            deltas[_key('equipment', 'quarter', old_quarter)] -= 1
+            deltas[_key('equipment', 'quarter', new_quarter)] += 1
+        if old_status != new_status:
+            deltas[_key('equipment', 'status', old_status)] -= 1
+            deltas[_key('equipment', 'status', new_status)] += 1
+    if any(deltas.values()):
+        _on_commit(dict(deltas))
+
+
+def invalidate_on_commit():
+    transaction.on_commit(invalidate)
@@ -1,3 +1,1016 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .benchmarks import generate_dataset, write_sample_sheet
+from .importer import dump_rows, import_rows, load_rows, read_rows, read_rows_dataframe, validate_rows
+from . import importer
+from .jobs import process_pending_jobs
+from .models import ArchivedEquipment, ArchivedRecord, ChangeLog, Record, Equipment, ImportJob, StatsCounter
+from .pagination import keyset_paginate
+from .search import search_equipment
+from . import analytics, audit, bulk, metrics, spreadsheets, stats
+from .views import RECORD_SORTS
+
+
+def sheet_row(record_name='D1', name='Router', ref='R-1', sn='SN1', sn_rempl=None):
+    return {'record_name': record_name, 'name': name, 'ref': ref, 'sn': sn, 'sn_rempl': sn_rempl}
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def excel_upload(rows, name='sheet.xlsx', columns=('Dossier', 'Design.', 'Ref', 'SN', 'SN Rempl')):
+    output = io.BytesIO()
+    spreadsheets.write_sheet(output, columns, rows)
+    return SimpleUploadedFile(name, output.getvalue())
+
+
+class ImporterTests(TestCase):
+    def test_creates_records_and_equipment(self):
+        rows = [(0, sheet_row(sn='A')), (1, sheet_row(sn='B')), (2, sheet_row(record_name='D2', sn='C'))]
+        result = import_rows(rows)
+        self.assertEqual(result.created_records, 2)
+        self.assertEqual(result.created_equipment, 3)
+        self.assertEqual(result.errors, [])
+        self.assertEqual(
+            list(Equipment.objects.order_by('order_index').values_list('record__name', 'sn', 'order_index')),
+            [('D1', 'A', 1), ('D1', 'B', 2), ('D2', 'C', 3)],
+        )
+
+    def test_rejects_missing_fields_and_duplicates(self):
+        record = Record.objects.create(name='D1')
+        Equipment.objects.create(record=record, name='Old', sn='A', order_index=1)
+        rows = [
+            (0, sheet_row(sn='A')),
+            (1, sheet_row(sn=None)),
+            (2, sheet_row(sn='B')),
+            (3, sheet_row(sn='B')),
+        ]
+        result = import_rows(rows, batch_size=2)
+        self.assertEqual(result.created_records, 0)
+        self.assertEqual(result.created_equipment, 1)
+        self.assertEqual([(e.row, str(e)) for e in result.errors], [
+            (1, 'Equipment with SN A already exists and was not added.'),
+            (2, 'Missing required data in row 2.'),
+            (4, 'Equipment with SN B already exists and was not added.'),
+        ])
+
+    def test_query_count_is_independent_of_row_count(self):
+        rows = [(i, sheet_row(record_name=f'D{i % 5}', sn=f'SN{i}')) for i in range(2000)]
+        with CaptureQueriesContext(connection) as queries:
+            import_rows(rows)
+        self.assertEqual(Equipment.objects.count(), 2000)
+        self.assertLess(len(queries), 50)
+
+    def test_validate_rows_writes_nothing(self):
+        record = Record.objects.create(name='D1')
+        Equipment.objects.create(record=record, name='Old', sn='A', order_index=1)
+        rows = [
+            (0, sheet_row(sn='A')),
+            (1, sheet_row(sn=None)),
+            (2, sheet_row(record_name='D2', sn='B')),
+            (3, sheet_row(sn='B')),
+            (4, sheet_row(sn='C')),
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            preview = validate_rows(rows)
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in queries))
+        self.assertEqual([row['sn'] for _, row in preview.valid], ['B', 'C'])
+        self.assertEqual([(e.row, str(e)) for e in preview.errors], [
+            (1, 'Equipment with SN A already exists and was not added.'),
+            (2, 'Missing required data in row 2.'),
+            (4, 'SN B is repeated in the file (first in row 3) and was not added.'),
+        ])
+        self.assertEqual(preview.summary(), {
+            'rows': 5, 'new_records': 1, 'existing_records': 1, 'new_equipment': 2,
+            'incomplete': 1, 'existing': 1, 'archived': 0, 'repeated': 1, 'new_record_names': ['D2'],
+        })
+
+        output = io.BytesIO()
+        dump_rows(preview.valid, output)
+        output.seek(0)
+        self.assertEqual(list(load_rows(output)), preview.valid)
+
+
+class ReaderTests(TestCase):
+    def test_streaming_reader_matches_pandas(self):
+        upload = excel_upload([
+            ['D1', 'Router', 'R-1', 12345, None],
+            [None, None, None, None, None],
+            ['D1', 'Switch', None, 'A-2', 'B-2'],
+        ])
+        streamed = list(read_rows(io.BytesIO(upload.read())))
+        upload.seek(0)
+        self.assertEqual(streamed, list(read_rows_dataframe(upload)))
+        self.assertEqual(streamed[2], (2, sheet_row(name='Switch', ref=None, sn='A-2', sn_rempl='B-2')))
+
+
+class ImportJobTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, CACHES=LOCMEM_CACHES)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_upload_is_queued_and_processed(self):
+        upload = excel_upload([
+            ['D1', 'Router', 'R-1', 'A', None],
+            ['D1', 'Switch', None, 'A', None],
+            ['D2', None, None, 'B', None],
+        ])
+        response = self.client.post(reverse('home'), {'file': upload})
+        job = ImportJob.objects.get()
+        self.assertRedirects(response, f"{reverse('home')}?job={job.pk}")
+        self.assertEqual(job.status, 'Pending')
+        self.assertEqual(Equipment.objects.count(), 0)
+
+        self.assertEqual(process_pending_jobs(), 1)
+
+        status = self.client.get(reverse('import_status', args=[job.pk])).json()
+        self.assertEqual(status['status'], 'Done')
+        self.assertEqual(status['rows_done'], 3)
+        self.assertEqual(status['rows_rejected'], 2)
+        self.assertEqual(status['errors'], [
+            'Equipment with SN A already exists and was not added.',
+            'Missing required data in row 3.',
+        ])
+        self.assertEqual(list(Equipment.objects.values_list('sn', flat=True)), ['A'])
+
+    def test_preview_then_confirm(self):
+        upload = excel_upload([
+            ['D1', 'Router', 'R-1', 'A', None],
+            ['D1', 'Switch', None, 'A', None],
+            ['D2', 'Hub', None, 'B', None],
+        ])
+        response = self.client.post(reverse('home'), {'file': upload, 'preview': ''})
+        job = ImportJob.objects.get()
+        self.assertRedirects(response, f"{reverse('home')}?job={job.pk}")
+        # Validated by the worker, not in the request
+        self.assertEqual(job.status, 'Validating')
+        self.assertEqual(process_pending_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'Preview')
+        self.assertEqual(job.summary['new_equipment'], 2)
+        self.assertEqual(job.summary['new_records'], 2)
+        self.assertFalse(Record.objects.exists())
+        self.assertContains(self.client.get(response.url), 'Import 2 equipment')
+        # Not queued before confirmation
+        self.assertEqual(process_pending_jobs(), 0)
+
+        # Taken between the preview and the import
+        Equipment.objects.create(record=Record.objects.create(name='D3'), name='Hub', sn='B', order_index=1)
+        self.client.post(reverse('confirm_import', args=[job.pk]))
+        self.assertEqual(process_pending_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'Done')
+        self.assertEqual((job.rows_done, job.rows_rejected), (3, 2))
+        self.assertEqual(job.errors, [
+            'SN A is repeated in the file (first in row 1) and was not added.',
+            'Equipment with SN B already exists and was not added.',
+        ])
+        self.assertEqual(sorted(Equipment.objects.values_list('sn', 'record__name')), [('A', 'D1'), ('B', 'D3')])
+
+    def test_failed_job_keeps_committed_progress(self):
+        self.client.post(reverse('home'), {'file': excel_upload(
+            [['D1', 'Router', None, f'SN{i}', None] for i in range(2500)] + [['D1', 'Router', None, 'SN0', None]]
+        )})
+        import_batch = importer._import_batch
+        calls = []
+
+        def fail_third(*args):
+            calls.append(args)
+            if len(calls) == 3:
+                raise RuntimeError('disk full')
+            return import_batch(*args)
+
+        with mock.patch.object(importer, '_import_batch', fail_third):
+            process_pending_jobs()
+        job = ImportJob.objects.get()
+        self.assertEqual((job.status, job.rows_done, job.rows_rejected, job.resume_at), ('Failed', 2000, 0, 2000))
+        self.assertEqual(job.errors, ['An error occurred: disk full'])
+        self.assertEqual(Equipment.objects.count(), 2000)
+
+    def test_stale_running_job_is_resumed(self):
+        self.client.post(reverse('home'), {'file': excel_upload(
+            [['D1', 'Router', None, f'SN{i}', None] for i in range(3)]
+        )})
+        # A worker stopped after committing the first row
+        job = ImportJob.objects.get()
+        import_rows([(0, sheet_row(sn='SN0'))])
+        ImportJob.objects.filter(pk=job.pk).update(
+            status='Running', started_at=timezone.now(), rows_done=1, resume_at=1,
+            heartbeat_at=timezone.now() - datetime.timedelta(hours=1),
+        )
+        self.assertEqual(process_pending_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_done, job.rows_rejected), ('Done', 3, 0))
+        self.assertEqual(Equipment.objects.count(), 3)
+
+    def test_discard_preview(self):
+        self.client.post(reverse('home'), {'file': excel_upload([['D1', 'Router', None, 'A', None]]), 'preview': ''})
+        process_pending_jobs()
+        job = ImportJob.objects.get()
+        self.client.post(reverse('confirm_import', args=[job.pk]), {'discard': ''})
+        self.assertFalse(ImportJob.objects.exists())
+        self.assertFalse(Equipment.objects.exists())
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_upload_spooled_to_disk_is_accepted(self):
+        response = self.client.post(reverse('home'), {'file': excel_upload([['D1', 'Router', None, 'A', None]])})
+        self.assertEqual(response.status_code, 302)
+        process_pending_jobs()
+        self.assertEqual(ImportJob.objects.get().status, 'Done')
+        self.assertTrue(Equipment.objects.filter(sn='A').exists())
+
+
+class RecordListTests(TestCase):
+    def setUp(self):
+        today = timezone.now().date()
+        for i, days in enumerate([10, 80, 120]):
+            record = Record.objects.create(name=f'D{i}', reception_date=today - datetime.timedelta(days=days))
+            for j in range(3):
+                Equipment.objects.create(
+                    record=record, name='Router', sn=f'{i}-{j}', order_index=j,
+                    delivery_status='Delivered' if j < i else 'InProgress',
+                )
+        Record.objects.create(name='Empty')
+
+    def test_annotated_values_match_properties(self):
+        for record in Record.objects.with_stats():
+            plain = Record.objects.get(pk=record.pk)
+            self.assertEqual(record.items_count, plain.items_count)
+            self.assertEqual(record.status, plain.status)
+            self.assertEqual(record.repair_duration, plain.repair_duration)
+            self.assertEqual(record.message, plain.message)
+
+    def test_record_list_query_count_is_constant(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('record_list'))
+        self.assertContains(response, '1 items left')
+        self.assertContains(response, 'You have 11 days before penalty.')
+        self.assertContains(response, 'Penalty issued!')
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        today = timezone.now().date()
+        for i in range(23):
+            reception_date = None if i % 5 == 0 else today - datetime.timedelta(days=i % 7)
+            record = Record.objects.create(name=f'D{i}', reception_date=reception_date)
+            for j in range(i % 4):
+                Equipment.objects.create(record=record, name='Router', sn=f'{i}-{j}', order_index=j)
+
+    def walk(self, queryset, ordering, per_page):
+        pages, cursor = [], None
+        while True:
+            page = keyset_paginate(queryset, ordering, cursor, per_page)
+            pages.append(page)
+            if not page.has_next:
+                return pages
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_record_once_in_order(self):
+        records = Record.objects.with_stats()
+        for sort, ordering in RECORD_SORTS.items():
+            with self.subTest(sort=sort):
+                pages = self.walk(records, ordering, per_page=4)
+                seen = [record.pk for page in pages for record in page]
+                self.assertEqual(len(seen), 23)
+                self.assertEqual(len(set(seen)), 23)
+                field, descending = ordering[0]
+                values = [(getattr(r, field), r.pk) for page in pages for r in page]
+                non_null = sorted((v for v in values if v[0] is not None), reverse=descending)
+                nulls = sorted((v for v in values if v[0] is None), key=lambda v: v[1], reverse=descending)
+                self.assertEqual(values, non_null + nulls)
+
+                # Walking back from the last page gives the same pages.
+                page = pages[-1]
+                for previous in reversed(pages[:-1]):
+                    page = keyset_paginate(records, ordering, page.previous_cursor, 4)
+                    self.assertEqual([r.pk for r in page], [r.pk for r in previous])
+                self.assertFalse(page.has_previous)
+
+    def test_record_list_filters(self):
+        today = timezone.now().date()
+        Record.objects.create(name='Late', reception_date=today - datetime.timedelta(days=80))
+        Record.objects.create(name='Penalty', reception_date=today - datetime.timedelta(days=100))
+        response = self.client.get(reverse('record_list'), {'penalty': 'warning'})
+        self.assertEqual([r.name for r in response.context['records']], ['Late', 'Penalty'])
+        response = self.client.get(reverse('record_list'), {'penalty': 'penalty', 'sort': 'duration'})
+        self.assertEqual([r.name for r in response.context['records']], ['Penalty'])
+        response = self.client.get(reverse('record_list'), {'cursor': 'garbage'})
+        self.assertEqual(len(response.context['records']), 25)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.record = Record.objects.create(name='D1')
+        Equipment.objects.bulk_create([
+            Equipment(record=self.record, name='Router', sn='ABC12345', ref='REF-XYZ', order_index=1),
+            Equipment(record=self.record, name='Switch', sn='ZZ999', sn_rempl='abc777', order_index=2),
+        ])
+
+    def sns(self, query, **kwargs):
+        return sorted(search_equipment(query, **kwargs).values_list('sn', flat=True))
+
+    def test_substring_match_on_all_fields(self):
+        self.assertEqual(self.sns('c123'), ['ABC12345'])
+        self.assertEqual(self.sns('abc'), ['ABC12345', 'ZZ999'])
+        self.assertEqual(self.sns('abc', fields=('sn',)), ['ABC12345'])
+        self.assertEqual(self.sns('xyz'), ['ABC12345'])
+        self.assertEqual(self.sns('99'), ['ZZ999'])
+
+    def test_index_follows_writes(self):
+        equipment = Equipment.objects.get(sn='ZZ999')
+        equipment.sn = 'NEW-0001'
+        equipment.save()
+        Equipment.objects.filter(sn='ABC12345').update(sn_rempl='UPD-42')
+        self.assertEqual(self.sns('ZZ999'), [])
+        self.assertEqual(self.sns('w-000'), ['NEW-0001'])
+        self.assertEqual(self.sns('upd-4'), ['ABC12345'])
+        equipment.delete()
+        self.assertEqual(self.sns('w-000'), [])
+
+    def test_search_endpoint(self):
+        response = self.client.get(reverse('equipment_search'), {'q': '2345'})
+        self.assertEqual([r['sn'] for r in response.json()['results']], ['ABC12345'])
+        response = self.client.get(reverse('equipment_list'), {'sn': 'zz9'})
+        self.assertEqual([e.sn for e in response.context['equipments']], ['ZZ999'])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        for name, reception_date in [('D1', datetime.date(2024, 2, 1)), ('D2', datetime.date(2024, 5, 1))]:
+            record = Record.objects.create(name=name, reception_date=reception_date)
+            for i in range(3):
+                Equipment.objects.create(
+                    record=record, name='Router', sn=f'{name}-{i}', order_index=3 - i,
+                    reception_date=reception_date,
+                )
+        self.record = Record.objects.get(name='D1')
+
+    def test_download_record_xlsx(self):
+        response = self.client.get(reverse('download_record', args=[self.record.pk]))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="D1_data.xlsx"')
+        header, *rows = spreadsheets.iter_rows(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(header[:3], ('Name', 'Ref', 'SN'))
+        self.assertEqual([row[2] for row in rows], ['D1-2', 'D1-1', 'D1-0'])
+        self.assertEqual([row[9] for row in rows], ['Q1'] * 3)
+
+    def test_download_record_csv(self):
+        response = self.client.get(reverse('download_record', args=[self.record.pk]), {'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0], 'Name,Ref,SN,SN Rempl,Reception Date,Delivery Status,Delivery Date,BL,Year,Quarter')
+        self.assertEqual(lines[1], 'Router,,D1-2,,2024-02-01,InProgress,,no,2024,Q1')
+        self.assertEqual(len(lines), 4)
+
+    def test_export_quarter(self):
+        response = self.client.get(reverse('export_records'), {'quarter': 'Q2', 'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertTrue(lines[0].startswith('Record,Name,'))
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], ['D2'] * 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_counters_follow_writes(self):
+        self.assertEqual(stats.get_stats()['records'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            record = Record.objects.create(name='D1', reception_date=datetime.date(2024, 1, 5))
+            equipment = Equipment.objects.create(record=record, name='Router', sn='A', order_index=1,
+                                                 reception_date=record.reception_date)
+            import_rows([(0, sheet_row(record_name='D2', sn='B')), (1, sheet_row(record_name='D2', sn='C'))])
+            equipment.delivery_status = 'Delivered'
+            equipment.save()
+            Equipment.objects.get(sn='C').delete()
+
+        with self.assertNumQueries(1):
+            cached = stats.get_stats()
+        self.assertEqual(cached['records'], 2)
+        self.assertEqual(cached['equipment'], 2)
+        self.assertEqual(cached['equipment_by_status'], {'Delivered': 1, 'InProgress': 1})
+        self.assertEqual(cached['equipment_by_quarter']['Q1'], 1)
+        self.assertEqual(cached['records_by_quarter']['None'], 1)
+
+        stats.invalidate()
+        self.assertEqual(stats.get_stats(), cached)
+
+    def test_deltas_are_added_by_the_database(self):
+        stats.rebuild()
+        # As two processes that both read 0 before writing would have done
+        stats._apply({stats._key('records'): 1})
+        stats._apply({stats._key('records'): 1, stats._key('records', 'quarter', None): 2})
+        self.assertEqual(stats.get_stats()['records'], 2)
+        self.assertEqual(stats.get_stats()['records_by_quarter']['None'], 2)
+
+    def test_rebuild_over_existing_counters(self):
+        stats.rebuild()
+        Record.objects.create(name='D1')
+        # No delete before the insert, the existing keys are updated in place
+        self.assertEqual(stats.rebuild()[stats._key('records')], 1)
+        self.assertEqual(StatsCounter.objects.get(key=stats._key('records')).value, 1)
+
+    def test_old_counters_are_recomputed(self):
+        stats.rebuild()
+        StatsCounter.objects.filter(key=stats._key('records')).update(
+            value=5, computed_at=timezone.now() - datetime.timedelta(days=1),
+        )
+        self.assertEqual(stats.get_stats()['records'], 0)
+
+    def test_rolled_back_writes_are_not_counted(self):
+        stats.get_stats()
+        with self.captureOnCommitCallbacks(execute=False):
+            Record.objects.create(name='D1')
+        self.assertEqual(stats.get_stats()['records'], 0)
+
+
+class SlaTests(TestCase):
+    def test_deadlines_follow_reception_date(self):
+        record = Record.objects.create(name='D1', reception_date=datetime.date(2024, 1, 1))
+        self.assertEqual(record.warning_date, datetime.date(2024, 3, 16))
+        self.assertEqual(record.penalty_date, datetime.date(2024, 4, 1))
+        response = self.client.post(reverse('edit_record', args=[record.pk]), {'name': 'D1', 'reception_date': ''})
+        self.assertEqual(response.status_code, 302)
+        record.refresh_from_db()
+        self.assertIsNone(record.penalty_date)
+
+    def test_penalty_report(self):
+        today = datetime.date(2024, 6, 1)
+        for name, days in [('Ok', 10), ('Soon', 70), ('Warning', 80), ('Penalty', 95), ('Closed', 120)]:
+            record = Record.objects.create(name=name, reception_date=today - datetime.timedelta(days=days))
+            Equipment.objects.create(record=record, name='Router', sn=name, order_index=1,
+                                     delivery_status='Delivered' if name == 'Closed' else 'InProgress')
+        self.assertEqual(
+            sorted(Record.objects.with_sla(today).values_list('name', 'sla')),
+            [('Closed', 'penalty'), ('Ok', 'ok'), ('Penalty', 'penalty'), ('Soon', 'upcoming'), ('Warning', 'warning')],
+        )
+        output, summary = io.StringIO(), io.StringIO()
+        call_command('penalty_report', date=today, stdout=output, stderr=summary)
+        rows = list(csv.reader(io.StringIO(output.getvalue())))
+        self.assertEqual([row[0] for row in rows[1:]], ['Penalty', 'Warning', 'Soon'])
+        self.assertIn('1 penalty, 1 warning, 1 upcoming, 1 ok', summary.getvalue())
+
+
+class BulkUpdateTests(TestCase):
+    def setUp(self):
+        self.record = Record.objects.create(name='D1', reception_date=datetime.date(2024, 2, 10))
+        self.other = Record.objects.create(name='D2', reception_date=datetime.date(2024, 8, 1))
+        for i in range(5):
+            Equipment.objects.create(record=self.record, name='Router', sn=f'SN{i}', order_index=i,
+                                     reception_date=self.record.reception_date)
+
+    def post(self, data, **extra):
+        return self.client.post(reverse('equipment_bulk_update'), data, **extra)
+
+    def test_selected_ids(self):
+        ids = list(Equipment.objects.filter(sn__in=['SN0', 'SN1']).values_list('id', flat=True))
+        # Old values, the UPDATE itself, the refresh of the rollups and the change log entries
+        with self.assertNumQueries(4):
+            bulk.update_ids(ids, {'delivery_status': 'Delivered', 'bl': 'yes'})
+        self.assertEqual(
+            sorted(Equipment.objects.filter(delivery_status='Delivered', bl='yes').values_list('sn', flat=True)),
+            ['SN0', 'SN1'],
+        )
+        response = self.post({'scope': 'selected', 'ids': ids, 'delivery_date': '2024-03-01'})
+        self.assertRedirects(response, reverse('equipment_list'))
+        self.assertEqual(Equipment.objects.filter(delivery_date='2024-03-01').count(), 2)
+
+    def test_counters_are_moved_not_dropped(self):
+        stats.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.update_sns(['SN0', 'SN1'], {'delivery_status': 'Delivered', 'record': self.other})
+        self.assertEqual(StatsCounter.objects.count(), len(stats.compute()))
+        with self.assertNumQueries(1):
+            counters = stats.get_stats()
+        self.assertEqual(counters['equipment_by_status'], {'Delivered': 2, 'InProgress': 3})
+        self.assertEqual(counters['equipment_by_quarter']['Q3'], 2)
+        # Same as recomputed from the database
+        stats.invalidate()
+        self.assertEqual(stats.get_stats(), counters)
+
+    def test_reassign_to_undated_record_keeps_reception_date(self):
+        undated = Record.objects.create(name='D3')
+        bulk.update_sns(['SN0'], {'record': undated})
+        self.assertEqual(
+            Equipment.objects.values_list('record_id', 'reception_date', 'year', 'quarter').get(sn='SN0'),
+            (undated.pk, datetime.date(2024, 2, 10), 2024, 'Q1'),
+        )
+
+    def test_queryset_is_updated_in_batches(self):
+        with mock.patch.object(bulk, 'BATCH_SIZE', 2):
+            updated = bulk.update_queryset(Equipment.objects.filter(delivery_status='InProgress'),
+                                           {'delivery_status': 'Delivered'})
+        self.assertEqual(updated, 5)
+        self.assertFalse(Equipment.objects.filter(delivery_status='InProgress').exists())
+        self.assertEqual(ChangeLog.objects.filter(action=ChangeLog.UPDATED).count(), 5)
+
+    def test_filter_scope_and_reassign_keep_year_and_quarter(self):
+        self.post({'scope': 'filter', 'sn': 'SN', 'new_record': self.other.pk, 'record': self.record.pk})
+        self.assertEqual(
+            set(Equipment.objects.values_list('record_id', 'reception_date', 'year', 'quarter')),
+            {(self.other.pk, datetime.date(2024, 8, 1), 2024, 'Q3')},
+        )
+
+    def test_sn_list_reports_missing(self):
+        upload = SimpleUploadedFile('sns.csv', b'SN3,whatever\nNOPE\n')
+        response = self.post({'scope': 'sns', 'sns': 'SN2\nSN4', 'sn_file': upload, 'delivery_status': 'Delivered'},
+                             follow=True)
+        self.assertEqual(
+            sorted(Equipment.objects.filter(delivery_status='Delivered').values_list('sn', flat=True)),
+            ['SN2', 'SN3', 'SN4'],
+        )
+        self.assertContains(response, '1 SN(s) not found: NOPE')
+        self.assertContains(response, '3 equipment updated.')
+
+    def test_edit_record_keeps_equipment_quarter_in_sync(self):
+        self.client.post(reverse('edit_record', args=[self.record.pk]), {'name': 'D1', 'reception_date': '2024-11-02'})
+        self.assertEqual(set(Equipment.objects.values_list('year', 'quarter')), {(2024, 'Q4')})
+
+
+class DeliveryImportTests(TestCase):
+    def setUp(self):
+        record = Record.objects.create(name='D1')
+        Equipment.objects.bulk_create([
+            Equipment(record=record, name='Router', sn='A', order_index=1),
+            Equipment(record=record, name='Router', sn='B', sn_rempl='B-NEW', order_index=2),
+            Equipment(record=record, name='Router', sn='C', order_index=3,
+                      delivery_status='Delivered', delivery_date=datetime.date(2024, 1, 1)),
+            Equipment(record=record, name='Router', sn='D', order_index=4),
+        ])
+
+    def test_reconciliation(self):
+        upload = excel_upload([
+            ['A', datetime.datetime(2024, 3, 1), None],
+            ['B-NEW', '02/03/2024', 'no'],
+            ['C', '2024-03-01', 'yes'],
+            ['D', '2024-03-01', None],
+            ['D', '2024-03-05', None],
+            ['ZZZ', '2024-03-01', None],
+            ['A', 'not a date', None],
+        ], columns=['SN', 'Delivery Date', 'BL'])
+        response = self.client.post(reverse('import_deliveries'), {'file': upload})
+        result = response.context['result']
+        self.assertEqual(result.matched, 2)
+        self.assertEqual(result.updated, 2)
+        self.assertEqual(result.unmatched, ['ZZZ'])
+        self.assertEqual(result.conflicts, [
+            'Row 4: SN D is listed several times with different deliveries.',
+            'Row 3: SN C was already delivered on 2024-01-01.',
+        ])
+        self.assertEqual(result.invalid_count, 1)
+        self.assertEqual(
+            sorted(Equipment.objects.filter(delivery_status='Delivered').values_list('sn', 'delivery_date', 'bl')),
+            [('A', datetime.date(2024, 3, 1), 'yes'), ('B', datetime.date(2024, 3, 2), 'no'),
+             ('C', datetime.date(2024, 1, 1), 'no')],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.record = Record.objects.create(name='D1', reception_date=datetime.date(2024, 2, 1))
+        Equipment.objects.bulk_create([
+            Equipment(record=self.record, name='Router', sn=f'SN{i}', order_index=i) for i in range(5)
+        ])
+
+    def test_list_pagination_and_fields(self):
+        url = reverse('api_equipment')
+        data = self.client.get(url, {'page_size': 2, 'fields': 'sn'}).json()
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(data['results'], [{'sn': 'SN0'}, {'sn': 'SN1'}])
+        data = self.client.get(data['next']).json()
+        self.assertEqual(data['results'], [{'sn': 'SN2'}, {'sn': 'SN3'}])
+        self.assertEqual(self.client.get(url, {'fields': 'secret'}).status_code, 400)
+
+    def test_conditional_get(self):
+        url = reverse('api_records')
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        Record.objects.create(name='D2')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_rollup_change_invalidates_etag(self):
+        url = reverse('api_record', args=[self.record.pk])
+        response = self.client.get(url)
+        equipment = Equipment.objects.get(sn='SN0')
+        equipment.delivery_status = 'Delivered'
+        equipment.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items_delivered'], 1)
+
+    def test_bulk_create_and_update(self):
+        url = reverse('api_equipment')
+        payload = [
+            {'record': self.record.pk, 'name': 'Switch', 'sn': 'NEW1', 'order_index': 10, 'reception_date': '2024-02-01'},
+            {'record': self.record.pk, 'name': 'Switch', 'sn': 'NEW1', 'order_index': 11},
+            {'record': 999, 'name': 'Switch', 'sn': 'SN0', 'order_index': 12},
+        ]
+        response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'1', '2'})
+
+        response = self.client.post(url, payload[:1], content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        created = response.json()[0]
+        self.assertEqual((created['year'], created['quarter']), (2024, 'Q1'))
+        self.assertEqual(stats.get_stats()['equipment'], 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(url, [{'id': created['id'], 'delivery_status': 'Delivered'}],
+                                         content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Equipment.objects.get(sn='NEW1').delivery_status, 'Delivered')
+        # Moved by the PATCH rather than dropped and recomputed
+        self.assertEqual(StatsCounter.objects.get(key=stats._key('equipment', 'status', 'Delivered')).value, 1)
+        self.assertEqual(stats.get_stats()['equipment_by_status'].get('Delivered'), 1)
+
+    def test_invalid_ids_are_item_errors(self):
+        response = self.client.patch(reverse('api_equipment'), [{'id': 'zz'}, {'id': [1]}, {'id': True}],
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'0', '1', '2'})
+        response = self.client.patch(reverse('api_records'), [{'id': 'zz', 'name': 'X'}], content_type='application/json')
+        self.assertEqual(response.json()['errors']['0'], {'id': ['A valid integer is required.']})
+
+        payload = [
+            {'record': [self.record.pk], 'name': 'Hub', 'sn': 'H1', 'order_index': 1},
+            {'record': str(self.record.pk), 'name': 'Hub', 'sn': 'H2', 'order_index': 2},
+        ]
+        response = self.client.post(reverse('api_equipment'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {'0': {'record': ['A valid integer is required.']}})
+        response = self.client.post(reverse('api_equipment'), payload[1:], content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()[0]['record'], self.record.pk)
+
+    def test_writes_require_json_content_type(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        response = client.post(reverse('api_records'), '{"name": "D9"}', content_type='text/plain')
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(Record.objects.filter(name='D9').exists())
+
+    def test_bulk_record_writes(self):
+        url = reverse('api_records')
+        response = self.client.post(url, [{'name': 'D2', 'reception_date': '2024-05-02'}, {'name': 'D3'}],
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['quarter'] for item in response.json()], ['Q2', None])
+
+        response = self.client.patch(url, [{'id': self.record.pk, 'reception_date': '2024-08-01'}],
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.record.refresh_from_db()
+        self.assertEqual((self.record.quarter, self.record.warning_date is not None), ('Q3', True))
+        self.assertEqual(set(self.record.equipment.values_list('quarter', flat=True)), {'Q3'})
+        self.assertEqual(ChangeLog.objects.filter(kind=ChangeLog.RECORD, action=ChangeLog.UPDATED).count(), 1)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.record = Record.objects.create(name='D1', reception_date=datetime.date(2024, 2, 1))
+        Equipment.objects.bulk_create([
+            Equipment(record=self.record, name='Router', sn=f'SN{i}', order_index=i) for i in range(3)
+        ])
+
+    async def test_read_views_under_asgi(self):
+        response = await self.async_client.get(reverse('equipment_list'))
+        self.assertEqual(len(response.context['equipments']), 3)
+        response = await self.async_client.get(reverse('record_list'))
+        self.assertEqual([record.name for record in response.context['records']], ['D1'])
+        response = await self.async_client.get(reverse('equipment_search'), {'q': 'SN1'})
+        self.assertEqual([row['sn'] for row in response.json()['results']], ['SN1'])
+
+    async def test_csv_streams_from_async_iterator(self):
+        response = await self.async_client.get(reverse('download_record', args=[self.record.pk]), {'format': 'csv'})
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8-sig')
+        self.assertEqual([row[2] for row in csv.reader(io.StringIO(content))], ['SN', 'SN0', 'SN1', 'SN2'])
+
+
+@override_settings(METRICS_ENABLED=True)
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        # Normally installed at startup, when the setting is read from the environment
+        metrics.install_query_counter(None, connection)
+        self.addCleanup(connection.execute_wrappers.remove, metrics.count_queries)
+        record = Record.objects.create(name='D1')
+        Equipment.objects.create(record=record, name='Router', sn='SN1', order_index=1)
+
+    def test_requests_and_queries_are_recorded(self):
+        self.client.get(reverse('record_list'))
+        self.client.get(reverse('download_record', args=[Record.objects.get().pk]), {'format': 'csv'}).getvalue()
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('inventory_http_requests_total{view="record_list",method="GET",status="200"} 1', body)
+        self.assertIn('inventory_http_request_duration_seconds_count{view="record_list"} 1', body)
+        self.assertEqual(metrics.registry.queries['record_list'].sum, 1)
+        self.assertIn('inventory_exports_total{format="csv"} 1', body)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+class SyntheticDataTests(TestCase):
+    def test_dataset_matches_save(self):
+        generate_dataset(20, 500)
+        equipment = Equipment.objects.order_by('?').first()
+        saved = Equipment(reception_date=equipment.reception_date, name='x', record=equipment.record, order_index=0)
+        saved.save()
+        self.assertEqual((equipment.year, equipment.quarter), (saved.year, saved.quarter))
+        record = equipment.record
+        record.save()
+        self.assertEqual(Record.objects.get(pk=record.pk).penalty_date, record.penalty_date)
+        self.assertFalse(Equipment.objects.filter(delivery_status='InProgress').exclude(delivery_date=None).exists())
+
+    def test_sample_sheet_imports(self):
+        with tempfile.NamedTemporaryFile(suffix='.xlsx') as sheet:
+            write_sample_sheet(sheet.name, 200, records=10)
+            result = import_rows(read_rows(sheet.name))
+        self.assertEqual((result.created_equipment, result.rejected), (200, 0))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        record = Record.objects.create(name='D1', reception_date=datetime.date(2024, 1, 10))
+        Equipment.objects.create(record=record, name='A', order_index=1, reception_date=datetime.date(2024, 1, 10),
+                                 delivery_status='Delivered', delivery_date=datetime.date(2024, 1, 20))
+        Equipment.objects.create(record=record, name='B', order_index=2, reception_date=datetime.date(2024, 1, 10),
+                                 delivery_status='Delivered', delivery_date=datetime.date(2024, 5, 10))
+        Equipment.objects.create(record=record, name='C', order_index=3, reception_date=datetime.date(2024, 11, 2))
+
+    def test_quarters_and_years(self):
+        data = analytics.compute(datetime.date(2024, 12, 1))
+        self.assertEqual(data['quarters'], [
+            {'year': 2024, 'quarter': 'Q1', 'received': 2, 'delivered': 2, 'in_progress': 0,
+             'penalties': 1, 'avg_turnaround_days': 65.5},
+            {'year': 2024, 'quarter': 'Q4', 'received': 1, 'delivered': 0, 'in_progress': 1,
+             'penalties': 0, 'avg_turnaround_days': None},
+        ])
+        self.assertEqual(data['years'], [
+            {'year': 2024, 'received': 3, 'delivered': 2, 'in_progress': 1, 'penalties': 1,
+             'avg_turnaround_days': 65.5},
+        ])
+
+    def deliver(self, name):
+        equipment = Equipment.objects.get(name=name)
+        equipment.delivery_status = 'Delivered'
+        equipment.delivery_date = datetime.date(2024, 11, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            equipment.save()
+
+    @override_settings(INVENTORY_ANALYTICS_REFRESH=0)
+    def test_cached_until_write(self):
+        response = self.client.get(reverse('analytics_data'))
+        self.assertEqual(response.json()['years'][0]['delivered'], 2)
+        with self.assertNumQueries(0):
+            analytics.get_analytics()
+        self.deliver('C')
+        self.assertEqual(self.client.get(reverse('analytics')).context['analytics']['years'][0]['delivered'], 3)
+
+    def test_writes_recompute_at_most_once_per_interval(self):
+        analytics.get_analytics()
+        self.deliver('C')
+        # Stale, but computed less than INVENTORY_ANALYTICS_REFRESH seconds ago
+        with self.assertNumQueries(0):
+            self.assertEqual(analytics.get_analytics()['years'][0]['delivered'], 2)
+        with mock.patch.object(analytics.time, 'time', return_value=time.time() + 60):
+            self.assertEqual(analytics.get_analytics()['years'][0]['delivered'], 3)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.record = Record.objects.create(name='D1')
+        self.other = Record.objects.create(name='D2')
+
+    def rollups(self, record):
+        return Record.objects.values_list('items_total', 'items_in_progress', 'items_delivered',
+                                          'last_delivery_date').get(pk=record.pk)
+
+    def test_signals_and_bulk_paths(self):
+        import_rows([(0, sheet_row('D1', sn='A')), (1, sheet_row('D1', sn='B')), (2, sheet_row('D2', sn='C'))])
+        self.assertEqual(self.rollups(self.record), (2, 2, 0, None))
+
+        equipment = Equipment.objects.get(sn='A')
+        equipment.delivery_status = 'Delivered'
+        equipment.delivery_date = datetime.date(2024, 5, 1)
+        equipment.save()
+        self.assertEqual(self.rollups(self.record), (2, 1, 1, datetime.date(2024, 5, 1)))
+
+        bulk.update_sns(['B'], {'record': self.other})
+        self.assertEqual(self.rollups(self.record), (1, 0, 1, datetime.date(2024, 5, 1)))
+        self.assertEqual(self.rollups(self.other), (2, 2, 0, None))
+
+        equipment.delete()
+        self.assertEqual(self.rollups(self.record), (0, 0, 0, None))
+
+        # A stale instance doesn't overwrite the rollups
+        self.other.name = 'D2 bis'
+        self.other.save()
+        self.assertEqual(Record.objects.get(pk=self.other.pk).status, '2 items left')
+
+    def test_rebuild_rollups_repairs_drift(self):
+        Equipment.objects.create(record=self.record, name='Router', sn='A', order_index=1)
+        Record.objects.filter(pk=self.record.pk).update(items_total=7)
+        out = io.StringIO()
+        call_command('rebuild_rollups', '--check', stdout=out)
+        self.assertIn('1 record(s) drifted', out.getvalue())
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(self.rollups(self.record), (1, 1, 0, None))
+
+
+class ChangeLogTests(TestCase):
+    def setUp(self):
+        self.record = Record.objects.create(name='D1')
+        self.other = Record.objects.create(name='D2')
+
+    def test_history_of_sn(self):
+        with audit.acting_as('import #1'):
+            import_rows([(0, sheet_row('D1', sn='A')), (1, sheet_row('D1', sn='B'))])
+        equipment = Equipment.objects.get(sn='A')
+        equipment.sn = 'A2'
+        equipment.delivery_status = 'Delivered'
+        equipment.save()
+        bulk.update_sns(['A2', 'B'], {'record': self.other, 'bl': 'yes'})
+        # A save that changes nothing isn't logged
+        equipment.refresh_from_db()
+        equipment.save()
+
+        entries = list(audit.history('A'))
+        self.assertEqual([entry.action for entry in entries], ['u', 'u', 'c'])
+        self.assertEqual(entries[2].actor, 'import #1')
+        self.assertEqual(entries[2].changes['sn'], [None, 'A'])
+        self.assertEqual(entries[1].changes, {'sn': ['A', 'A2'], 'delivery_status': ['InProgress', 'Delivered']})
+        self.assertEqual(entries[0].sn, 'A2')
+        self.assertEqual(entries[0].changes, {'record': [self.record.pk, self.other.pk], 'bl': ['no', 'yes']})
+        self.assertEqual([entry.pk for entry in audit.history('A2')], [entry.pk for entry in entries])
+
+        equipment.delete()
+        self.assertEqual(audit.history('A').first().changes['sn'], ['A2', None])
+        response = self.client.get(reverse('equipment_history'), {'sn': 'A'})
+        self.assertContains(response, 'InProgress &rarr; Delivered', html=False)
+        self.assertEqual(len(response.context['entries']), 4)
+
+    def test_archive_changelog(self):
+        Equipment.objects.create(record=self.record, name='Router', sn='A', order_index=1)
+        Equipment.objects.create(record=self.record, name='Switch', sn='B', order_index=2)
+        # Everything up to the creation of A is old
+        last_old = ChangeLog.objects.get(sn='A').pk
+        ChangeLog.objects.filter(pk__lte=last_old).update(created_at=timezone.now() - datetime.timedelta(days=400))
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'changelog.jsonl.gz')
+
+        call_command('archive_changelog', '--days', '365', '--output', path, stdout=io.StringIO())
+        with gzip.open(path, 'rt') as archive:
+            archived = [json.loads(line) for line in archive]
+        self.assertEqual([(entry['kind'], entry['sn']) for entry in archived], [('r', None), ('r', None), ('e', 'A')])
+        self.assertEqual(archived[2]['changes']['name'], [None, 'Router'])
+        self.assertEqual(list(ChangeLog.objects.values_list('sn', flat=True)), ['B'])
+
+
+class EquipmentListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.record = Record.objects.create(name='D1')
+        Record.objects.create(name='E1')
+        import_rows([(i, sheet_row('D1' if i < 30 else 'E1', sn=f'SN{i}')) for i in range(45)])
+
+    def test_query_count_is_constant(self):
+        stats.get_stats()
+        # The stored total, the page's ids, then their rows joined to the record
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('equipment_list'), {'per_page': '25', 'page': '2'})
+        self.assertEqual([e.sn for e in response.context['equipments']], [f'SN{i}' for i in range(25, 45)])
+        self.assertEqual(response.context['equipments'].paginator.count, 45)
+        self.assertContains(response, '?page=1&per_page=25')
+
+        # The record's rollup gives the count of a record filter
+        response = self.client.get(reverse('equipment_list'), {'record': self.record.pk, 'per_page': '7'})
+        self.assertEqual(response.context['equipments'].paginator.count, 30)
+        self.assertEqual(response.context['equipments'].paginator.per_page, 10)
+        self.assertEqual(response.context['filter_record']['name'], 'D1')
+        self.assertEqual(response.context['equipments'][0].record.name, 'D1')
+
+    def test_invalid_record_filter(self):
+        response = self.client.get(reverse('equipment_list'), {'record': 'abc'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['equipments'].paginator.count, 0)
+        self.assertEqual(len(response.context['equipments']), 0)
+
+    def test_record_search(self):
+        response = self.client.get(reverse('record_search'), {'q': 'D'})
+        self.assertEqual(response.json()['results'], [{'id': self.record.pk, 'name': 'D1'}])
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('record_search'), {'q': 'X'}).json()['results'], [])
+
+
+class StartupTests(TestCase):
+    def test_spreadsheet_modules_are_not_loaded_at_boot(self):
+        script = (
+            'import sys, django; django.setup(); '
+            'from django.urls import get_resolver; get_resolver().url_patterns; '
+            'from inventory.benchmarks import HEAVY_MODULES; '
+            'print(",".join(name for name in HEAVY_MODULES if name in sys.modules))'
+        )
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '')
+
+
+class EquipmentEditTests(TestCase):
+    def setUp(self):
+        self.record = Record.objects.create(name='D1')
+        self.equipment = Equipment.objects.create(record=self.record, name='Router', sn='A', order_index=1)
+        Equipment.objects.create(record=self.record, name='Switch', sn='B', order_index=2)
+        archived = ArchivedRecord.objects.create(id=999, name='OLD')
+        ArchivedEquipment.objects.create(id=999, record=archived, name='Hub', sn='Z', order_index=1,
+                                         updated_at=timezone.now())
+
+    def post(self, sn):
+        return self.client.post(reverse('update_equipment', args=[self.equipment.pk]), {
+            'name': 'Router', 'record': self.record.pk, 'sn': sn, 'delivery_status': 'InProgress', 'bl': 'no',
+        })
+
+    def test_taken_sn_is_a_form_error(self):
+        response = self.post('B')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('sn', response.context['form'].errors)
+        response = self.post('Z')
+        self.assertEqual(response.context['form'].errors['sn'], ['Equipment with SN Z is archived.'])
+        self.assertEqual(Equipment.objects.get(pk=self.equipment.pk).sn, 'A')
+
+        self.assertRedirects(self.post('C'), reverse('equipment_list'))
+        self.assertEqual(Equipment.objects.get(pk=self.equipment.pk).sn, 'C')
+
+    def test_api_rejects_archived_sn(self):
+        response = self.client.post(reverse('api_equipment'), {'record': self.record.pk, 'name': 'Hub', 'sn': 'Z',
+                                                               'order_index': 3}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors']['0']['sn'], ['Equipment with this SN is archived.'])
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        today = timezone.now().date()
+        self.old = Record.objects.create(name='OLD', reception_date=today - datetime.timedelta(days=800))
+        self.recent = Record.objects.create(name='RECENT', reception_date=today - datetime.timedelta(days=800))
+        self.open = Record.objects.create(name='OPEN', reception_date=today - datetime.timedelta(days=800))
+        for record, sn, delivered in [(self.old, 'A1', 700), (self.old, 'A2', 600), (self.recent, 'B1', 10),
+                                      (self.open, 'C1', None)]:
+            Equipment.objects.create(
+                record=record, name='Router', sn=sn, order_index=1, reception_date=record.reception_date,
+                delivery_status='Delivered' if delivered else 'InProgress',
+                delivery_date=today - datetime.timedelta(days=delivered) if delivered else None,
+            )
+
+    def test_archive_and_restore(self):
+        call_command('archive_records', '--days', '365', stdout=io.StringIO())
+        self.assertEqual(sorted(Record.objects.values_list('name', flat=True)), ['OPEN', 'RECENT'])
+        self.assertEqual(sorted(ArchivedEquipment.objects.values_list('sn', flat=True)), ['A1', 'A2'])
+        self.assertEqual(ArchivedRecord.objects.get().items_total, 2)
+        self.assertEqual(search_equipment('A1').count(), 0)
+        self.assertEqual(audit.history('A1').first().get_action_display(), 'Archived')
+
+        result = import_rows([(0, sheet_row('NEW', sn='A1'))])
+        self.assertEqual([str(error) for error in result.errors], ['Equipment with SN A1 is archived and was not added.'])
+
+        response = self.client.get(reverse('archive_list'), {'q': 'A'})
+        self.assertEqual([record.name for record in response.context['records']], ['OLD'])
+        response = self.client.get(reverse('archived_record', args=[self.old.pk]))
+        self.assertEqual([item.sn for item in response.context['equipment']], ['A1', 'A2'])
+
+        response = self.client.post(reverse('restore_record', args=[self.old.pk]))
+        self.assertRedirects(response, f"{reverse('equipment_list')}?record={self.old.pk}")
+        restored = Record.objects.get(pk=self.old.pk)
+        self.assertEqual((restored.items_total, restored.items_delivered, restored.status), (2, 2, 'closed'))
+        self.assertEqual(restored.penalty_date, self.old.penalty_date)
+        self.assertEqual(sorted(Equipment.objects.filter(record=restored).values_list('sn', flat=True)), ['A1', 'A2'])
+        self.assertFalse(ArchivedRecord.objects.exists())
+        self.assertEqual(search_equipment('A1').count(), 1)
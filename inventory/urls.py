@@ -1,14 +1,32 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('imports/<int:pk>/confirm/', views.confirm_import, name='confirm_import'),
+    path('imports/<int:pk>/status/', views.import_status, name='import_status'),
+    path('deliveries/import/', views.import_deliveries, name='import_deliveries'),
     path('equipments/', views.equipment_list, name='equipment_list'),
+    path('equipments/search/', views.equipment_search, name='equipment_search'),
+    path('equipments/history/', views.equipment_history, name='equipment_history'),
+    path('equipments/bulk/', views.equipment_bulk_update, name='equipment_bulk_update'),
     path('records/', views.record_list, name='record_list'),
+    path('records/search/', views.record_search, name='record_search'),
     path('records/edit/<int:pk>/', views.edit_record, name='edit_record'),
     path('download_record/<int:record_id>/', views.download_record, name='download_record'),
+    path('records/export/', views.export_records, name='export_records'),
     path('delete_record/<int:record_id>/', views.delete_record, name='delete_record'),
     path('equipment/edit/<int:pk>/', views.edit_equipment, name='edit_equipment'),
     path('equipment/update/<int:id>/', views.update_equipment, name='update_equipment'),
     path('equipment/<int:pk>/delete/', views.delete_equipment, name='delete_equipment'),
+    path('archive/', views.archive_list, name='archive_list'),
+    path('archive/<int:pk>/', views.archived_record, name='archived_record'),
+    path('archive/<int:pk>/restore/', views.restore_record, name='restore_record'),
+    path('analytics/', views.analytics_view, name='analytics'),
+    path('analytics/data/', views.analytics_data, name='analytics_data'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('api/records/', api.record_collection, name='api_records'),
+    path('api/records/<int:pk>/', api.record_detail, name='api_record'),
+    path('api/equipment/', api.equipment_collection, name='api_equipment'),
+    path('api/equipment/<int:pk>/', api.equipment_detail, name='api_equipment_detail'),
 ]
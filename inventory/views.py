@@ -1,16 +1,22 @@
-from django.shortcuts import render, redirect, get_object_or_404
-from .models import Record, Equipment
-from .forms import EquipmentForm, UploadFileForm, RecordForm
-import pandas as pd
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from .models import ArchivedRecord, Record, Equipment, ImportJob
+from .forms import BulkEquipmentForm, EquipmentForm, UploadFileForm, RecordForm
+from .pagination import InvalidCursor, akeyset_paginate
+from .search import search_equipment
+from .exports import csv_response, xlsx_response
+from . import analytics, archive, audit, bulk, jobs, metrics, stats
+from .deliveries import read_delivery_rows, reconcile_deliveries
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.core.paginator import Paginator
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.urls import reverse
-from django.db.models import Count
-from io import BytesIO
+from django.contrib import messages
+from django.views.decorators.cache import cache_control
+from django.db import transaction
+from urllib.parse import urlencode
 from django.utils.dateparse import parse_date
-import xlsxwriter
 from django.core.exceptions import ValidationError
-from django.core.files.uploadedfile import InMemoryUploadedFile
 
 
 def home(request):
@@ -24,165 +30,285 @@ def home(request):
                 excel_file = request.FILES['file']
 
                 # Ensure the file is a valid Excel file
-                if not isinstance(excel_file, InMemoryUploadedFile) or not excel_file.name.endswith('.xlsx'):
+                if not excel_file.name.endswith('.xlsx'):
                     errors.append('Please upload a valid Excel file.')
+                elif 'preview' in request.POST:
+                    # Checked by the worker, imported once confirmed from the summary
+                    job = jobs.preview_upload(excel_file)
+                    return redirect(f"{reverse('home')}?job={job.pk}")
                 else:
-                    df = pd.read_excel(excel_file)
-
-                    for index, row in df.iterrows():
-                        record_name = row.get('Dossier')
-                        equipment_name = row.get('Design.')
-                        ref = row.get('Ref')
-                        sn = row.get('SN')
-                        sn_rempl = row.get('SN Rempl')
-
-                        if not record_name or not equipment_name or not sn:
-                            errors.append(f'Missing required data in row {index + 1}.')
-                            continue
-
-                        # Check if the record already exists
-                        record, created = Record.objects.get_or_create(name=record_name)
-
-                        # Check if the equipment with the same SN already exists
-                        existing_equipment = Equipment.objects.filter(sn=sn).first()
-
-                        if not existing_equipment:
-                            # Create the equipment associated with the record
-                            Equipment.objects.create(
-                                name=equipment_name, 
-                                record=record, 
-                                ref=ref, 
-                                sn=sn, 
-                                sn_rempl=sn_rempl,
-                                order_index=index + 1  # Assign order_index based on the row number
-                            )
-                        else:
-                            errors.append(f'Equipment with SN {sn} already exists and was not added.')
-
-                    if errors:
-                        # If there are errors, re-render the form with errors
-                        return render(request, 'inventory/home.html', {
-                            'form': form,
-                            'total_records': Record.objects.count(),
-                            'total_equipments': Equipment.objects.count(),
-                            'errors': errors,
-                        })
-                    else:
-                        return redirect('home')
+                    # The sheet is imported in the background by the process_imports command
+                    job = ImportJob.objects.create(file=excel_file)
+                    return redirect(f"{reverse('home')}?job={job.pk}")
             except Exception as e:
                 errors.append(f'An error occurred: {str(e)}')
         else:
             errors.append('Form is not valid.')
 
-    total_records = Record.objects.count()
-    total_equipments = Equipment.objects.count()
+    job = None
+    job_id = request.GET.get('job')
+    if job_id and job_id.isdigit():
+        job = ImportJob.objects.filter(pk=job_id).first()
+
+    counters = stats.get_stats()
 
     return render(request, 'inventory/home.html', {
         'form': form,
-        'total_records': total_records,
-        'total_equipments': total_equipments,
+        'total_records': counters['records'],
+        'total_equipments': counters['equipment'],
+        'stats': counters,
         'errors': errors,
+        'job': job,
     })
 
-def record_list(request):
-    records = Record.objects.all()
-    equipment_count = Equipment.objects.values('record__name').annotate(count=Count('id'))
-    equipment_count_dict = {item['record__name']: item['count'] for item in equipment_count}
+def import_deliveries(request):
+    """Mark equipment as Delivered from a carrier delivery sheet (SN, Delivery Date, BL)."""
+    form = UploadFileForm()
+    errors = []
+    result = None
 
-    return render(request, 'inventory/record_list.html', {'records': records, 'equipment_count': equipment_count_dict})
+    if request.method == 'POST':
+        form = UploadFileForm(request.POST, request.FILES)
+        if form.is_valid():
+            delivery_file = request.FILES['file']
+            if not delivery_file.name.endswith('.xlsx'):
+                errors.append('Please upload a valid Excel file.')
+            else:
+                try:
+                    result = reconcile_deliveries(read_delivery_rows(delivery_file))
+                except Exception as e:
+                    errors.append(f'An error occurred: {str(e)}')
+        else:
+            errors.append('Form is not valid.')
 
+    return render(request, 'inventory/import_deliveries.html', {
+        'form': form,
+        'errors': errors,
+        'result': result,
+    })
 
-def equipment_list(request):
+def confirm_import(request, pk):
+    job = get_object_or_404(ImportJob, pk=pk)
+    if request.method == 'POST':
+        if 'discard' in request.POST:
+            if job.status == 'Preview':
+                jobs.discard(job)
+                messages.info(request, f'Import #{pk} was discarded.')
+            return redirect('home')
+        jobs.confirm(job)
+    return redirect(f"{reverse('home')}?job={job.pk}")
+
+async def import_status(request, pk):
+    job = await aget_object_or_404(ImportJob, pk=pk)
+    return JsonResponse({
+        'id': job.pk,
+        'status': job.status,
+        'rows_done': job.rows_done,
+        'rows_rejected': job.rows_rejected,
+        'throughput': job.throughput,
+        'errors': job.errors if job.is_finished else [],
+    })
+
+# Orderings offered on the record list, as keyset pagination keys.
+RECORD_SORTS = {
+    'recent': [('reception_date', True), ('id', True)],
+    'duration': [('reception_date', False), ('id', False)],  # Longest repair first
+    'open_items': [('items_in_progress', True), ('id', True)],
+}
+
+RECORD_PAGE_SIZE = 25
+
+
+async def record_list(request):
+    filter_quarter = request.GET.get('quarter', '')
+    filter_penalty = request.GET.get('penalty', '')
+    sort = request.GET.get('sort', '')
+    if sort not in RECORD_SORTS:
+        sort = 'recent'
+
+    records = Record.objects.with_stats()
+    if filter_quarter:
+        records = records.filter(quarter=filter_quarter)
+    if filter_penalty == 'warning':
+        # 75 days or more since reception
+        records = records.in_warning()
+    elif filter_penalty == 'penalty':
+        # More than 90 days since reception
+        records = records.penalized()
+
+    try:
+        page = await akeyset_paginate(records, RECORD_SORTS[sort], request.GET.get('cursor'), RECORD_PAGE_SIZE)
+    except InvalidCursor:
+        page = await akeyset_paginate(records, RECORD_SORTS[sort], None, RECORD_PAGE_SIZE)
+
+    return render(request, 'inventory/record_list.html', {
+        'records': page,
+        'filter_quarter': filter_quarter,
+        'filter_penalty': filter_penalty,
+        'sort': sort,
+    })
+
+
+EQUIPMENT_PAGE_SIZES = (10, 25, 50, 100)
+# Columns shown by the equipment list
+EQUIPMENT_LIST_FIELDS = (
+    'name', 'ref', 'sn', 'sn_rempl', 'reception_date', 'delivery_status', 'delivery_date', 'bl', 'year', 'quarter',
+    'record', 'record__name',
+)
+
+
+async def _equipment_count(params, equipments):
+    """Size of the equipment list, read from the stored counters unless filtered by SN."""
+    if params.get('sn'):
+        return await equipments.acount()
+    if params.get('record'):
+        if not params['record'].isdigit():
+            return 0
+        record = await Record.objects.filter(pk=params['record']).values('items_total').afirst()
+        return record['items_total'] if record else 0
+    return await sync_to_async(stats.equipment_count)()
+
+
+async def equipment_list(request):
     # Get filters from GET parameters
     filter_record_id = request.GET.get('record')
     filter_sn = request.GET.get('sn', '')
+    per_page = request.GET.get('per_page', '')
+    per_page = int(per_page) if per_page.isdigit() else 0
+    if per_page not in EQUIPMENT_PAGE_SIZES:
+        per_page = EQUIPMENT_PAGE_SIZES[0]
 
     # Filter query
-    equipments = Equipment.objects.all()
-    if filter_record_id:
-        equipments = equipments.filter(record_id=filter_record_id)
-    if filter_sn:
-        equipments = equipments.filter(sn__icontains=filter_sn)
-
-    # Pagination
-    paginator = Paginator(equipments, 10)  # 10 items per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    # Get all records for the filter dropdown
-    records = Record.objects.all()
+    equipments = await sync_to_async(filtered_equipments)(request.GET)
+    equipments = equipments.order_by('id')
+
+    # Pagination, the count is set up front so that get_page() doesn't query.
+    # The page's ids are found on the id index alone, then only those rows are
+    # joined to their record, however deep the page is.
+    paginator = Paginator(equipments.values('id'), per_page)
+    paginator.count = await _equipment_count(request.GET, equipments)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    ids = [row['id'] async for row in page_obj.object_list]
+    page_obj.object_list = [
+        equipment async for equipment in
+        Equipment.objects.filter(id__in=ids).select_related('record').only(*EQUIPMENT_LIST_FIELDS).order_by('id')
+    ]
+
+    # Name of the filtered record, the pickers look records up as the user types
+    filter_record = None
+    if filter_record_id and filter_record_id.isdigit():
+        filter_record = await Record.objects.filter(pk=filter_record_id).values('id', 'name').afirst()
 
     context = {
         'equipments': page_obj,
-        'records': records,
+        'page_range': paginator.get_elided_page_range(page_obj.number),
+        'page_sizes': EQUIPMENT_PAGE_SIZES,
+        'per_page': per_page,
+        'page_query': urlencode({
+            key: value for key, value in (('record', filter_record_id), ('sn', filter_sn), ('per_page', per_page))
+            if value
+        }),
+        'filter_record': filter_record,
+        'bulk_form': BulkEquipmentForm(),
         'filter_record_id': filter_record_id,
         'filter_sn': filter_sn
     }
     return render(request, 'inventory/equipment_list.html', context)
 
-def download_record(request, record_id):
-    record = get_object_or_404(Record, pk=record_id)
-    equipments = Equipment.objects.filter(record=record)
+def filtered_equipments(params):
+    """Equipment matching the filters of the equipment list."""
+    equipments = Equipment.objects.all()
+    if params.get('record'):
+        # Same as _equipment_count(): a record id that isn't a number matches nothing
+        if not params['record'].isdigit():
+            return equipments.none()
+        equipments = equipments.filter(record_id=params['record'])
+    if params.get('sn'):
+        equipments = search_equipment(params['sn'], fields=('sn',), queryset=equipments)
+    return equipments
+
+def equipment_bulk_update(request):
+    """Apply the same status, dates, BL or record to many equipment at once."""
+    if request.method != 'POST':
+        return redirect('equipment_list')
 
-    # Create Excel file
-    output = BytesIO()
-    workbook = xlsxwriter.Workbook(output, {'in_memory': True})
-    worksheet = workbook.add_worksheet()
-
-    # Define formats
-    header_format = workbook.add_format({
-        'bold': True,
-        'bg_color': '#0000FF',
-        'font_color': '#FFFFFF',
-        'border': 1,
-        'align': 'center',
-        'valign': 'vcenter'
-    })
-    yellow_header_format = workbook.add_format({
-        'bold': True,
-        'bg_color': '#FFFF00',  # Yellow color for YEAR and QUARTER headers
-        'font_color': '#000000',
-        'border': 1,
-        'align': 'center',
-        'valign': 'vcenter'
-    })
-    cell_format = workbook.add_format({
-        'border': 1,
-        'align': 'center',
-        'valign': 'vcenter',
-        'text_wrap': True
-    })
+    form = BulkEquipmentForm(request.POST, request.FILES)
+    if not form.is_valid():
+        for error in form.non_field_errors():
+            messages.error(request, error)
+        for field, field_errors in form.errors.items():
+            if field != '__all__':
+                messages.error(request, f'{field}: {" ".join(field_errors)}')
+    else:
+        changes = form.changes()
+        ids = [pk for pk in request.POST.getlist('ids') if pk.isdigit()]
+        sns = form.serial_numbers()
+        with transaction.atomic():
+            if request.POST.get('scope') == 'filter':
+                updated = bulk.update_queryset(filtered_equipments(request.POST), changes)
+            elif request.POST.get('scope') == 'sns':
+                updated, missing = bulk.update_sns(sns, changes)
+                if missing:
+                    messages.warning(request, f'{len(missing)} SN(s) not found: {", ".join(missing[:20])}')
+            else:
+                updated = bulk.update_ids(ids, changes)
+        messages.success(request, f'{updated} equipment updated.')
+
+    query = urlencode({key: request.POST[key] for key in ('record', 'sn') if request.POST.get(key)})
+    return redirect(reverse('equipment_list') + (f'?{query}' if query else ''))
+
+SEARCH_LIMIT = 20
+
+
+async def equipment_search(request):
+    """Type-ahead lookup of equipment by SN, SN Rempl or Ref."""
+    query = request.GET.get('q', '').strip()
+    results = []
+    if query:
+        matches = await sync_to_async(search_equipment)(query, limit=SEARCH_LIMIT)
+        matches = matches.order_by('sn')[:SEARCH_LIMIT]
+        results = [row async for row in matches.values('id', 'name', 'sn', 'sn_rempl', 'ref', 'record_id', 'record__name')]
+    return JsonResponse({'query': query, 'results': results})
+
+@cache_control(private=True, max_age=60)
+async def record_search(request):
+    """Type-ahead lookup of records by the start of their name (case-sensitive), for the record pickers."""
+    query = request.GET.get('q', '').strip()
+    results = []
+    if query:
+        # A range rather than LIKE, so that it is served by the name index on every database
+        records = Record.objects.filter(name__gte=query, name__lt=query + '\U0010ffff').order_by('name')
+        results = [row async for row in records.values('id', 'name')[:SEARCH_LIMIT]]
+    return JsonResponse({'query': query, 'results': results})
+
+async def _export_response(request, equipments, filename, with_record=False):
+    if request.GET.get('format') == 'csv':
+        # Only stream from an async iterator when served by ASGI, WSGI would buffer it
+        return csv_response(equipments, f'{filename}.csv', with_record, asynchronous=isinstance(request, ASGIRequest))
+    # xlsxwriter is synchronous, the workbook is written to its temporary file in a thread
+    return await sync_to_async(xlsx_response)(equipments, f'{filename}.xlsx', with_record)
+
+async def download_record(request, record_id):
+    record = await aget_object_or_404(Record, pk=record_id)
+    equipments = Equipment.objects.filter(record=record)
+    return await _export_response(request, equipments, f'{record.name}_data')
 
-    # Add column headers with formatting
-    headers = ['Name', 'Ref', 'SN', 'SN Rempl', 'Reception Date', 'Delivery Status', 'Delivery Date', 'BL', 'Year', 'Quarter']
-    for col, header in enumerate(headers):
-        if header in ['Year', 'Quarter']:
-            worksheet.write(0, col, header, yellow_header_format)
-        else:
-            worksheet.write(0, col, header, header_format)
-
-    # Add data rows with formatting
-    for row_num, equipment in enumerate(equipments, start=1):
-        worksheet.write(row_num, 0, equipment.name, cell_format)
-        worksheet.write(row_num, 1, equipment.ref or '', cell_format)
-        worksheet.write(row_num, 2, equipment.sn or '', cell_format)
-        worksheet.write(row_num, 3, equipment.sn_rempl or '', cell_format)
-        worksheet.write(row_num, 4, equipment.reception_date.strftime('%Y-%m-%d') if equipment.reception_date else '', cell_format)
-        worksheet.write(row_num, 5, equipment.delivery_status or '', cell_format)
-        worksheet.write(row_num, 6, equipment.delivery_date.strftime('%Y-%m-%d') if equipment.delivery_date else '', cell_format)
-        worksheet.write(row_num, 7, equipment.bl or '', cell_format)
-        worksheet.write(row_num, 8, equipment.year or '', cell_format)  # Apply cell_format to YEAR
-        worksheet.write(row_num, 9, equipment.quarter or '', cell_format)  # Apply cell_format to QUARTER
-
-    # Set column width for better readability
-    worksheet.set_column('A:J', 20)
-
-    workbook.close()
-    output.seek(0)
-
-    response = HttpResponse(output, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename="{record.name}_data.xlsx"'
-    return response
+async def export_records(request):
+    """Export the equipment of every record matching the filters as one file."""
+    records = Record.objects.all()
+    filter_quarter = request.GET.get('quarter')
+    filter_year = request.GET.get('year')
+    filter_record_ids = [pk for pk in request.GET.getlist('record') if pk.isdigit()]
+    if filter_quarter:
+        records = records.filter(quarter=filter_quarter)
+    if filter_year and filter_year.isdigit():
+        records = records.filter(reception_date__year=filter_year)
+    if filter_record_ids:
+        records = records.filter(pk__in=filter_record_ids)
+
+    equipments = Equipment.objects.filter(record__in=records)
+    filename = '_'.join(['records'] + [part for part in (filter_year, filter_quarter) if part])
+    return await _export_response(request, equipments, filename, with_record=True)
 
 def delete_record(request, record_id):
     record = get_object_or_404(Record, pk=record_id)
@@ -224,35 +350,9 @@ def edit_equipment(request, pk):
     return render(request, 'inventory/edit_equipment.html', {'form': form})
 
 def update_equipment(request, id):
-    equipment = get_object_or_404(Equipment, id=id)
-    
-    if request.method == 'POST':
-        # Update fields manually
-        equipment.name = request.POST.get('name')
-        equipment.record_id = request.POST.get('record')
-        equipment.ref = request.POST.get('ref')
-        equipment.sn = request.POST.get('sn')
-        equipment.sn_rempl = request.POST.get('sn_rempl')
-        
-        # Handle optional dates
-        reception_date = request.POST.get('reception_date')
-        delivery_date = request.POST.get('delivery_date')
-        equipment.reception_date = reception_date if reception_date else None
-        equipment.delivery_date = delivery_date if delivery_date else None
-        
-        equipment.delivery_status = request.POST.get('delivery_status')
-        equipment.bl = request.POST.get('bl')
-        equipment.year = request.POST.get('year')
-        equipment.quarter = request.POST.get('quarter')
-        equipment.save()
-        
-        return redirect('equipment_list')
-    
-    records = Record.objects.all()
-    return render(request, 'inventory/edit_equipment.html', {
-        'equipment': equipment,
-        'records': records
-    })
+    # Same fields as edit_equipment, validated by EquipmentForm so that a
+    # taken SN is reported on the form rather than failing on the unique index
+    return edit_equipment(request, pk=id)
 
 def edit_record(request, pk):
     record = get_object_or_404(Record, pk=pk)
@@ -260,9 +360,72 @@ def edit_record(request, pk):
         form = RecordForm(request.POST, instance=record)
         if form.is_valid():
             record = form.save()
-            # Update all associated equipment with the new reception date
-            Equipment.objects.filter(record=record).update(reception_date=record.reception_date)
+            # Update all associated equipment with the new reception date (and year/quarter)
+            bulk.update_queryset(Equipment.objects.filter(record=record), {'reception_date': record.reception_date})
             return redirect('record_list')
     else:
         form = RecordForm(instance=record)
-    return render(request, 'inventory/edit_record.html', {'form': form})
\ No newline at end of file
+    return render(request, 'inventory/edit_record.html', {'form': form})
+
+HISTORY_LIMIT = 500
+
+
+def equipment_history(request):
+    """Field-level changes of the equipment that has or had the given SN."""
+    sn = request.GET.get('sn', '').strip()
+    entries = list(audit.history(sn, limit=HISTORY_LIMIT)) if sn else []
+    return render(request, 'inventory/equipment_history.html', {
+        'sn': sn, 'entries': entries, 'limit': HISTORY_LIMIT,
+    })
+
+ARCHIVE_PAGE_SIZE = 25
+
+
+async def archive_list(request):
+    """Read-only browsing of the archived records, searched by name or SN prefix."""
+    query = request.GET.get('q', '').strip()
+    records = archive.search(query) if query else ArchivedRecord.objects.all()
+    ordering = [('id', True)]
+    try:
+        page = await akeyset_paginate(records, ordering, request.GET.get('cursor'), ARCHIVE_PAGE_SIZE)
+    except InvalidCursor:
+        page = await akeyset_paginate(records, ordering, None, ARCHIVE_PAGE_SIZE)
+    return render(request, 'inventory/archive_list.html', {'records': page, 'query': query})
+
+async def archived_record(request, pk):
+    record = await aget_object_or_404(ArchivedRecord, pk=pk)
+    equipment = [item async for item in record.equipment.order_by('order_index', 'id')]
+    return render(request, 'inventory/archived_record.html', {'record': record, 'equipment': equipment})
+
+def restore_record(request, pk):
+    """Move an archived record and its equipment back to the live tables."""
+    record = get_object_or_404(ArchivedRecord, pk=pk)
+    if request.method != 'POST':
+        return redirect('archived_record', pk=pk)
+    try:
+        archive.restore(record.pk)
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect('archived_record', pk=pk)
+    messages.success(request, f'Record {record.name} was restored.')
+    return redirect(f"{reverse('equipment_list')}?record={record.pk}")
+
+def analytics_view(request):
+    """Equipment received, delivered and penalized per year and quarter."""
+    return render(request, 'inventory/analytics.html', {'analytics': analytics.get_analytics()})
+
+def analytics_data(request):
+    return JsonResponse(analytics.get_analytics())
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, see inventory.metrics."""
+    if not metrics.enabled():
+        raise Http404
+    lines = metrics.registry.render()
+    # Imports run in the process_imports workers, their throughput is read from the last finished job.
+    job = ImportJob.objects.filter(status='Done').order_by('-finished_at').first()
+    if job:
+        lines.append('# HELP inventory_import_rows_per_second Rows/sec of the last finished import.')
+        lines.append('# TYPE inventory_import_rows_per_second gauge')
+        lines.append(f'inventory_import_rows_per_second {job.throughput}')
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')